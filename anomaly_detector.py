@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+📡 成交量與波動異常偵測
+📊 每個交易對、每個時段（預設為一天中的小時）各自以串流方式維護平均數與變異數
+🧮 暖機期間等同 Welford 累計統計，之後轉為 EWMA，每根 K 線 O(1) 時間、固定記憶體
+🚨 成交額、報酬與振幅的 z 分數超過門檻時回報異常，可同時監看數百個交易對
+"""
+
+import math
+import threading
+from collections import namedtuple
+
+# 偵測到的異常：數值與 z 分數都是轉換後的尺度（對數成交額、對數報酬、對數振幅再取對數）
+Anomaly = namedtuple('Anomaly', ['symbol', 'detector', 'value', 'z', 'mean', 'std', 'open_time'])
+
+# 偵測器：名稱 → (說明, 是否雙向)
+DETECTORS = {
+    'volume': ("成交額", False),
+    'return': ("報酬", True),
+    'range': ("振幅", False),
+}
+
+DEFAULT_THRESHOLDS = {'volume': 4.0, 'return': 5.0, 'range': 3.5}
+
+HOUR_MS = 60 * 60 * 1000
+
+
+class StreamingStats:
+    """EWMA 平均數與變異數；樣本數少於 1/alpha 時以 1/n 為權重，等同 Welford 的累計統計"""
+    
+    __slots__ = ('count', 'mean', 'var')
+    
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.var = 0.0
+    
+    def update(self, value, alpha):
+        self.count += 1
+        weight = max(alpha, 1.0 / self.count)
+        diff = value - self.mean
+        increment = weight * diff
+        self.mean += increment
+        self.var = (1 - weight) * (self.var + diff * increment)
+    
+    def score(self, value):
+        """以更新前的統計計算 z 分數，標準差為 0 時回傳 0"""
+        std = math.sqrt(self.var)
+        return (value - self.mean) / std if std > 0 else 0.0
+
+
+class AnomalyDetector:
+    """1m K 線的異常偵測：on_bar 可直接訂閱 TradeAggregator，回傳這根 K 線的異常清單"""
+    
+    def __init__(self, thresholds=None, halflife=1440, min_samples=30, hourly=True, clip=True):
+        self.thresholds = dict(DEFAULT_THRESHOLDS if thresholds is None else thresholds)
+        self.alpha = 1 - 0.5 ** (1.0 / halflife)  # 以樣本數表示的半衰期
+        self.min_samples = min_samples
+        self.hourly = hourly  # 依一天中的小時分開統計，避免把每天固定的交易時段當成異常
+        self.clip = clip      # 以截斷後的數值更新統計，單一極端值不會把基準拉走
+        self.stats = {}       # (交易對, 偵測器, 時段) → StreamingStats
+        self.last_close = {}  # 交易對 → 上一根 K 線收盤價
+        self.first_live = {}  # 交易對 → 第一根即時 K 線的開盤時間，播種只使用更早的 K 線
+        self.last_seeded = {} # 交易對 → 已播種的最後一根 K 線開盤時間，重新播種不會重複計入
+        self.lock = threading.Lock()
+        self.bars = 0
+        self.hits = 0
+    
+    def features(self, symbol, bar):
+        """由 K 線計算各偵測器的數值（呼叫時需持有鎖）"""
+        values = {}
+        if 'volume' in self.thresholds:
+            values['volume'] = math.log1p(bar.volume * bar.close)
+        if 'range' in self.thresholds and bar.high > bar.low > 0:
+            # 振幅本身右偏，純雜訊也會頻繁超過門檻；取對數後接近對稱，振幅為 0 的 K 線不計入
+            values['range'] = math.log(math.log(bar.high / bar.low))
+        previous = self.last_close.get(symbol)
+        if 'return' in self.thresholds and previous:
+            values['return'] = math.log(bar.close / previous)
+        self.last_close[symbol] = bar.close
+        return values
+    
+    def observe(self, symbol, bar, detect=True):
+        """更新統計，detect 為 True 時回傳超過門檻的異常（呼叫時需持有鎖）"""
+        bucket = int(bar.open_time // HOUR_MS) % 24 if self.hourly else 0
+        anomalies = []
+        for detector, value in self.features(symbol, bar).items():
+            key = (symbol, detector, bucket)
+            stats = self.stats.get(key)
+            if stats is None:
+                stats = self.stats[key] = StreamingStats()
+            threshold = self.thresholds[detector]
+            z = stats.score(value)
+            std = math.sqrt(stats.var)
+            if detect and stats.count >= self.min_samples:
+                two_sided = DETECTORS[detector][1]
+                if (abs(z) if two_sided else z) >= threshold:
+                    anomalies.append(Anomaly(symbol, detector, value, z, stats.mean, std, bar.open_time))
+            if self.clip and stats.count >= self.min_samples and std > 0:
+                value = min(max(value, stats.mean - threshold * std), stats.mean + threshold * std)
+            stats.update(value, self.alpha)
+        return anomalies
+    
+    def seed(self, symbol, bars):
+        """以歷史 1m K 線暖機，不回報異常；已收到的即時 K 線與先前播種過的 K 線不會重複計入"""
+        with self.lock:
+            first_live = self.first_live.get(symbol)
+            last_seeded = self.last_seeded.get(symbol)
+            last_close = self.last_close.pop(symbol, None)
+            for bar in bars:
+                if first_live is not None and bar.open_time >= first_live:
+                    break
+                if last_seeded is not None and bar.open_time <= last_seeded:
+                    continue
+                self.observe(symbol, bar, detect=False)
+                self.last_seeded[symbol] = bar.open_time
+            if last_close is not None:
+                self.last_close[symbol] = last_close
+    
+    def on_bar(self, symbol, resolution, bar):
+        """處理一根完成的 1m K 線"""
+        with self.lock:
+            self.first_live.setdefault(symbol, bar.open_time)
+            anomalies = self.observe(symbol, bar)
+            self.bars += 1
+            self.hits += len(anomalies)
+        return anomalies
+    
+    def get_stats(self):
+        """回傳統計狀態數量與累計處理筆數"""
+        return {
+            'symbols': len(self.last_close),
+            'states': len(self.stats),
+            'bars': self.bars,
+            'hits': self.hits,
+        }
+
+
+def describe(anomaly):
+    """異常通知的標題與內容"""
+    name, _ = DETECTORS[anomaly.detector]
+    if anomaly.detector == 'volume':
+        ratio = math.expm1(anomaly.value) / max(math.expm1(anomaly.mean), 1e-12)
+        detail = f"1 分鐘成交額 ${math.expm1(anomaly.value):,.0f}，約為同時段平均的 {ratio:.1f} 倍"
+    elif anomaly.detector == 'return':
+        detail = f"1 分鐘報酬 {math.expm1(anomaly.value) * 100:+.2f}%"
+    else:
+        detail = f"1 分鐘振幅 {math.expm1(math.exp(anomaly.value)) * 100:.2f}%"
+    return (
+        f"📡 {anomaly.symbol} {name}異常",
+        f"{detail}（z = {anomaly.z:+.1f}）",
+    )
+
+
+def simulate_bars(symbols, minutes, spike_rate):
+    """隨機漫步的 1m K 線，spike_rate 為成交額放大 20 倍的機率"""
+    import random
+    from bar_aggregator import Bar
+    
+    start_ms = 1_700_000_000_000 - 1_700_000_000_000 % 60000
+    names = [f"COIN{i}USDT" for i in range(symbols)]
+    prices = {name: random.uniform(1, 1000) for name in names}
+    bars = []
+    for minute in range(minutes):
+        for name in names:
+            open_price = prices[name]
+            close = open_price * math.exp(random.gauss(0, 0.001))
+            prices[name] = close
+            high = max(open_price, close) * (1 + random.random() * 0.0005)
+            low = min(open_price, close) * (1 - random.random() * 0.0005)
+            volume = random.lognormvariate(3, 0.5) * (20 if random.random() < spike_rate else 1)
+            bars.append((name, Bar(start_ms + minute * 60000, open_price, high, low, close, volume, 1)))
+    return bars
+
+
+def benchmark(symbols=500, minutes=1440, noise_symbols=200):
+    """模擬數百個交易對的 1m K 線，量測每根 K 線的處理時間，並以純雜訊檢查各偵測器的誤報次數"""
+    import time
+    
+    detector = AnomalyDetector()
+    bars = simulate_bars(symbols, minutes, spike_rate=0.0005)
+    start = time.perf_counter()
+    for name, bar in bars:
+        detector.on_bar(name, '1m', bar)
+    elapsed = time.perf_counter() - start
+    stats = detector.get_stats()
+    print(
+        f"{symbols} 個交易對 × {minutes} 根 K 線：{len(bars) / elapsed:,.0f} 根/秒"
+        f"（每根 {elapsed / len(bars) * 1e6:.1f} µs）| 狀態 {stats['states']:,} 個 | 異常 {stats['hits']} 次"
+    )
+    
+    # 沒有注入異常的隨機漫步，任何回報都是誤報
+    detector = AnomalyDetector()
+    bars = simulate_bars(noise_symbols, minutes, spike_rate=0)
+    false_alerts = dict.fromkeys(DETECTORS, 0)
+    for name, bar in bars:
+        for anomaly in detector.on_bar(name, '1m', bar):
+            false_alerts[anomaly.detector] += 1
+    print(
+        f"純雜訊 {len(bars):,} 根 K 線的誤報："
+        + "、".join(f"{DETECTORS[name][0]} {count} 次" for name, count in false_alerts.items())
+    )
+
+
+if __name__ == "__main__":
+    benchmark()
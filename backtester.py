@@ -0,0 +1,433 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+🧪 警報與止盈止損回測
+📼 以歷史 K 線（或逐筆成交）重播與 check_price_alerts 相同的警報規則、set_stop_loss_take_profit 相同的止盈止損
+🧮 以 NumPy 處理整段價格陣列，只在稀疏的閾值穿越點上推進警報狀態，不逐根 K 線跑 Python 迴圈
+🔍 參數網格掃描：高 / 低價閾值、冷卻時間、止損 / 止盈百分比
+
+用法：python3 backtester.py BTCUSDT --days 365 --low 60000,65000 --cooldown 60,300 --sl 1,2,5 --tp 2,5,10
+"""
+
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+
+try:
+    import numpy as np
+    from numpy.lib.stride_tricks import sliding_window_view
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+INTERVAL_SECONDS = {'1m': 60, '5m': 300, '15m': 900, '1h': 3600}
+
+
+# ==================== 歷史資料 ====================
+
+class PriceSeries:
+    """時間（秒）與高、低、收盤價陣列；逐筆成交的高低收都等於成交價"""
+    
+    def __init__(self, times, high, low, close):
+        order = np.argsort(times, kind='stable')
+        self.times = np.asarray(times, dtype=np.float64)[order]
+        self.high = np.asarray(high, dtype=np.float64)[order]
+        self.low = np.asarray(low, dtype=np.float64)[order]
+        self.close = np.asarray(close, dtype=np.float64)[order]
+    
+    def __len__(self):
+        return len(self.times)
+    
+    def bar_seconds(self):
+        """資料的時間間隔（中位數）"""
+        return float(np.median(np.diff(self.times))) if len(self.times) > 1 else 60.0
+
+
+def to_seconds(timestamps):
+    """幣安的時間戳記可能是毫秒或微秒（data.vision 2025 年之後的檔案）"""
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+    if len(timestamps) and timestamps[0] > 1e14:
+        return timestamps / 1e6
+    return timestamps / 1e3
+
+
+def read_csv_columns(paths, columns):
+    """讀取多個沒有或有標題列的 CSV，回傳指定欄位的陣列"""
+    parts = []
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            skip = 0 if f.readline()[:1].isdigit() else 1
+        parts.append(np.loadtxt(path, delimiter=',', usecols=columns, skiprows=skip, ndmin=2))
+    return np.concatenate(parts)
+
+
+def load_klines_csv(paths):
+    """讀取 data.vision 格式的 K 線 CSV（開盤時間, 開, 高, 低, 收, ...）"""
+    data = read_csv_columns(paths, (0, 2, 3, 4))
+    return PriceSeries(to_seconds(data[:, 0]), data[:, 1], data[:, 2], data[:, 3])
+
+
+def load_trades_csv(paths):
+    """讀取 data.vision 格式的 aggTrades CSV（編號, 價格, 數量, 首筆, 末筆, 時間, ...）"""
+    data = read_csv_columns(paths, (1, 5))
+    return PriceSeries(to_seconds(data[:, 1]), data[:, 0], data[:, 0], data[:, 0])
+
+
+def fetch_klines(pool, symbol, interval, start_ms, end_ms):
+    """以 /api/v3/klines 分頁抓取 K 線（每次 1000 根）"""
+    rows = []
+    cursor = start_ms
+    while cursor < end_ms:
+        batch = pool.get_json('/api/v3/klines', {
+            'symbol': symbol, 'interval': interval,
+            'startTime': cursor, 'endTime': end_ms, 'limit': 1000,
+        })
+        if not batch:
+            break
+        rows.extend(row[:5] for row in batch)
+        cursor = batch[-1][0] + 1
+        print(f"\r📥 已下載 {len(rows):,} 根 K 線", end='', flush=True)
+    print()
+    data = np.array(rows, dtype=np.float64)
+    return PriceSeries(data[:, 0] / 1e3, data[:, 2], data[:, 3], data[:, 4])
+
+
+def load_history(symbol, interval, days, config, cache_dir):
+    """讀取快取的 K 線，沒有時從幣安下載並寫入快取"""
+    end_ms = int(time.time() // 86400 * 86400 * 1000)  # 對齊到 UTC 日界，同一天重跑可使用快取
+    start_ms = end_ms - days * 86400 * 1000
+    path = os.path.join(cache_dir, f"{symbol}_{interval}_{start_ms}_{end_ms}.npz")
+    if os.path.exists(path):
+        data = np.load(path)
+        return PriceSeries(data['times'], data['high'], data['low'], data['close'])
+    
+    from binance_endpoints import BinanceEndpointPool
+    pool = BinanceEndpointPool.from_config(config.get('network', {}))
+    try:
+        series = fetch_klines(pool, symbol, interval, start_ms, end_ms)
+    finally:
+        pool.close()
+    os.makedirs(cache_dir, exist_ok=True)
+    np.savez(path, times=series.times, high=series.high, low=series.low, close=series.close)
+    return series
+
+
+# ==================== 警報重播 ====================
+
+def check_points(series, check_interval):
+    """監控器每 check_interval 秒檢查一次：取每個區間最後一根的位置"""
+    if check_interval <= series.bar_seconds():
+        return np.arange(len(series))
+    buckets = np.floor(series.times / check_interval)
+    return np.flatnonzero(np.diff(buckets, append=np.inf))
+
+
+def transitions(condition):
+    """條件改變的位置（包含第一個位置）"""
+    changed = np.flatnonzero(condition[1:] != condition[:-1]) + 1
+    return np.concatenate(([0], changed)) if len(condition) else changed
+
+
+def replay_alerts(times, high_cond, low_cond, cooldown):
+    """
+    以與 check_price_alerts 相同的狀態規則重播警報，回傳 [(位置, 方向)]，方向 1 為高價、-1 為低價
+    
+    - 價格在閾值外且該方向尚未觸發時發出警報，回到閾值內才重置
+    - 冷卻時間由高低價共用，冷卻中整個檢查都會略過（包含重置）
+    條件與冷卻狀態只會在條件改變或冷卻結束時改變，因此只需要在這些位置推進狀態
+    """
+    events = np.union1d(
+        transitions(high_cond) if high_cond is not None else [],
+        transitions(low_cond) if low_cond is not None else [],
+    ).astype(np.int64)
+    alerts = []
+    triggered_high = triggered_low = False
+    last_alert = -np.inf
+    expiry = None
+    position = 0
+    count = len(times)
+    while True:
+        upcoming = events[position] if position < len(events) else None
+        if expiry is not None and (upcoming is None or expiry <= upcoming):
+            index = expiry
+            expiry = None
+            if upcoming == index:
+                position += 1
+        elif upcoming is not None:
+            index = upcoming
+            position += 1
+        else:
+            break
+        
+        now = times[index]
+        if now - last_alert < cooldown:
+            continue
+        fired = False
+        if high_cond is not None:
+            if high_cond[index]:
+                if not triggered_high:
+                    alerts.append((index, 1))
+                    triggered_high = fired = True
+            else:
+                triggered_high = False
+        if low_cond is not None:
+            if low_cond[index]:
+                if not triggered_low:
+                    alerts.append((index, -1))
+                    triggered_low = fired = True
+            else:
+                triggered_low = False
+        if fired:
+            last_alert = now
+            expiry = int(np.searchsorted(times, now + cooldown))
+            if expiry >= count:
+                expiry = None
+    return alerts
+
+
+def false_positives(series, bars, directions, thresholds, horizon, confirm_pct):
+    """警報後 horizon 根 K 線內，價格沒有再往警報方向多走 confirm_pct % 的視為誤報"""
+    if len(bars) == 0:
+        return np.zeros(0, dtype=bool)
+    padded_high = np.concatenate((series.high, np.full(horizon, np.nan)))
+    padded_low = np.concatenate((series.low, np.full(horizon, np.nan)))
+    starts = bars + 1
+    reach_high = np.nanmax(sliding_window_view(padded_high, horizon)[starts], axis=1, initial=-np.inf)
+    reach_low = np.nanmin(sliding_window_view(padded_low, horizon)[starts], axis=1, initial=np.inf)
+    confirm = confirm_pct / 100
+    followed = np.where(
+        directions > 0,
+        reach_high >= thresholds * (1 + confirm),
+        reach_low <= thresholds * (1 - confirm),
+    )
+    return ~followed
+
+
+# ==================== 止盈止損 ====================
+
+def evaluate_exits(series, bars, entry_prices, side, sl_list, tp_list, max_hold, fee_pct, chunk=256):
+    """
+    依 set_stop_loss_take_profit 的百分比計算每筆進場的出場結果，一次評估整個止損 × 止盈網格
+    
+    對每筆進場取之後 max_hold 根 K 線，不利 / 有利方向的累積極值都是單調遞增，
+    因此「第一次碰到 x%」的位置就是小於 x% 的元素個數，不需要逐根判斷。
+    同一根 K 線同時碰到止損與止盈時保守地視為止損。
+    回傳 (止盈次數, 止損次數, 逾時次數, 報酬率總和 %)，形狀皆為 (止損數, 止盈數)
+    """
+    sl = np.asarray(sl_list, dtype=np.float64) / 100
+    tp = np.asarray(tp_list, dtype=np.float64) / 100
+    shape = (len(sl), len(tp))
+    tp_hits = np.zeros(shape, dtype=np.int64)
+    sl_hits = np.zeros(shape, dtype=np.int64)
+    timeouts = np.zeros(shape, dtype=np.int64)
+    total_return = np.zeros(shape)
+    if len(bars) == 0:
+        return tp_hits, sl_hits, timeouts, total_return
+    
+    padding = np.full(max_hold, np.nan)
+    high_windows = sliding_window_view(np.concatenate((series.high, padding)), max_hold)
+    low_windows = sliding_window_view(np.concatenate((series.low, padding)), max_hold)
+    closes = series.close
+    fee = 2 * fee_pct / 100
+    
+    for begin in range(0, len(bars), chunk):
+        starts = bars[begin:begin + chunk] + 1
+        entry = entry_prices[begin:begin + chunk, None]
+        run_high = np.fmax.accumulate(high_windows[starts], axis=1)
+        run_low = np.fmin.accumulate(low_windows[starts], axis=1)
+        if side == 'long':
+            adverse, favorable = 1 - run_low / entry, run_high / entry - 1
+        else:
+            adverse, favorable = run_high / entry - 1, 1 - run_low / entry
+        valid = np.count_nonzero(~np.isnan(high_windows[starts]), axis=1)
+        
+        # 第一次碰到各止損 / 止盈的位置（沒碰到時等於有效長度）
+        sl_at = np.minimum((adverse[None] < sl[:, None, None]).sum(axis=2), valid)
+        tp_at = np.minimum((favorable[None] < tp[:, None, None]).sum(axis=2), valid)
+        sl_at, tp_at = sl_at[:, None, :], tp_at[None, :, :]
+        stopped = (sl_at < valid) & (sl_at <= tp_at)
+        profited = (tp_at < valid) & ~stopped
+        expired = ~stopped & ~profited
+        
+        last = np.minimum(starts + valid - 1, len(closes) - 1)
+        hold_return = closes[last] / entry[:, 0] - 1
+        if side == 'short':
+            hold_return = -hold_return
+        returns = np.where(stopped, -sl[:, None, None], np.where(profited, tp[None, :, None], hold_return))
+        
+        tp_hits += profited.sum(axis=2)
+        sl_hits += stopped.sum(axis=2)
+        timeouts += expired.sum(axis=2)
+        total_return += (returns - fee).sum(axis=2) * 100
+    return tp_hits, sl_hits, timeouts, total_return
+
+
+# ==================== 參數掃描 ====================
+
+def interval_extremes(series, points):
+    """每個檢查區間（上一個檢查點之後到這個檢查點）的最高價與最低價"""
+    starts = np.concatenate(([0], points[:-1] + 1)) if len(points) else points
+    return np.maximum.reduceat(series.high, starts), np.minimum.reduceat(series.low, starts)
+
+
+def sweep(series, highs, lows, cooldowns, sl_list, tp_list, check_interval=0, intrabar=False, close_only=False,
+          entry='low', side='long', horizon=15, confirm_pct=0.5, max_hold=1440, fee_pct=0.1):
+    """對所有參數組合回測，回傳結果列清單"""
+    points = check_points(series, check_interval)
+    times = series.times[points]
+    # 串流逐根 K 線以高低點判斷；輪詢與監控器相同，一併判斷上次檢查以來的最高 / 最低價
+    if intrabar:
+        high_prices, low_prices = series.high[points], series.low[points]
+    elif close_only:
+        high_prices = low_prices = series.close[points]
+    else:
+        high_prices, low_prices = interval_extremes(series, points)
+    high_conditions = {value: high_prices >= value for value in highs if value}
+    low_conditions = {value: low_prices <= value for value in lows if value}
+    
+    results = []
+    for high, low, cooldown in itertools.product(highs, lows, cooldowns):
+        alerts = replay_alerts(times, high_conditions.get(high), low_conditions.get(low), cooldown)
+        positions = np.array([index for index, _ in alerts], dtype=np.int64)
+        directions = np.array([direction for _, direction in alerts], dtype=np.int64)
+        bars = points[positions]
+        thresholds = np.where(directions > 0, high or 0.0, low or 0.0).astype(np.float64)
+        misses = false_positives(series, bars, directions, thresholds, horizon, confirm_pct)
+        
+        wanted = {'low': directions < 0, 'high': directions > 0, 'both': directions != 0}[entry]
+        # 輪詢在收盤價進場；串流在價格穿越閾值時進場
+        entry_prices = thresholds[wanted] if intrabar else series.close[bars[wanted]]
+        exits = evaluate_exits(series, bars[wanted], entry_prices, side, sl_list, tp_list, max_hold, fee_pct)
+        
+        for (i, sl), (j, tp) in itertools.product(enumerate(sl_list), enumerate(tp_list)):
+            trades = int(wanted.sum())
+            tp_hits, sl_hits, timeouts, total_return = (values[i, j] for values in exits)
+            results.append({
+                'high': high, 'low': low, 'cooldown': cooldown, 'sl': sl, 'tp': tp,
+                'alerts_high': int((directions > 0).sum()), 'alerts_low': int((directions < 0).sum()),
+                'false_positive_rate': float(misses.mean()) if len(misses) else 0.0,
+                'trades': trades, 'tp_hits': int(tp_hits), 'sl_hits': int(sl_hits), 'timeouts': int(timeouts),
+                'win_rate': tp_hits / trades if trades else 0.0,
+                'avg_return': total_return / trades if trades else 0.0,
+                'total_return': float(total_return),
+            })
+    return results
+
+
+def parse_list(text, cast=float):
+    """解析以逗號分隔的參數清單，空白或 none 表示不設定"""
+    if text is None:
+        return None
+    return [None if item.strip().lower() in ('', 'none') else cast(item) for item in text.split(',')]
+
+
+def print_results(results, sort_key, top):
+    """列出排序後的前幾組結果"""
+    results = sorted(results, key=lambda row: row[sort_key], reverse=sort_key != 'false_positive_rate')
+    print(
+        f"{'高價':>10} {'低價':>10} {'冷卻':>6} {'SL%':>5} {'TP%':>5} │ {'高/低警報':>9} {'誤報':>6} │"
+        f" {'交易':>5} {'止盈':>5} {'止損':>5} {'逾時':>5} {'勝率':>6} {'平均%':>7} {'總計%':>8}"
+    )
+    def threshold(value):
+        return f"{value:,.2f}" if value else '-'
+    
+    for row in results[:top]:
+        print(
+            f"{threshold(row['high']):>10} {threshold(row['low']):>10} {row['cooldown']:>6} {row['sl']:>5} {row['tp']:>5} │"
+            f" {row['alerts_high']:>4}/{row['alerts_low']:<4} {row['false_positive_rate'] * 100:>5.1f}% │"
+            f" {row['trades']:>5} {row['tp_hits']:>5} {row['sl_hits']:>5} {row['timeouts']:>5}"
+            f" {row['win_rate'] * 100:>5.1f}% {row['avg_return']:>7.2f} {row['total_return']:>8.1f}"
+        )
+
+
+def main():
+    """回測命令列"""
+    parser = argparse.ArgumentParser(description="警報與止盈止損回測")
+    parser.add_argument('symbol', help="交易對，例如 BTCUSDT")
+    parser.add_argument('--config', default='config.json')
+    parser.add_argument('--days', type=int, default=365, help="下載最近幾天的 K 線（預設 365）")
+    parser.add_argument('--interval', default='1m', choices=sorted(INTERVAL_SECONDS))
+    parser.add_argument('--csv', nargs='+', help="改用 data.vision 格式的 K 線 CSV")
+    parser.add_argument('--trades', nargs='+', help="改用 data.vision 格式的 aggTrades CSV（逐筆重播）")
+    parser.add_argument('--cache-dir', default='.backtest_cache')
+    parser.add_argument('--high', help="高價閾值清單（預設為 config.json 的設定）")
+    parser.add_argument('--low', help="低價閾值清單（預設為 config.json 的設定）")
+    parser.add_argument('--cooldown', help="冷卻秒數清單（預設為 alert_cooldown）")
+    parser.add_argument('--sl', help="止損百分比清單（預設為 default_stop_loss_percentage）")
+    parser.add_argument('--tp', help="止盈百分比清單（預設為 default_take_profit_percentage）")
+    parser.add_argument('--check-interval', type=float, help="檢查間隔秒數（預設為 update_interval）")
+    parser.add_argument('--intrabar', action='store_true', help="逐根 K 線以高低點判斷並在閾值進場（串流模式）")
+    parser.add_argument('--close-only', action='store_true', help="輪詢時只看取樣時的收盤價，不計入期間高低點")
+    parser.add_argument('--entry', default='low', choices=('low', 'high', 'both'), help="哪些警報視為進場")
+    parser.add_argument('--side', default='long', choices=('long', 'short'))
+    parser.add_argument('--horizon', type=float, default=15, help="判斷誤報的觀察分鐘數（預設 15）")
+    parser.add_argument('--confirm', type=float, default=0.5, help="警報後需再往同方向走幾 %% 才不算誤報")
+    parser.add_argument('--max-hold', type=float, default=24, help="最長持有小時數，逾時以收盤價出場（預設 24）")
+    parser.add_argument('--fee', type=float, default=0.1, help="單邊手續費 %%（預設 0.1）")
+    parser.add_argument('--sort', default='avg_return',
+                        choices=('avg_return', 'total_return', 'win_rate', 'false_positive_rate', 'trades'))
+    parser.add_argument('--top', type=int, default=20)
+    parser.add_argument('--json', help="將完整結果寫入 JSON 檔案")
+    args = parser.parse_args()
+    
+    if not NUMPY_AVAILABLE:
+        print("❌ 回測需要 NumPy")
+        print("請執行: pip install numpy")
+        return 1
+    
+    try:
+        with open(args.config, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+    except Exception as e:
+        print(f"⚠️ 無法載入配置檔案，全部使用命令列參數: {e}")
+        config = {}
+    thresholds = config.get('alert_thresholds', {}).get(args.symbol, {})
+    trading_settings = config.get('trading_settings', {})
+    
+    highs = parse_list(args.high) or [thresholds.get('high')]
+    lows = parse_list(args.low) or [thresholds.get('low')]
+    cooldowns = parse_list(args.cooldown) or [config.get('alert_cooldown', 300)]
+    sl_list = parse_list(args.sl) or [trading_settings.get('default_stop_loss_percentage', 5)]
+    tp_list = parse_list(args.tp) or [trading_settings.get('default_take_profit_percentage', 10)]
+    check_interval = args.check_interval if args.check_interval is not None else config.get('update_interval', 30)
+    if not any(highs) and not any(lows):
+        print(f"❌ {args.symbol} 沒有設定警報閾值，請以 --high / --low 指定")
+        return 1
+    
+    start = time.perf_counter()
+    if args.trades:
+        series = load_trades_csv(args.trades)
+    elif args.csv:
+        series = load_klines_csv(args.csv)
+    else:
+        series = load_history(args.symbol, args.interval, args.days, config, args.cache_dir)
+    loaded = time.perf_counter() - start
+    span_days = (series.times[-1] - series.times[0]) / 86400 if len(series) else 0
+    print(f"📼 {args.symbol}: {len(series):,} 筆資料，{span_days:.0f} 天（載入 {loaded:.1f} 秒）")
+    
+    bar_seconds = series.bar_seconds()
+    start = time.perf_counter()
+    results = sweep(
+        series, highs, lows, cooldowns, sl_list, tp_list,
+        check_interval=check_interval, intrabar=args.intrabar or bool(args.trades), close_only=args.close_only,
+        entry=args.entry, side=args.side,
+        horizon=max(1, int(args.horizon * 60 / bar_seconds)), confirm_pct=args.confirm,
+        max_hold=max(1, int(args.max_hold * 3600 / bar_seconds)), fee_pct=args.fee,
+    )
+    elapsed = time.perf_counter() - start
+    print(f"🔍 掃描 {len(results):,} 組參數，耗時 {elapsed:.2f} 秒\n")
+    print_results(results, args.sort, args.top)
+    
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 完整結果已寫入 {args.json}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
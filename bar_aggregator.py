@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+🕯️ 成交串流 K 線聚合器
+📡 消費 @aggTrade 串流，同時為每個交易對聚合 1s / 1m / 5m / 1h OHLCV K 線
+💾 完成的 K 線存入固定容量的緊湊環狀緩衝區（array 欄位）
+📢 每根完成的 K 線會發布給訂閱者，並回報處理延遲與佇列積壓
+"""
+
+import threading
+import time
+from array import array
+from collections import deque, namedtuple
+
+# K 線：開盤時間 (毫秒)、開高低收、成交量、成交筆數
+Bar = namedtuple('Bar', ['open_time', 'open', 'high', 'low', 'close', 'volume', 'trades'])
+
+RESOLUTIONS = {
+    '1s': 1000,
+    '1m': 60 * 1000,
+    '5m': 5 * 60 * 1000,
+    '1h': 60 * 60 * 1000,
+}
+
+# 各週期預設保留的 K 線數量
+DEFAULT_CAPACITY = {
+    '1s': 3600,
+    '1m': 1440,
+    '5m': 2016,
+    '1h': 720,
+}
+
+
+class BarBuffer:
+    """固定容量的 K 線環狀緩衝區，每個欄位是一個 array('d')"""
+    
+    FIELDS = Bar._fields
+    
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.columns = {field: array('d', bytes(8 * capacity)) for field in self.FIELDS}
+        self.start = 0
+        self.count = 0
+    
+    def append(self, bar):
+        """加入一根 K 線，滿了就覆蓋最舊的"""
+        index = (self.start + self.count) % self.capacity
+        for field, value in zip(self.FIELDS, bar):
+            self.columns[field][index] = value
+        if self.count < self.capacity:
+            self.count += 1
+        else:
+            self.start = (self.start + 1) % self.capacity
+    
+    def __len__(self):
+        return self.count
+    
+    def __getitem__(self, position):
+        if position < 0:
+            position += self.count
+        if not 0 <= position < self.count:
+            raise IndexError(position)
+        index = (self.start + position) % self.capacity
+        return Bar(*(self.columns[field][index] for field in self.FIELDS))
+    
+    def latest(self, n=None):
+        """由舊到新回傳最近 n 根 K 線"""
+        n = self.count if n is None else min(n, self.count)
+        return [self[i] for i in range(self.count - n, self.count)]
+    
+    def column(self, field):
+        """由舊到新回傳單一欄位的 array 複本"""
+        data = self.columns[field]
+        end = self.start + self.count
+        if end <= self.capacity:
+            return data[self.start:end]
+        return data[self.start:] + data[:end - self.capacity]
+
+
+class TradeAggregator:
+    """將成交聚合成多週期 K 線"""
+    
+    def __init__(self, resolutions=None, capacity=None):
+        self.resolutions = {name: RESOLUTIONS[name] for name in (resolutions or RESOLUTIONS)}
+        self.capacity = dict(DEFAULT_CAPACITY, **(capacity or {}))
+        self.current = {}   # 交易對 → {週期: [開盤時間, 開, 高, 低, 收, 量, 筆數]}
+        self.closed = {}    # 交易對 → {週期: 最後一根已完成 K 線的開盤時間}
+        self.buffers = {}   # 交易對 → {週期: BarBuffer}
+        self.subscribers = []
+        self.lock = threading.Lock()
+    
+    def subscribe(self, callback, resolutions=None, symbols=None):
+        """訂閱完成的 K 線：callback(symbol, resolution, bar)"""
+        resolutions = set(resolutions) if resolutions else None
+        symbols = set(symbols) if symbols else None
+        self.subscribers.append((callback, resolutions, symbols))
+    
+    def get_buffer(self, symbol, resolution):
+        """取得交易對指定週期的 K 線緩衝區"""
+        return self.buffers.get(symbol, {}).get(resolution)
+    
+    def get_current(self, symbol, resolution):
+        """取得交易對指定週期形成中的 K 線，沒有時回傳 None"""
+        bar = self.current.get(symbol, {}).get(resolution)
+        return Bar(*bar) if bar is not None else None
+    
+    def add_trade(self, symbol, price, quantity, trade_time):
+        """加入一筆成交（trade_time 為毫秒），回傳完成的 (週期, K 線) 清單"""
+        bars = self.current.get(symbol)
+        if bars is None:
+            bars = self.current[symbol] = {}
+            self.buffers[symbol] = {
+                name: BarBuffer(self.capacity[name]) for name in self.resolutions
+            }
+        
+        finished = []
+        for name, length in self.resolutions.items():
+            open_time = trade_time - trade_time % length
+            bar = bars.get(name)
+            if bar is None:
+                # 這個時段的 K 線已因閒置而完成時，延遲到達的成交直接忽略
+                if open_time <= self.closed.get(symbol, {}).get(name, -1):
+                    continue
+                bars[name] = [open_time, price, price, price, price, quantity, 1]
+            elif open_time > bar[0]:
+                finished.append((name, Bar(*bar)))
+                bars[name] = [open_time, price, price, price, price, quantity, 1]
+            elif open_time == bar[0]:
+                if price > bar[2]:
+                    bar[2] = price
+                elif price < bar[3]:
+                    bar[3] = price
+                bar[4] = price
+                bar[5] += quantity
+                bar[6] += 1
+            # 比目前 K 線更早的延遲成交直接忽略
+        
+        if finished:
+            self.finish(symbol, finished)
+        return finished
+    
+    def close_idle_bars(self, now_ms, grace_ms=1000):
+        """收盤時間已過 grace_ms 仍沒有新成交的 K 線也要完成並發布"""
+        for symbol, bars in self.current.items():
+            finished = []
+            for name, bar in list(bars.items()):
+                if bar[0] + self.resolutions[name] + grace_ms <= now_ms:
+                    finished.append((name, Bar(*bar)))
+                    self.closed.setdefault(symbol, {})[name] = bar[0]
+                    del bars[name]
+            if finished:
+                self.finish(symbol, finished)
+    
+    def finish(self, symbol, finished):
+        """存入緩衝區並通知訂閱者"""
+        with self.lock:
+            for name, bar in finished:
+                self.buffers[symbol][name].append(bar)
+        for callback, resolutions, symbols in self.subscribers:
+            for name, bar in finished:
+                if resolutions is not None and name not in resolutions:
+                    continue
+                if symbols is not None and symbol not in symbols:
+                    continue
+                try:
+                    callback(symbol, name, bar)
+                except Exception as e:
+                    print(f"⚠️ K 線訂閱者發生錯誤: {e}")
+
+
+class AggTradeStream:
+    """訂閱 @aggTrade 合併串流，以獨立執行緒批次聚合，回報處理延遲"""
+    
+    def __init__(self, ws_manager, aggregator, recorder=None):
+        self.ws_manager = ws_manager
+        self.aggregator = aggregator
+        self.recorder = recorder  # 設定時每筆成交也寫入本地歷史（HistoryRecorder）
+        self.queue = deque()
+        self.event = threading.Event()
+        self.stream = None
+        self.symbols = []
+        self.running = False
+        self.thread = None
+        self.lag_ms = 0.0
+        self.processed = 0
+    
+    def start(self, symbols):
+        """開始（或改為）訂閱指定交易對"""
+        symbols = sorted(set(symbols))
+        if symbols == self.symbols and self.stream:
+            return
+        if self.stream:
+            self.ws_manager.stop_socket(self.stream)
+            self.stream = None
+        self.symbols = symbols
+        if symbols:
+            streams = [f"{symbol.lower()}@aggTrade" for symbol in symbols]
+            self.stream = self.ws_manager.start_multiplex_socket(callback=self.on_message, streams=streams)
+            print(f"🕯️ 已訂閱 {len(symbols)} 個交易對的成交串流")
+        if not self.running:
+            self.running = True
+            self.thread = threading.Thread(target=self.consume_worker, daemon=True)
+            self.thread.start()
+    
+    def stop(self):
+        """停止訂閱與聚合執行緒"""
+        self.running = False
+        self.event.set()
+        if self.stream:
+            self.ws_manager.stop_socket(self.stream)
+            self.stream = None
+    
+    def on_message(self, msg):
+        """串流回呼只負責排入佇列，避免阻塞 WebSocket 執行緒"""
+        data = msg.get('data', msg)
+        if data.get('e') == 'aggTrade':
+            self.queue.append(data)
+            self.event.set()
+        elif data.get('e') == 'error':
+            print(f"⚠️ 成交串流錯誤: {data.get('m')}")
+    
+    def consume_worker(self):
+        """批次取出佇列中的成交並聚合"""
+        queue = self.queue
+        add_trade = self.aggregator.add_trade
+        record_trade = self.recorder.record_trade if self.recorder is not None else None
+        last_idle_check = 0.0
+        while self.running:
+            self.event.wait(timeout=0.5)
+            self.event.clear()
+            latest_trade_time = None
+            while queue:
+                trade = queue.popleft()
+                latest_trade_time = trade['T']
+                symbol, price, quantity = trade['s'], float(trade['p']), float(trade['q'])
+                add_trade(symbol, price, quantity, latest_trade_time)
+                if record_trade is not None:
+                    record_trade(symbol, latest_trade_time, price, quantity)
+                self.processed += 1
+            now = time.time()
+            if latest_trade_time is not None:
+                self.lag_ms = max(0.0, now * 1000 - latest_trade_time)
+            if now - last_idle_check >= 1:
+                last_idle_check = now
+                self.aggregator.close_idle_bars(int(now * 1000))
+    
+    def get_status(self):
+        """回傳處理統計：佇列積壓、最後處理成交的延遲與累計筆數"""
+        return {
+            'symbols': len(self.symbols),
+            'backlog': len(self.queue),
+            'lag_ms': self.lag_ms,
+            'processed': self.processed,
+        }
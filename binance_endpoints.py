@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+🌐 幣安 REST 端點池
+📡 在 api、api1-api4 與 data-api.binance.vision 之間分流公開行情請求
+⏱️ 追蹤每個主機的延遲與錯誤率，自動選擇最佳主機
+🪁 主機回應慢於延遲百分位數時，對第二個主機發出對沖 (hedged) 請求
+🔌 每個主機有獨立的斷路器（關閉 / 開啟 / 半開），搭配指數退避與隨機抖動
+🚦 429 / 418 不計入主機錯誤也不轉移主機，Retry-After 到期前不再發出請求
+"""
+
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# 幣安公開行情可用的主機
+DEFAULT_HOSTS = [
+    'https://api.binance.com',
+    'https://api1.binance.com',
+    'https://api2.binance.com',
+    'https://api3.binance.com',
+    'https://api4.binance.com',
+    'https://data-api.binance.vision',
+]
+
+
+def backoff_delay(attempt, base=1.0, cap=60.0):
+    """指數退避加上完整隨機抖動 (full jitter)"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class CircuitOpenError(Exception):
+    """所有可用主機的斷路器都處於開啟狀態"""
+
+
+class RateLimitError(CircuitOpenError):
+    """
+    幣安回應 429 / 418，或 Retry-After 尚未到期
+    所有 api* 主機共用同一個 IP 權重額度，轉移主機只會消耗更多權重，因此與斷路器開啟一樣立即失敗
+    """
+    
+    def __init__(self, message, retry_after=0.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """單一端點的斷路器"""
+    
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+    
+    def __init__(self, name, failure_threshold=3, reset_timeout=5.0,
+                 max_reset_timeout=60.0, on_state_change=None):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.on_state_change = on_state_change
+        
+        self.state = self.CLOSED
+        self.failures = 0
+        self.open_count = 0  # 連續開啟次數，用來計算退避時間
+        self.open_until = 0.0
+        self.probe_in_flight = False
+        self.lock = threading.Lock()
+    
+    def set_state(self, state):
+        """切換狀態並通知監聽者（呼叫時需持有鎖）"""
+        if state == self.state:
+            return
+        old_state = self.state
+        self.state = state
+        if self.on_state_change:
+            self.on_state_change(self.name, old_state, state)
+    
+    def allow_request(self):
+        """是否允許發出請求；開啟狀態逾時後只放行一個半開探測請求"""
+        with self.lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                if time.monotonic() < self.open_until:
+                    return False
+                self.set_state(self.HALF_OPEN)
+                self.probe_in_flight = False
+            if self.probe_in_flight:
+                return False
+            self.probe_in_flight = True
+            return True
+    
+    def record_success(self):
+        """請求成功：關閉斷路器並重設退避"""
+        with self.lock:
+            self.failures = 0
+            self.open_count = 0
+            self.probe_in_flight = False
+            self.set_state(self.CLOSED)
+    
+    def record_failure(self):
+        """請求失敗：連續失敗達門檻或半開探測失敗時開啟斷路器"""
+        with self.lock:
+            self.failures += 1
+            self.probe_in_flight = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                # 開啟時間以指數成長，並保留一半作為下限避免立刻重試
+                delay = min(self.max_reset_timeout, self.reset_timeout * (2 ** self.open_count))
+                self.open_until = time.monotonic() + delay / 2 + random.uniform(0, delay / 2)
+                self.open_count += 1
+                self.set_state(self.OPEN)
+    
+    def remaining_open_time(self):
+        """開啟狀態剩餘秒數"""
+        with self.lock:
+            if self.state != self.OPEN:
+                return 0.0
+            return max(0.0, self.open_until - time.monotonic())
+
+
+class EndpointStats:
+    """單一主機的延遲與錯誤率統計"""
+    
+    def __init__(self, host, initial_latency=0.3, window=100, alpha=0.2):
+        self.host = host
+        self.alpha = alpha
+        self.latency_ewma = initial_latency
+        self.error_rate = 0.0
+        self.latencies = deque(maxlen=window)
+        self.requests = 0
+        self.failures = 0
+    
+    def record(self, latency, ok):
+        """記錄一次請求結果"""
+        self.requests += 1
+        if ok:
+            self.latencies.append(latency)
+            self.latency_ewma += self.alpha * (latency - self.latency_ewma)
+            self.error_rate *= (1 - self.alpha)
+        else:
+            self.failures += 1
+            self.error_rate += self.alpha * (1 - self.error_rate)
+    
+    def percentile(self, pct):
+        """回傳最近成功請求延遲的百分位數，樣本不足時回傳 None"""
+        if len(self.latencies) < 5:
+            return None
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, int(len(ordered) * pct / 100))
+        return ordered[index]
+    
+    def score(self):
+        """分數越低越好：延遲乘上錯誤率懲罰"""
+        return self.latency_ewma * (1 + 4 * self.error_rate)
+
+
+class BinanceEndpointPool:
+    """在多個幣安主機之間路由公開 REST 請求"""
+    
+    def __init__(self, hosts=None, timeout=10, hedge_percentile=95,
+                 min_hedge_delay=0.2, hedge_budget=0.1, max_attempts=3,
+                 failure_threshold=3, reset_timeout=5.0, max_reset_timeout=60.0):
+        self.hosts = list(hosts or DEFAULT_HOSTS)
+        self.timeout = timeout
+        self.hedge_percentile = hedge_percentile
+        self.min_hedge_delay = min_hedge_delay
+        self.hedge_budget = hedge_budget  # 對沖請求佔總請求的上限比例
+        self.max_attempts = max_attempts
+        
+        self.stats = {host: EndpointStats(host) for host in self.hosts}
+        self.breakers = {
+            host: CircuitBreaker(
+                host,
+                failure_threshold=failure_threshold,
+                reset_timeout=reset_timeout,
+                max_reset_timeout=max_reset_timeout,
+                on_state_change=self.notify_state_change,
+            )
+            for host in self.hosts
+        }
+        self.state_listeners = []
+        self.lock = threading.Lock()
+        self.hedge_tokens = 1.0
+        self.hedges_sent = 0
+        self.retry_until = 0.0  # 幣安以 429 / 418 要求暫停時，Retry-After 到期的時間
+        self.default_retry_after = 60.0  # 回應沒有 Retry-After 標頭時的暫停秒數
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=len(self.hosts), pool_maxsize=8)
+        self.session.mount('https://', adapter)
+        self.executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='binance-rest')
+    
+    @classmethod
+    def from_config(cls, network_config):
+        """依 config.json 的 network 區塊建立端點池"""
+        return cls(
+            hosts=network_config.get('hosts'),
+            timeout=network_config.get('request_timeout', 10),
+            hedge_percentile=network_config.get('hedge_percentile', 95),
+            min_hedge_delay=network_config.get('min_hedge_delay', 0.2),
+            hedge_budget=network_config.get('hedge_budget', 0.1),
+            max_attempts=network_config.get('max_attempts', 3),
+            failure_threshold=network_config.get('breaker_failure_threshold', 3),
+            reset_timeout=network_config.get('breaker_reset_timeout', 5.0),
+            max_reset_timeout=network_config.get('breaker_max_reset_timeout', 60.0),
+        )
+    
+    def add_state_listener(self, listener):
+        """註冊斷路器狀態變更的監聽函數 listener(host, old_state, new_state)"""
+        self.state_listeners.append(listener)
+    
+    def notify_state_change(self, host, old_state, new_state):
+        """斷路器狀態變更時通知所有監聽者"""
+        print(f"🔌 {host} 斷路器：{old_state} → {new_state}")
+        for listener in self.state_listeners:
+            try:
+                listener(host, old_state, new_state)
+            except Exception as e:
+                print(f"⚠️ 斷路器監聽函數發生錯誤: {e}")
+    
+    def rank_hosts(self):
+        """依分數由佳到差排序主機"""
+        with self.lock:
+            return sorted(self.hosts, key=lambda host: self.stats[host].score())
+    
+    def hedge_delay(self, host):
+        """主機超過這個時間仍未回應就發出對沖請求"""
+        with self.lock:
+            stats = self.stats[host]
+            delay = stats.percentile(self.hedge_percentile)
+            if delay is None:
+                delay = stats.latency_ewma * 3
+        return min(max(delay, self.min_hedge_delay), self.timeout)
+    
+    def take_hedge_token(self):
+        """對沖預算：每個請求累積 hedge_budget 個額度，對沖一次消耗 1 個"""
+        with self.lock:
+            if self.hedge_tokens >= 1:
+                self.hedge_tokens -= 1
+                self.hedges_sent += 1
+                return True
+            return False
+    
+    def record(self, host, latency, ok):
+        """記錄主機的請求結果"""
+        with self.lock:
+            self.stats[host].record(latency, ok)
+        if ok:
+            self.breakers[host].record_success()
+        else:
+            self.breakers[host].record_failure()
+    
+    def fetch(self, host, path, params, raw=False):
+        """對單一主機發出請求並記錄延遲，raw 為 True 時回傳未解析的位元組"""
+        start = time.monotonic()
+        try:
+            response = self.session.get(f"{host}{path}", params=params, timeout=self.timeout)
+            if response.status_code in (418, 429):
+                # 限流是整個 IP 的狀態，不是主機錯誤
+                seconds = self.record_retry_after(response.headers.get('Retry-After'))
+                raise RateLimitError(f"{host} 回應 {response.status_code}，{seconds:.0f} 秒內暫停請求", seconds)
+            if response.status_code < 500:
+                # 4xx 是請求本身的問題，不算主機錯誤
+                self.record(host, time.monotonic() - start, True)
+                response.raise_for_status()
+                return response.content if raw else response.json()
+            response.raise_for_status()
+        except RateLimitError:
+            raise
+        except requests.exceptions.HTTPError as e:
+            if e.response is not None and e.response.status_code < 500:
+                raise
+            self.record(host, time.monotonic() - start, False)
+            raise
+        except Exception:
+            self.record(host, time.monotonic() - start, False)
+            raise
+    
+    def record_retry_after(self, value):
+        """記錄 Retry-After 標頭（秒數），沒有或無法解析時使用預設值，回傳暫停秒數"""
+        try:
+            seconds = float(value)
+        except (TypeError, ValueError):
+            seconds = self.default_retry_after
+        with self.lock:
+            self.retry_until = max(self.retry_until, time.monotonic() + seconds)
+        return seconds
+    
+    def retry_after(self):
+        """距離 Retry-After 到期還有幾秒，沒有限制時為 0"""
+        with self.lock:
+            return max(0.0, self.retry_until - time.monotonic())
+    
+    def next_request_delay(self):
+        """最快還要幾秒才可能發出請求：Retry-After 到期，且至少一個主機的斷路器不在開啟狀態"""
+        reopen = min(self.breakers[host].remaining_open_time() for host in self.hosts)
+        return max(self.retry_after(), reopen)
+    
+    def get_json(self, path, params=None, raw=False):
+        """以最佳主機取得 JSON，慢時對沖、失敗時轉移到下一個主機（raw 為 True 時回傳原始位元組）"""
+        remaining = self.retry_after()
+        if remaining > 0:
+            raise RateLimitError(f"幣安限流中，{remaining:.0f} 秒後才能再發出請求", remaining)
+        with self.lock:
+            self.hedge_tokens = min(self.hedge_tokens + self.hedge_budget, 10.0)
+        
+        candidates = iter(self.rank_hosts())
+        launched = []
+        pending = {}
+        last_error = None
+        
+        def launch(hedge=False):
+            if len(launched) >= self.max_attempts or self.retry_after() > 0:
+                return False
+            # 跳過斷路器開啟中的主機
+            for host in candidates:
+                if self.breakers[host].allow_request():
+                    break
+            else:
+                return False
+            if hedge:
+                print(f"🪁 {launched[0]} 回應過慢，對 {host} 發出對沖請求")
+            launched.append(host)
+            pending[self.executor.submit(self.fetch, host, path, params, raw)] = host
+            return True
+        
+        if not launch():
+            raise CircuitOpenError("所有幣安主機的斷路器都在開啟狀態")
+        wait_time = self.hedge_delay(launched[0])
+        
+        while pending:
+            done, _ = wait(list(pending), timeout=wait_time, return_when=FIRST_COMPLETED)
+            
+            if not done:
+                # 超過對沖期限仍未回應
+                if self.take_hedge_token():
+                    launch(hedge=True)
+                wait_time = None
+                continue
+            
+            for future in done:
+                host = pending.pop(future)
+                try:
+                    return future.result()
+                except RateLimitError:
+                    # 不轉移到其他主機：它們共用同一個 IP 的權重額度
+                    raise
+                except requests.exceptions.HTTPError as e:
+                    status = e.response.status_code if e.response is not None else None
+                    if status is not None and status < 500:
+                        raise
+                    last_error = e
+                except Exception as e:
+                    last_error = e
+                print(f"⚠️ {host} 請求失敗: {last_error}")
+            
+            # 所有進行中的請求都失敗時，立即轉移到下一個主機
+            if not pending and launch():
+                wait_time = self.hedge_delay(launched[-1])
+        
+        raise last_error
+    
+    def get_status(self):
+        """回傳各主機的統計摘要"""
+        with self.lock:
+            return {
+                host: {
+                    'latency_ms': stats.latency_ewma * 1000,
+                    'error_rate': stats.error_rate,
+                    'requests': stats.requests,
+                    'failures': stats.failures,
+                    'breaker': self.breakers[host].state,
+                    'reopen_in': self.breakers[host].remaining_open_time(),
+                }
+                for host, stats in self.stats.items()
+            }
+    
+    def close(self):
+        """關閉連線與執行緒池"""
+        self.executor.shutdown(wait=False)
+        self.session.close()
@@ -11,6 +11,7 @@
 
 import sys
 import json
+import math
 import time
 import threading
 import requests
@@ -19,6 +20,10 @@ import hashlib
 import hmac
 import urllib.parse
 import os
+import shutil
+import tempfile
+from decimal import Decimal, ROUND_DOWN, ROUND_HALF_UP
+from concurrent.futures import wait as wait_futures
 
 # 檢查並導入 dotenv
 try:
@@ -42,12 +47,34 @@ except ImportError:
 try:
     from binance.client import Client
     from binance.exceptions import BinanceAPIException
+    from binance import ThreadedWebsocketManager
     BINANCE_AVAILABLE = True
 except ImportError:
     BINANCE_AVAILABLE = False
     print("⚠️ python-binance 套件未安裝")
     print("請執行: pip install python-binance")
 
+from binance_endpoints import BinanceEndpointPool, CircuitOpenError, RateLimitError, backoff_delay
+from task_executor import TaskExecutor
+from snapshot_bus import SnapshotStore
+from menu_renderer import MenuRenderer, format_price, format_change, format_volume
+from portfolio import PortfolioEngine
+from order_book import OrderBookManager
+from bar_aggregator import Bar, TradeAggregator, AggTradeStream
+from rolling_stats import RollingStats, parse_windows
+from market_history import HistoryRecorder, ParquetExporter, PYARROW_AVAILABLE
+from anomaly_detector import AnomalyDetector, DEFAULT_THRESHOLDS as ANOMALY_THRESHOLDS, describe as describe_anomaly
+from market_scanner import MarketScanner, CATEGORIES as SCANNER_CATEGORIES
+from mark_price_monitor import MarkPriceMonitor, basis_percentage
+from derived_series import DerivedGraph, PERP_PREFIX
+from price_server import PriceServerClient
+from price_table import PriceTable
+from ticker_decoder import SelectiveTickerDecoder, SCANNER_FIELDS
+from shared_prices import SharedPriceTable, DEFAULT_NAME as SHARED_PRICES_NAME
+from sharded_monitor import ShardedFeed, discover_symbols
+from order_automation import AutomationEngine
+from paper_trading import PaperTradingClient
+
 class CryptoMenuBarMonitor(rumps.App):
     def __init__(self):
         # 載入配置
@@ -58,34 +85,82 @@ class CryptoMenuBarMonitor(rumps.App):
         
         # 狀態變數
         self.running = True
-        self.update_thread = None
+        self.update_future = None
         self.current_crypto_index = 0
-        self.crypto_data = {}
+        self.crypto_data = PriceTable()  # 欄式價格表，介面與原本的 dict 相同
+        self.ticker_decoder = SelectiveTickerDecoder()
+        self.snapshots = SnapshotStore()  # 唯讀快照與變更事件，各元件以訂閱方式取得新價格
         self.display_mode = "compact"  # compact, full, symbol_only
+        self.ticker_position = 0
+        self.last_rotation = time.monotonic()
+        self.apply_display_config()
+        
+        # 公開行情 REST 端點池（多主機分流與對沖請求）
+        self.endpoint_pool = BinanceEndpointPool.from_config(self.config.get('network', {}))
+        self.endpoint_pool.add_state_listener(self.on_breaker_state_change)
+        
+        # 所有背景工作共用的執行器
+        # 價格更新與配置監看各佔一個常駐工作執行緒，至少保留一個給其他任務
+        workers = max(3, self.config.get('executor', {}).get('workers', 4))
+        self.executor = TaskExecutor(workers, name='monitor')
         
         # 初始化幣安客戶端
         self.init_binance_client()
         
+        # 投資組合估值引擎
+        self.setup_portfolio()
+        
         # 設定選單
         self.setup_menu()
         
+        # 渲染層：背景執行緒只排入更新，由主執行緒的計時器以固定頻率批次套用
+        self.setup_renderer()
+        
+        # 選擇中交易對的本地訂單簿
+        self.setup_order_book()
+        
+        # 本地行情歷史（成交、K 線與警報事件）
+        self.setup_history()
+        
+        # 成交串流 K 線聚合
+        self.setup_bar_stream()
+        
+        # 全市場異動掃描
+        self.setup_scanner()
+        
+        # 合約標記價格與資金費率
+        self.setup_mark_prices()
+        
+        # 跨交易對衍生序列
+        self.setup_derived()
+        
+        # 將最新價格發布到共享記憶體，供本機其他程式讀取
+        self.setup_shared_prices()
+        
+        # 設定了本地價格伺服器時改為客戶端模式
+        self.setup_price_client()
+        
+        # 分片模式：由多個工作程序監看大量交易對
+        self.setup_sharding()
+        
+        # 掛在警報規則上的條件式自動下單
+        self.setup_automation()
+        
+        # 顯示、警報、投資組合與共享價格表改為訂閱價格變更
+        self.setup_subscribers()
+        
         # 啟動價格更新
         self.start_price_updates()
+        
+        # 監看配置檔案變更
+        self.start_config_watcher()
     
     def load_config(self):
         """載入配置檔案"""
+        self.config_path = 'config.json'
         try:
-            with open('config.json', 'r', encoding='utf-8') as f:
-                config = json.load(f)
-            self.trading_pairs = config.get('trading_pairs', [])
-            self.update_interval = config.get('update_interval', 30)
-            self.price_alert_enabled = config.get('price_alert_enabled', False)
-            self.alert_thresholds = config.get('alert_thresholds', {})
-            self.alert_cooldown = config.get('alert_cooldown', 300)  # 5分鐘冷卻時間
-            
-            # 幣安 API 配置
-            self.binance_config = config.get('binance_api', {})
-            self.trading_settings = config.get('trading_settings', {})
+            config = self.read_config_file()
+            self.apply_config(config)
             
             if not self.trading_pairs:
                 print("⚠️ 配置檔案中沒有交易對，請檢查 config.json")
@@ -138,11 +213,58 @@ class CryptoMenuBarMonitor(rumps.App):
         # 初始化警報狀態追蹤
         self.last_alert_time = {}  # 記錄上次警報時間，避免重複通知
         self.alert_triggered = {}  # 記錄已觸發的警報狀態
+        self.alert_ranges = {}  # 上次檢查以來觸及閾值的 [最高, 最低]，兩次取樣之間的插針也能觸發
+        self.alert_lock = threading.RLock()  # 警報可能同時由價格訂閱者與 K 線串流檢查
+        self.last_range_check = None
+        
+        # 配置熱重載與延遲儲存狀態
+        self.config_lock = threading.Lock()
+        self.config_save_timer = None
+        self.config_save_delay = self.config.get('config_save_delay', 1.0)
+        self.config_watch_interval = self.config.get('config_watch_interval', 2)
+        self.config_mtime = self.get_config_mtime()
+    
+    def read_config_file(self):
+        """讀取並解析 config.json"""
+        with open(self.config_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    
+    def get_config_mtime(self):
+        """取得 config.json 的修改時間，檔案不存在時回傳 None"""
+        try:
+            stat = os.stat(self.config_path)
+            return (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            return None
+    
+    def apply_config(self, config):
+        """將配置內容套用到執行中的狀態"""
+        self.config = config
+        self.trading_pairs = config.get('trading_pairs', [])
+        self.update_interval = config.get('update_interval', 30)
+        self.price_alert_enabled = config.get('price_alert_enabled', False)
+        self.alert_thresholds = config.get('alert_thresholds', {})
+        self.alert_cooldown = config.get('alert_cooldown', 300)  # 5分鐘冷卻時間
+        
+        # 幣安 API 配置
+        self.binance_config = config.get('binance_api', {})
+        self.trading_settings = config.get('trading_settings', {})
     
     def init_binance_client(self):
         """初始化幣安客戶端"""
         self.binance_client = None
         self.trading_enabled = False
+        self.symbol_filters = {}  # (市場, 交易對) → (stepSize, tickSize)
+        
+        # 模擬交易：下單由本地撮合引擎處理，不需要 API 密鑰
+        paper_config = self.config.get('paper_trading', {})
+        if paper_config.get('enabled', False):
+            self.binance_client = PaperTradingClient.from_config(
+                paper_config, price_source=self.get_fresh_price, fill_estimator=self.estimate_paper_fill
+            )
+            self.trading_enabled = True
+            print("📝 模擬交易模式：訂單由本地撮合引擎成交，不會送到幣安")
+            return
         
         if not BINANCE_AVAILABLE:
             print("⚠️ python-binance 套件未安裝，交易功能將被停用")
@@ -247,7 +369,7 @@ class CryptoMenuBarMonitor(rumps.App):
         return base_currency
     
     def check_price_alerts(self, trading_pair, current_price):
-        """檢查價格警報"""
+        """檢查價格警報（同時考慮上次檢查以來 K 線的最高 / 最低價）"""
         if not self.price_alert_enabled:
             print(f"🔕 價格警報已停用")
             return
@@ -256,17 +378,30 @@ class CryptoMenuBarMonitor(rumps.App):
             print(f"🔍 {trading_pair} 沒有設定警報閾值")
             return
         
+        with self.alert_lock:
+            self.evaluate_price_alerts(trading_pair, current_price)
+    
+    def evaluate_price_alerts(self, trading_pair, current_price):
+        """依目前價格與期間高低點判斷警報（呼叫時需持有 alert_lock）"""
         thresholds = self.alert_thresholds[trading_pair]
         high_threshold = thresholds.get('high')
         low_threshold = thresholds.get('low')
         current_time = time.time()
+        fmt = self.alert_price_formatter(trading_pair)
+        
+        # 取樣之間的最高 / 最低價，沒有資料時只看取樣價格
+        range_high, range_low = self.alert_ranges.pop(trading_pair, (None, None))
+        peak = max(current_price, range_high) if range_high is not None else current_price
+        trough = min(current_price, range_low) if range_low is not None else current_price
         
         print(f"🔍 檢查 {trading_pair} 價格警報:")
-        print(f"   當前價格: ${current_price:,.2f}")
+        print(f"   當前價格: {fmt(current_price)}")
+        if peak != current_price or trough != current_price:
+            print(f"   期間高低: {fmt(trough)} - {fmt(peak)}")
         if high_threshold:
-            print(f"   高價閾值: ${high_threshold:,.2f}")
+            print(f"   高價閾值: {fmt(high_threshold)}")
         if low_threshold:
-            print(f"   低價閾值: ${low_threshold:,.2f}")
+            print(f"   低價閾值: {fmt(low_threshold)}")
         
         # 檢查是否在冷卻期內
         last_alert = self.last_alert_time.get(trading_pair, 0)
@@ -275,23 +410,31 @@ class CryptoMenuBarMonitor(rumps.App):
             print(f"⏰ 警報冷卻中，剩餘 {cooldown_remaining:.0f} 秒")
             return
         
-        symbol = self.get_crypto_symbol(trading_pair)
-        name = self.get_crypto_name(trading_pair)
+        if trading_pair in self.derived_series:
+            symbol, name = "🔗", trading_pair
+        else:
+            symbol = self.get_crypto_symbol(trading_pair)
+            name = self.get_crypto_name(trading_pair)
         
         alert_sent = False
         
         # 檢查高價警報
-        if high_threshold and current_price >= high_threshold:
+        if high_threshold and peak >= high_threshold:
             alert_key = f"{trading_pair}_high"
             if not self.alert_triggered.get(alert_key, False):
-                self.send_price_alert(
-                    f"🚨 {symbol} {name} 高價警報！",
-                    f"當前價格 ${current_price:,.2f} 已達到或超過設定的高價閾值 ${high_threshold:,.2f}"
-                )
+                if current_price >= high_threshold:
+                    message = f"當前價格 {fmt(current_price)} 已達到或超過設定的高價閾值 {fmt(high_threshold)}"
+                else:
+                    message = (
+                        f"期間最高價 {fmt(peak)} 曾觸及設定的高價閾值 {fmt(high_threshold)}"
+                        f"（當前價格 {fmt(current_price)}）"
+                    )
+                self.send_price_alert(f"🚨 {symbol} {name} 高價警報！", message)
+                self.record_alert(trading_pair, 'price_high', f"🚨 {symbol} {name} 高價警報！", message)
                 self.alert_triggered[alert_key] = True
                 self.last_alert_time[trading_pair] = current_time
                 alert_sent = True
-                print(f"🚨 {symbol} 高價警報觸發：${current_price:,.2f} >= ${high_threshold:,.2f}")
+                print(f"🚨 {symbol} 高價警報觸發：{fmt(peak)} >= {fmt(high_threshold)}")
             else:
                 print(f"⏰ {symbol} 高價警報已觸發過，等待重置")
         else:
@@ -299,20 +442,25 @@ class CryptoMenuBarMonitor(rumps.App):
             high_key = f"{trading_pair}_high"
             if self.alert_triggered.get(high_key, False):
                 self.alert_triggered[high_key] = False
-                print(f"✅ {symbol} 高價警報狀態已重置 (價格: ${current_price:,.2f} < 閾值: ${high_threshold:,.2f})")
+                print(f"✅ {symbol} 高價警報狀態已重置 (價格: {fmt(current_price)} < 閾值: {fmt(high_threshold)})")
         
         # 檢查低價警報
-        if low_threshold and current_price <= low_threshold:
+        if low_threshold and trough <= low_threshold:
             alert_key = f"{trading_pair}_low"
             if not self.alert_triggered.get(alert_key, False):
-                self.send_price_alert(
-                    f"🚨 {symbol} {name} 低價警報！",
-                    f"當前價格 ${current_price:,.2f} 已達到或低於設定的低價閾值 ${low_threshold:,.2f}"
-                )
+                if current_price <= low_threshold:
+                    message = f"當前價格 {fmt(current_price)} 已達到或低於設定的低價閾值 {fmt(low_threshold)}"
+                else:
+                    message = (
+                        f"期間最低價 {fmt(trough)} 曾觸及設定的低價閾值 {fmt(low_threshold)}"
+                        f"（當前價格 {fmt(current_price)}）"
+                    )
+                self.send_price_alert(f"🚨 {symbol} {name} 低價警報！", message)
+                self.record_alert(trading_pair, 'price_low', f"🚨 {symbol} {name} 低價警報！", message)
                 self.alert_triggered[alert_key] = True
                 self.last_alert_time[trading_pair] = current_time
                 alert_sent = True
-                print(f"🚨 {symbol} 低價警報觸發：${current_price:,.2f} <= ${low_threshold:,.2f}")
+                print(f"🚨 {symbol} 低價警報觸發：{fmt(trough)} <= {fmt(low_threshold)}")
             else:
                 print(f"⏰ {symbol} 低價警報已觸發過，等待重置")
         else:
@@ -320,18 +468,45 @@ class CryptoMenuBarMonitor(rumps.App):
             low_key = f"{trading_pair}_low"
             if self.alert_triggered.get(low_key, False):
                 self.alert_triggered[low_key] = False
-                print(f"✅ {symbol} 低價警報狀態已重置 (價格: ${current_price:,.2f} > 閾值: ${low_threshold:,.2f})")
+                print(f"✅ {symbol} 低價警報狀態已重置 (價格: {fmt(current_price)} > 閾值: {fmt(low_threshold)})")
         
         # 如果沒有發送警報，顯示狀態
         if not alert_sent:
             status = "正常範圍"
             if high_threshold and low_threshold:
-                status = f"正常範圍 (${low_threshold:,.2f} - ${high_threshold:,.2f})"
+                status = f"正常範圍 ({fmt(low_threshold)} - {fmt(high_threshold)})"
             elif high_threshold:
-                status = f"低於高價閾值 (< ${high_threshold:,.2f})"
+                status = f"低於高價閾值 (< {fmt(high_threshold)})"
             elif low_threshold:
-                status = f"高於低價閾值 (> ${low_threshold:,.2f})"
-            print(f"✓ {symbol} 價格 ${current_price:,.2f} 在{status}")
+                status = f"高於低價閾值 (> {fmt(low_threshold)})"
+            print(f"✓ {symbol} 價格 {fmt(current_price)} 在{status}")
+    
+    def alert_price_formatter(self, trading_pair):
+        """警報訊息的數值格式：交易對為美元價格，衍生序列依種類格式化"""
+        series = self.derived_series.get(trading_pair)
+        if series is not None:
+            return series.format
+        return lambda value: f"${value:,.2f}"
+    
+    def merge_alert_range(self, trading_pair, high, low):
+        """記錄取樣之間觸及閾值的最高 / 最低價，下次檢查時一併判斷"""
+        thresholds = self.alert_thresholds.get(trading_pair)
+        if not thresholds:
+            return False
+        touched = (
+            (thresholds.get('high') and high >= thresholds['high'])
+            or (thresholds.get('low') and low <= thresholds['low'])
+        )
+        if not touched:
+            return False
+        with self.alert_lock:
+            current = self.alert_ranges.get(trading_pair)
+            if current is None:
+                self.alert_ranges[trading_pair] = [high, low]
+            else:
+                current[0] = max(current[0], high)
+                current[1] = min(current[1], low)
+        return True
     
     def send_price_alert(self, title, message):
         """發送 macOS 系統通知"""
@@ -389,6 +564,11 @@ class CryptoMenuBarMonitor(rumps.App):
         self.price_menu = rumps.MenuItem("⏳ 載入中...", callback=None)
         self.menu.add(self.price_menu)
         
+        # 投資組合總資產
+        if self.portfolio_enabled:
+            self.equity_menu = rumps.MenuItem("💼 總資產：載入中...", callback=self.show_account_balance)
+            self.menu.add(self.equity_menu)
+        
         # 詳細資訊子選單
         self.detail_submenu = rumps.MenuItem("📈 詳細資訊")
         self.detail_price = rumps.MenuItem("💰 現價：載入中...", callback=None)
@@ -396,6 +576,7 @@ class CryptoMenuBarMonitor(rumps.App):
         self.detail_high = rumps.MenuItem("⬆️ 24h 最高：載入中...", callback=None)
         self.detail_low = rumps.MenuItem("⬇️ 24h 最低：載入中...", callback=None)
         self.detail_volume = rumps.MenuItem("📈 成交量：載入中...", callback=None)
+        self.detail_spread = rumps.MenuItem("↔️ 買賣價差：載入中...", callback=None)
         self.detail_time = rumps.MenuItem("🔄 更新時間：載入中...", callback=None)
         
         self.detail_submenu.add(self.detail_price)
@@ -403,10 +584,38 @@ class CryptoMenuBarMonitor(rumps.App):
         self.detail_submenu.add(self.detail_high)
         self.detail_submenu.add(self.detail_low)
         self.detail_submenu.add(self.detail_volume)
+        
+        # 自訂滾動視窗（例如 1h、4h）的漲跌與高低點
+        self.rolling_config = self.config.get('rolling_stats', {})
+        self.detail_windows = {}
+        rolling_enabled = self.rolling_config.get('enabled', True) and self.config.get('bars', {}).get('enabled', True)
+        if BINANCE_AVAILABLE and rolling_enabled:
+            for name in parse_windows(self.rolling_config.get('windows')):
+                if name != '24h':
+                    self.detail_windows[name] = rumps.MenuItem(f"⏱️ {name}：載入中...", callback=None)
+                    self.detail_submenu.add(self.detail_windows[name])
+        self.detail_submenu.add(self.detail_spread)
+        self.mark_price_config = self.config.get('mark_price', {})
+        if self.mark_price_config.get('enabled', False):
+            self.detail_mark = rumps.MenuItem("⚡ 合約標記價格：載入中...", callback=None)
+            self.detail_submenu.add(self.detail_mark)
         self.detail_submenu.add(rumps.separator)
         self.detail_submenu.add(self.detail_time)
         self.menu.add(self.detail_submenu)
         
+        # 跨交易對衍生序列
+        self.derived_config = self.config.get('derived', {})
+        self.derived_graph = None
+        self.derived_series = {}
+        self.derived_perp_legs = set()
+        if self.derived_config:
+            self.build_derived_menu()
+        
+        # 全市場異動排行
+        self.scanner_config = self.config.get('scanner', {})
+        if self.scanner_config.get('enabled', False):
+            self.build_scanner_menu()
+        
         # 分隔線
         self.menu.add(rumps.separator)
         
@@ -418,6 +627,13 @@ class CryptoMenuBarMonitor(rumps.App):
         self.display_submenu.add(self.mode_compact)
         self.display_submenu.add(self.mode_full)
         self.display_submenu.add(self.mode_symbol_only)
+        self.display_submenu.add(rumps.separator)
+        self.ticker_single = rumps.MenuItem("🎯 單一幣種", callback=self.set_ticker_single)
+        self.ticker_carousel = rumps.MenuItem("🎠 輪播多幣種", callback=self.set_ticker_carousel)
+        self.ticker_multi = rumps.MenuItem("🧮 多幣種並排", callback=self.set_ticker_multi)
+        self.display_submenu.add(self.ticker_single)
+        self.display_submenu.add(self.ticker_carousel)
+        self.display_submenu.add(self.ticker_multi)
         self.menu.add(self.display_submenu)
         
         # 分隔線
@@ -425,22 +641,17 @@ class CryptoMenuBarMonitor(rumps.App):
         
         # 加密貨幣選擇子選單
         self.crypto_submenu = rumps.MenuItem("💰 選擇加密貨幣")
-        for i, pair in enumerate(self.trading_pairs):
-            name = self.get_crypto_name(pair)
-            symbol = self.get_crypto_symbol(pair)
-            menu_item = rumps.MenuItem(
-                f"{symbol} {name}",
-                callback=self.create_crypto_callback(i)
-            )
-            self.crypto_submenu.add(menu_item)
+        self.populate_crypto_submenu()
         self.menu.add(self.crypto_submenu)
         
         # 分隔線
         self.menu.add(rumps.separator)
         
         # 交易功能選單
+        self.automation_config = self.config.get('automation', {})
         if self.trading_enabled and self.binance_client:
-            self.trading_submenu = rumps.MenuItem("💰 交易功能")
+            paper = isinstance(self.binance_client, PaperTradingClient)
+            self.trading_submenu = rumps.MenuItem("💰 交易功能（模擬）" if paper else "💰 交易功能")
             
             # 現貨交易
             self.spot_trading_submenu = rumps.MenuItem("📈 現貨交易")
@@ -463,11 +674,20 @@ class CryptoMenuBarMonitor(rumps.App):
             self.trading_submenu.add(rumps.MenuItem("📊 持倉資訊", callback=self.show_positions))
             self.trading_submenu.add(rumps.MenuItem("📋 訂單紀錄", callback=self.show_orders))
             
+            # 自動下單緊急停止開關
+            if self.automation_config.get('enabled', False):
+                self.trading_submenu.add(rumps.separator)
+                self.automation_menu = rumps.MenuItem("🤖 自動下單：待命中", callback=self.toggle_automation)
+                self.trading_submenu.add(self.automation_menu)
+            
             self.menu.add(self.trading_submenu)
             self.menu.add(rumps.separator)
         
         # 重新整理按鈕
         self.menu.add(rumps.MenuItem("🔄 重新整理", callback=self.manual_refresh))
+        self.menu.add(rumps.MenuItem("🩺 連線狀態", callback=self.show_connection_status))
+        if self.config.get('history', {}).get('enabled', False):
+            self.menu.add(rumps.MenuItem("📦 匯出歷史資料", callback=self.export_history))
         
         # 警報設定按鈕
         if self.price_alert_enabled:
@@ -483,6 +703,24 @@ class CryptoMenuBarMonitor(rumps.App):
         
         # 設定初始模式狀態
         self.mode_compact.state = True
+        self.update_ticker_states()
+    
+    def populate_crypto_submenu(self):
+        """依照目前的交易對清單建立加密貨幣選擇項目"""
+        for i, pair in enumerate(self.trading_pairs):
+            name = self.get_crypto_name(pair)
+            symbol = self.get_crypto_symbol(pair)
+            menu_item = rumps.MenuItem(
+                f"{symbol} {name}",
+                callback=self.create_crypto_callback(i)
+            )
+            menu_item.state = (i == self.current_crypto_index)
+            self.crypto_submenu.add(menu_item)
+    
+    def rebuild_crypto_submenu(self):
+        """依目前的交易對清單重建加密貨幣選擇子選單（需在主執行緒呼叫）"""
+        self.crypto_submenu.clear()
+        self.populate_crypto_submenu()
     
     def create_crypto_callback(self, index):
         """創建加密貨幣切換回調函數"""
@@ -490,6 +728,7 @@ class CryptoMenuBarMonitor(rumps.App):
             self.current_crypto_index = index
             # 立即更新顯示
             self.manual_refresh(None)
+            self.follow_selected_order_book()
             # 更新選單項目的勾選狀態
             for i, item in enumerate(self.crypto_submenu.keys()):
                 self.crypto_submenu[item].state = (i == index)
@@ -522,62 +761,242 @@ class CryptoMenuBarMonitor(rumps.App):
         self.mode_full.state = (current_mode == "full")
         self.mode_symbol_only.state = (current_mode == "symbol_only")
     
+    # ==================== 多幣種輪播 ====================
+    
+    def apply_display_config(self):
+        """套用 display 設定中的輪播選項"""
+        display_config = self.config.get('display', {})
+        self.ticker_mode = display_config.get('ticker_mode', 'single')  # single, carousel, multi
+        self.ticker_pairs = display_config.get('ticker_pairs') or self.trading_pairs[:3]
+        self.ticker_slots = max(1, int(display_config.get('ticker_slots', 2)))
+        self.rotation_interval = max(1, display_config.get('rotation_interval', 5))
+        self.ticker_position %= len(self.ticker_pairs)
+    
+    def set_ticker_single(self, sender):
+        """只顯示目前選擇的交易對"""
+        self.set_ticker_mode("single")
+    
+    def set_ticker_carousel(self, sender):
+        """輪流顯示多個交易對"""
+        self.set_ticker_mode("carousel")
+    
+    def set_ticker_multi(self, sender):
+        """同時並排顯示多個交易對"""
+        self.set_ticker_mode("multi")
+    
+    def set_ticker_mode(self, mode):
+        """切換選單欄標題的輪播模式"""
+        self.ticker_mode = mode
+        self.update_ticker_states()
+        self.update_display()
+        # 輪播需要的其他交易對資料在下一次背景更新時一併取得
+        if mode != "single":
+            self.manual_refresh(None)
+        print(f"🎠 已切換到 {mode} 標題模式")
+    
+    def update_ticker_states(self):
+        """更新輪播模式選項的勾選狀態"""
+        self.ticker_single.state = (self.ticker_mode == "single")
+        self.ticker_carousel.state = (self.ticker_mode == "carousel")
+        self.ticker_multi.state = (self.ticker_mode == "multi")
+    
+    def rotate_ticker(self, timer):
+        """主執行緒計時器：到達輪播間隔時換下一組交易對，只使用記憶體中的資料"""
+        if self.ticker_mode == "single" or len(self.ticker_pairs) <= 1:
+            return
+        if time.monotonic() - self.last_rotation < self.rotation_interval:
+            return
+        self.last_rotation = time.monotonic()
+        step = 1 if self.ticker_mode == "carousel" else self.ticker_slots
+        self.ticker_position = (self.ticker_position + step) % len(self.ticker_pairs)
+        self.update_display()
+    
+    def get_display_pairs(self):
+        """目前需要取得價格的交易對：選擇的交易對加上輪播中的交易對"""
+        current_pair = self.trading_pairs[self.current_crypto_index]
+        if self.ticker_mode == "single":
+            return [current_pair]
+        pairs = [current_pair]
+        for pair in self.ticker_pairs:
+            if pair not in pairs:
+                pairs.append(pair)
+        return pairs
+    
+    def format_pair_title(self, pair, data):
+        """依顯示模式產生單一交易對的標題文字"""
+        symbol = self.get_crypto_symbol(pair)
+        if self.display_mode == "symbol_only":
+            return symbol
+        price_str = format_price(data['price'], self.display_mode)
+        if self.display_mode == "compact":
+            return f"{symbol} {price_str}"
+        _, change_str = format_change(data['change_24h'])
+        return f"{symbol} {price_str} {change_str}"
+    
+    def build_ticker_title(self):
+        """從記憶體中的快照組合輪播或並排標題"""
+        count = 1 if self.ticker_mode == "carousel" else min(self.ticker_slots, len(self.ticker_pairs))
+        parts = []
+        for offset in range(count):
+            pair = self.ticker_pairs[(self.ticker_position + offset) % len(self.ticker_pairs)]
+            data = self.crypto_data.get(pair)
+            if data:
+                parts.append(self.format_pair_title(pair, data))
+        return "  ".join(parts) if parts else "⚡"
+    
     def get_prices_for_alerts(self):
         """獲取所有有設定警報的交易對價格"""
         if not self.price_alert_enabled or not self.alert_thresholds:
             return True
             
-        # 獲取所有有設定警報的交易對
-        alert_pairs = list(self.alert_thresholds.keys())
+        # 獲取所有有設定警報的交易對（衍生序列由腿的價格計算，不向幣安請求）
+        alert_pairs = self.get_exchange_alert_pairs()
+        if not alert_pairs:
+            return True
+        
+        # 分片模式：警報由工作程序在串流上即時判斷
+        if self.sharded_feed is not None and self.sharded_feed.covers('spot', alert_pairs):
+            return True
         print(f"🚨 檢查 {len(alert_pairs)} 個設定了警報的交易對: {alert_pairs}")
         
+        # 客戶端模式：一次從本地價格伺服器取得所有警報交易對
+        if self.price_client is not None:
+            try:
+                self.store_rows(self.price_client.get_snapshot(alert_pairs))
+                return True
+            except Exception as e:
+                print(f"❌ 從價格伺服器獲取警報價格失敗: {e}")
+                return False
+        
+        # 取樣之間的插針：成交串流涵蓋的交易對由 K 線即時處理，其餘以一次批次請求取得期間高低點
+        self.fetch_alert_ranges(alert_pairs)
+        
+        # 滾動視窗已涵蓋的交易對不需要再請求 /ticker/24hr
+        rolling = self.get_rolling_rows(alert_pairs)
+        if rolling:
+            self.store_rows(rolling)
+            alert_pairs = [pair for pair in alert_pairs if pair not in rolling]
+        
+        success = True
         for pair in alert_pairs:
             try:
                 print(f"🔄 正在獲取 {pair} 的價格用於警報檢查...")
                 
-                url = f"https://api.binance.com/api/v3/ticker/24hr?symbol={pair}"
-                response = requests.get(url, timeout=10)
-                response.raise_for_status()
-                
-                data = response.json()
-                current_price = float(data['lastPrice'])
+                payload = self.endpoint_pool.get_json('/api/v3/ticker/24hr', {'symbol': pair}, raw=True)
                 
-                # 檢查價格警報
-                self.check_price_alerts(pair, current_price)
+                # 寫入價格表，價格有變更時由警報訂閱者檢查
+                self.store_decoded(self.ticker_decoder.decode(payload))
                 
+            except RateLimitError as e:
+                # 限流時繼續請求其他交易對只會消耗更多權重，甚至導致 IP 被封鎖
+                print(f"🚦 {e}，暫停本輪警報檢查")
+                return False
+            except CircuitOpenError as e:
+                # API 明顯無法使用，剩下的交易對等斷路器恢復後再檢查
+                print(f"🔌 {e}，暫停本輪警報檢查")
+                return False
             except Exception as e:
                 print(f"❌ 獲取 {pair} 價格失敗: {e}")
+                success = False
         
-        return True
+        # 價格沒有變更的交易對不會產生事件，期間曾觸及閾值的直接以目前價格檢查
+        for pair in list(self.alert_ranges):
+            row = self.snapshots.get(pair)
+            if row is not None:
+                self.check_price_alerts(pair, row['price'])
+        
+        return success
+    
+    def fetch_alert_ranges(self, pairs):
+        """以一次 /api/v3/ticker 批次請求取得上次檢查以來的最高 / 最低價（成交串流涵蓋的交易對除外）"""
+        now = time.time()
+        last, self.last_range_check = self.last_range_check, now
+        if last is None:
+            # 第一輪沒有上次檢查的時間，不回頭判斷更早的插針
+            return
+        pairs = [pair for pair in pairs if not self.stream_covers_alerts(pair, now * 1000)]
+        if not pairs:
+            return
+        params = {
+            'symbols': json.dumps(pairs, separators=(',', ':')),
+            'windowSize': self.range_window_size(now - last),
+            'type': 'MINI',
+        }
+        try:
+            tickers = self.endpoint_pool.get_json('/api/v3/ticker', params)
+        except Exception as e:
+            print(f"⚠️ 無法取得期間高低點，本輪只檢查取樣價格: {e}")
+            return
+        for ticker in tickers:
+            self.merge_alert_range(ticker['symbol'], float(ticker['highPrice']), float(ticker['lowPrice']))
+    
+    def range_window_size(self, seconds):
+        """
+        換算成 /api/v3/ticker 的 windowSize
+        視窗以分鐘為單位無條件進位，可能多涵蓋上次檢查前不到一分鐘，已觸發的警報不會因此重複通知
+        """
+        minutes = max(1, math.ceil(seconds / 60))
+        if minutes < 60:
+            return f"{minutes}m"
+        hours = math.ceil(minutes / 60)
+        if hours < 24:
+            return f"{hours}h"
+        return f"{min(7, math.ceil(hours / 24))}d"
+    
+    def stream_covers_alerts(self, pair, now_ms):
+        """成交串流最近一分鐘內仍有這個交易對的 K 線時，插針由 on_alert_bar 即時處理"""
+        if self.bar_stream is None or self.alert_resolution is None or pair not in self.bar_stream.symbols:
+            return False
+        bar = self.bar_aggregator.get_current(pair, self.alert_resolution)
+        if bar is None:
+            buffer = self.bar_aggregator.get_buffer(pair, self.alert_resolution)
+            bar = buffer[-1] if buffer else None
+        return bar is not None and bar.open_time >= now_ms - 60 * 1000
 
     def get_current_crypto_price(self):
-        """只獲取當前選擇的加密貨幣價格 - 節省網路資源"""
+        """只獲取當前顯示（與衍生序列）需要的加密貨幣價格 - 節省網路資源"""
         if not self.trading_pairs:
             return False
             
-        current_pair = self.trading_pairs[self.current_crypto_index]
+        pairs = self.get_fetch_pairs()
+        
+        # 分片模式：顯示中的交易對已由工作程序推送
+        if self.sharded_feed is not None and self.sharded_feed.covers('spot', pairs):
+            return all(pair in self.crypto_data for pair in pairs)
         
         try:
-            print(f"🔄 正在獲取 {current_pair} 的價格...")
-            
-            # 只獲取當前選擇的交易對的24小時價格統計
-            url = f"https://api.binance.com/api/v3/ticker/24hr?symbol={current_pair}"
-            response = requests.get(url, timeout=10)
-            response.raise_for_status()
-            
-            data = response.json()
-            
-            # 更新當前加密貨幣的資料
-            current_price = float(data['lastPrice'])
-            self.crypto_data[current_pair] = {
-                'price': current_price,
-                'change_24h': float(data['priceChangePercent']),
-                'high_24h': float(data['highPrice']),
-                'low_24h': float(data['lowPrice']),
-                'volume': float(data['volume'])
-            }
+            print(f"🔄 正在獲取 {', '.join(pairs)} 的價格...")
+            
+            # 客戶端模式：從本地價格伺服器取得，不直接連線幣安
+            if self.price_client is not None:
+                self.price_client.start(self.get_price_client_symbols())
+                self.store_rows(self.price_client.get_snapshot(pairs))
+                return all(pair in self.crypto_data for pair in pairs)
+            
+            # 滾動視窗已涵蓋的交易對直接由 1m K 線計算，其餘的才請求 /ticker/24hr
+            rolling = self.get_rolling_rows(pairs)
+            if rolling:
+                self.store_rows(rolling)
+                pairs = [pair for pair in pairs if pair not in rolling]
+                if not pairs:
+                    print(f"📐 {len(rolling)} 個交易對的 24h 統計由本地滾動視窗提供")
+                    return True
+            
+            # 只獲取顯示中的交易對的24小時價格統計，多個交易對合併成一次請求
+            if len(pairs) == 1:
+                params = {'symbol': pairs[0]}
+            else:
+                params = {'symbols': json.dumps(pairs, separators=(',', ':'))}
+            payload = self.endpoint_pool.get_json('/api/v3/ticker/24hr', params, raw=True)
             
-            print(f"✅ 成功獲取 {current_pair} 的價格")
+            # 直接從回應位元組取出需要的欄位寫入價格表
+            stored = set(self.store_decoded(self.ticker_decoder.decode(payload)))
+            
+            missing = [pair for pair in pairs if pair not in stored]
+            if missing:
+                print(f"⚠️ 回應中缺少 {', '.join(missing)} 的價格")
+                return False
+            print(f"✅ 成功獲取 {len(stored)} 個交易對的價格")
             return True
             
         except requests.exceptions.RequestException as e:
@@ -587,127 +1006,263 @@ class CryptoMenuBarMonitor(rumps.App):
             print(f"❌ 獲取價格時發生錯誤: {e}")
             return False
     
+    def store_decoded(self, rows):
+        """寫入選擇性解碼器產生的 (交易對, 欄位值) 序列，回傳更新的交易對"""
+        symbols = self.crypto_data.update_values(rows)
+        self.on_rows_stored(symbols)
+        return symbols
+    
+    def store_rows(self, rows):
+        """批次寫入多個交易對的價格資料：rows 為 交易對 → 資料列"""
+        self.crypto_data.update_rows(rows)
+        self.on_rows_stored(list(rows))
+    
+    def store_row(self, symbol, row):
+        """寫入單一交易對的價格資料"""
+        self.crypto_data[symbol] = row
+        self.on_rows_stored([symbol])
+    
+    def on_rows_stored(self, symbols):
+        """價格寫入後發布新快照，由訂閱者各自處理"""
+        data = self.crypto_data
+        self.snapshots.publish({symbol: data[symbol] for symbol in symbols if symbol in data})
+    
+    def setup_subscribers(self):
+        """向快照匯流排註冊各元件，每個訂閱者在自己的執行緒中只收到關注的變更"""
+        self.snapshots.subscribe(
+            'display', lambda version, changes: self.update_display(),
+            symbols=lambda: set(self.get_display_pairs()),
+        )
+        self.snapshots.subscribe('alerts', self.on_alert_prices, symbols=self.get_alert_symbols)
+        if self.portfolio_enabled:
+            self.snapshots.subscribe('portfolio', self.on_portfolio_prices)
+        if self.derived_graph is not None:
+            self.snapshots.subscribe(
+                'derived',
+                lambda version, changes: self.update_derived({symbol: row['price'] for symbol, row in changes.items()}),
+                symbols=self.derived_graph.spot_legs(),
+            )
+        if self.shared_prices is not None:
+            self.snapshots.subscribe(
+                'shared_memory', lambda version, changes: self.shared_prices.update_many(changes)
+            )
+        if isinstance(self.binance_client, PaperTradingClient):
+            # 模擬交易的掛單依最新價格撮合
+            self.snapshots.subscribe('paper_trading', lambda version, changes: self.binance_client.on_prices(changes))
+        if self.automation is not None:
+            # 自動下單在自己的執行緒中直接下單，並收到價格寫入時間以量測送出延遲
+            self.snapshots.subscribe(
+                'automation', self.automation.on_prices, symbols=self.automation.get_symbols, timed=True
+            )
+    
+    def get_alert_symbols(self):
+        """警報訂閱者關注的交易對（分片模式由工作程序自行判斷）"""
+        if not self.price_alert_enabled:
+            return ()
+        if self.sharded_feed is not None and self.sharded_feed.covers('spot', self.get_exchange_alert_pairs()):
+            return ()
+        return self.alert_thresholds.keys()
+    
+    def get_exchange_alert_pairs(self):
+        """設定了警報的幣安交易對（不含衍生序列名稱）"""
+        return [pair for pair in self.alert_thresholds if pair not in self.derived_series]
+    
+    def get_automation_thresholds(self):
+        """給自動下單的警報閾值：衍生序列不是可下單的交易對，忽略其上的 on_high / on_low"""
+        for name in self.derived_series:
+            thresholds = self.alert_thresholds.get(name, {})
+            for trigger in ('high', 'low'):
+                if thresholds.get(f"on_{trigger}"):
+                    print(f"⚠️ 忽略 {name} on_{trigger} 自動下單設定：衍生序列無法下單")
+        return {pair: self.alert_thresholds[pair] for pair in self.get_exchange_alert_pairs()}
+    
+    def on_alert_prices(self, version, changes):
+        """警報訂閱者：檢查有變更的交易對"""
+        for symbol, row in changes.items():
+            self.check_price_alerts(symbol, row['price'])
+    
+    def on_portfolio_prices(self, version, changes):
+        """投資組合訂閱者：只重新計算受影響的資產"""
+        affected = False
+        for symbol, row in changes.items():
+            affected = self.portfolio.on_price(symbol, row['price']) or affected
+        if affected:
+            self.renderer.stage({'equity_menu': self.format_equity_menu()})
+    
+    def setup_renderer(self):
+        """建立選單渲染器與主執行緒的刷新計時器"""
+        display_config = self.config.get('display', {})
+        max_fps = max(0.2, float(display_config.get('max_fps', 4)))
+        self.renderer = MenuRenderer({
+            'title': self,
+            'price_menu': self.price_menu,
+            'detail_price': self.detail_price,
+            'detail_change': self.detail_change,
+            'detail_high': self.detail_high,
+            'detail_low': self.detail_low,
+            'detail_volume': self.detail_volume,
+            'detail_spread': self.detail_spread,
+            'detail_time': self.detail_time,
+        })
+        if self.portfolio_enabled:
+            self.renderer.add_target('equity_menu', self.equity_menu)
+        for name, item in self.detail_windows.items():
+            self.renderer.add_target(f'detail_window_{name}', item)
+        self.render_timer = rumps.Timer(self.renderer.flush, 1.0 / max_fps)
+        self.render_timer.start()
+        
+        # 輪播計時器與抓取頻率無關，每秒檢查一次是否該換下一組
+        self.ticker_timer = rumps.Timer(self.rotate_ticker, 1)
+        self.ticker_timer.start()
+    
     def update_display(self):
-        """更新選單欄顯示"""
+        """更新選單欄顯示（只排入有變更的文字，實際套用由渲染計時器處理）"""
         current_pair = self.trading_pairs[self.current_crypto_index]
         
+        if self.portfolio_enabled:
+            self.renderer.stage({'equity_menu': self.format_equity_menu()})
+        
         if current_pair not in self.crypto_data:
-            self.title = "⚡"
-            self.price_menu.title = "⏳ 載入中..."
+            title = self.build_ticker_title() if self.ticker_mode != "single" else "⚡"
+            self.renderer.stage({'title': self.decorate_title(title), 'price_menu': "⏳ 載入中..."})
             return
         
         data = self.crypto_data[current_pair]
         symbol = self.get_crypto_symbol(current_pair)
         name = self.get_crypto_name(current_pair)
         
-        # 格式化價格 - 根據顯示模式使用不同格式
-        price = data['price']
-        
-        # 為簡潔模式和完整模式提供更詳細的價格顯示
-        if self.display_mode in ["compact", "full"]:
-            # 簡潔模式和完整模式：顯示完整數字和小數點
-            if price >= 1000:
-                price_str = f"${price:,.2f}"  # 如 $67,234.56
-            elif price >= 1:
-                price_str = f"${price:.2f}"   # 如 $123.45
-            elif price >= 0.0001:
-                price_str = f"${price:.4f}"   # 如 $0.1234
-            else:
-                price_str = f"${price:.6f}"   # 如 $0.000123
-        else:
-            # 僅符號模式：使用簡化格式節省空間
-            if price >= 1000000:
-                price_str = f"${price/1000000:.1f}M"
-            elif price >= 1000:
-                price_str = f"${price/1000:.0f}K"
-            elif price >= 1:
-                price_str = f"${price:.0f}"
-            else:
-                price_str = f"${price:.4f}"
+        # 格式化價格 - 根據顯示模式使用不同格式（結果依價格快取）
+        price_str = format_price(data['price'], self.display_mode)
         
         # 漲跌狀態
-        change_24h = data['change_24h']
-        if change_24h > 0:
-            change_emoji = "🟢"
-            change_str = f"+{change_24h:.2f}%"
-        elif change_24h < 0:
-            change_emoji = "🔴"
-            change_str = f"{change_24h:.2f}%"
-        else:
-            change_emoji = "⚪"
-            change_str = "0.00%"
+        change_emoji, change_str = format_change(data['change_24h'])
         
         # 根據顯示模式更新選單欄標題
-        if self.display_mode == "symbol_only":
-            self.title = symbol
-        elif self.display_mode == "compact":
-            self.title = f"{symbol} {price_str}"
-        else:  # full mode
-            self.title = f"{symbol} {price_str} {change_str}"
+        if self.ticker_mode == "single":
+            title = self.format_pair_title(current_pair, data)
+        else:
+            title = self.build_ticker_title()
         
         # 更新詳細資訊選單項目 - 使用緊湊的格式避免被截斷
-        detail_info = f"📊 {symbol} {name} | 💰 {price_str} | {change_emoji} {change_str} | 🔄 {datetime.now().strftime('%H:%M:%S')}"
-        self.price_menu.title = detail_info
-        
-        # 更新詳細資訊子選單
         current_time = datetime.now().strftime('%H:%M:%S')
-        self.detail_price.title = f"💰 現價：{price_str}"
-        self.detail_change.title = f"📊 24h 變化：{change_str}"
-        self.detail_high.title = f"⬆️ 24h 最高：${data['high_24h']:,.2f}"
-        self.detail_low.title = f"⬇️ 24h 最低：${data['low_24h']:,.2f}"
-        self.detail_volume.title = f"📈 成交量：{self.format_volume(data['volume'])}"
-        self.detail_time.title = f"🔄 更新時間：{current_time}"
+        updates = {
+            'title': self.decorate_title(title),
+            'price_menu': f"📊 {symbol} {name} | 💰 {price_str} | {change_emoji} {change_str} | 🔄 {current_time}",
+            'detail_price': f"💰 現價：{price_str}",
+            'detail_change': f"📊 24h 變化：{change_str}",
+            'detail_high': f"⬆️ 24h 最高：${data['high_24h']:,.2f}",
+            'detail_low': f"⬇️ 24h 最低：${data['low_24h']:,.2f}",
+            'detail_volume': f"📈 成交量：{self.format_volume(data['volume'])}",
+            'detail_time': f"🔄 更新時間：{current_time}",
+        }
+        if self.detail_windows:
+            updates.update(self.format_window_stats(current_pair))
+        if self.mark_monitor is not None:
+            updates['detail_mark'] = self.format_mark_price(current_pair)
+        self.renderer.stage(updates)
+    
+    def format_window_stats(self, pair):
+        """自訂滾動視窗的詳細資訊文字"""
+        if self.rolling_stats is None:
+            return {}
+        current = self.bar_aggregator.get_current(pair, '1m')
+        updates = {}
+        for name in self.detail_windows:
+            stats = self.rolling_stats.get(pair, name, current)
+            if stats is None:
+                updates[f'detail_window_{name}'] = f"⏱️ {name}：載入中..."
+                continue
+            change_str = format_change(stats['change'])[1]
+            updates[f'detail_window_{name}'] = (
+                f"⏱️ {name}：{change_str} | 高 ${stats['high']:,.2f} | 低 ${stats['low']:,.2f}"
+            )
+        return updates
     
     def format_volume(self, volume):
         """格式化成交量顯示"""
-        if volume >= 1000000000:
-            return f"{volume/1000000000:.2f}B"
-        elif volume >= 1000000:
-            return f"{volume/1000000:.2f}M"
-        elif volume >= 1000:
-            return f"{volume/1000:.2f}K"
-        else:
-            return f"{volume:.2f}"
+        return format_volume(volume)
+    
+    def decorate_title(self, title):
+        """在選單欄標題後附加總資產"""
+        if self.portfolio_enabled and self.portfolio_in_title and self.portfolio.loaded_at:
+            return f"{title}  💼 ${self.portfolio.equity:,.0f}"
+        return title
+    
+    def format_equity_menu(self):
+        """總資產選單項目文字"""
+        if not self.portfolio.loaded_at:
+            return "💼 總資產：載入中..."
+        drawdown = self.portfolio.drawdown_percentage()
+        pnl = self.portfolio.unrealized_total
+        return (
+            f"💼 總資產：${self.portfolio.equity:,.2f} | "
+            f"未實現盈虧 {pnl:+,.2f} | 回撤 {drawdown:.2f}%"
+        )
     
     def price_update_worker(self):
         """背景執行緒持續更新價格"""
         print("🔄 價格更新執行緒已啟動")
+        consecutive_failures = 0
         while self.running:
             try:
                 # 更新當前顯示的加密貨幣價格
-                if self.get_current_crypto_price():
+                display_ok = self.get_current_crypto_price()
+                if display_ok:
                     # 直接在背景執行緒中更新顯示（rumps 是執行緒安全的）
                     self.update_display()
                 else:
                     print("⚠️ 顯示價格更新失敗")
                 
+                # 更新投資組合估值
+                if self.update_portfolio():
+                    self.update_display()
+                
                 # 檢查所有設定了警報的交易對
-                self.get_prices_for_alerts()
+                alerts_ok = self.get_prices_for_alerts()
                 
-                # 等待指定間隔
-                for _ in range(self.update_interval):
-                    if not self.running:
-                        return
-                    time.sleep(1)
+                if display_ok and alerts_ok:
+                    consecutive_failures = 0
+                    delay = self.update_interval
+                else:
+                    consecutive_failures += 1
                     
             except Exception as e:
                 print(f"❌ 價格更新執行緒發生錯誤: {e}")
-                for _ in range(30):
-                    if not self.running:
-                        return
-                    time.sleep(1)
+                consecutive_failures += 1
+            
+            if consecutive_failures:
+                # 失敗時以約 1 秒起跳的指數退避加抖動提早重試，最長不超過更新間隔；
+                # 斷路器開啟時本來就會立即失敗，但限流的 Retry-After 與所有斷路器的冷卻期間內不重試
+                delay = max(1.0, backoff_delay(consecutive_failures - 1, base=1.0, cap=self.update_interval))
+                delay = max(delay, self.endpoint_pool.next_request_delay())
+                print(f"⏳ {delay:.1f} 秒後重試（連續失敗 {consecutive_failures} 次）")
+            
+            if not self.sleep_while_running(delay):
+                break
         
         print("🛑 價格更新執行緒已停止")
     
+    def sleep_while_running(self, seconds):
+        """分段等待，應用程式結束時提早返回 False"""
+        deadline = time.monotonic() + seconds
+        while self.running:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return True
+            time.sleep(min(remaining, 0.5))
+        return False
+    
     def start_price_updates(self):
-        """啟動價格更新執行緒"""
+        """啟動價格更新迴圈"""
         print("🚀 正在啟動價格更新執行緒...")
-        self.update_thread = threading.Thread(target=self.price_update_worker, daemon=True)
-        self.update_thread.start()
+        self.update_future = self.executor.submit(self.price_update_worker, key='price_updates')
         
         # 立即執行一次更新
-        initial_update_thread = threading.Thread(target=self.initial_update, daemon=True)
-        initial_update_thread.start()
+        self.request_refresh()
+    
+    def request_refresh(self):
+        """排入一次價格更新；相同交易對的更新還在進行中時共用同一個任務"""
+        return self.executor.submit(self.initial_update, key=('refresh', tuple(self.get_display_pairs())))
     
     def initial_update(self):
         """初始價格更新"""
@@ -719,10 +1274,82 @@ class CryptoMenuBarMonitor(rumps.App):
     def manual_refresh(self, sender):
         """手動重新整理"""
         print("🔄 手動重新整理價格...")
-        def refresh_with_alerts():
-            self.initial_update()
-        refresh_thread = threading.Thread(target=refresh_with_alerts, daemon=True)
-        refresh_thread.start()
+        self.request_refresh()
+    
+    def on_breaker_state_change(self, host, old_state, new_state):
+        """斷路器狀態變更時記錄主機的停用與恢復"""
+        if new_state == 'open':
+            print(f"🔴 {host} 暫停使用，等待冷卻後再探測")
+        elif new_state == 'closed' and old_state == 'half_open':
+            print(f"🟢 {host} 已恢復")
+    
+    def show_connection_status(self, sender):
+        """顯示各幣安主機的延遲、錯誤率與斷路器狀態"""
+        state_icons = {'closed': '🟢', 'half_open': '🟡', 'open': '🔴'}
+        lines = []
+        for host, status in self.endpoint_pool.get_status().items():
+            line = (
+                f"{state_icons.get(status['breaker'], '⚪')} {host.replace('https://', '')}\n"
+                f"  延遲: {status['latency_ms']:.0f} ms | 錯誤率: {status['error_rate'] * 100:.0f}%"
+                f" | 請求: {status['requests']}"
+            )
+            if status['breaker'] == 'open':
+                line += f" | {status['reopen_in']:.0f} 秒後重試"
+            lines.append(line)
+        lines.append(f"\n🪁 對沖請求: {self.endpoint_pool.hedges_sent} 次")
+        if self.bar_stream is not None:
+            status = self.bar_stream.get_status()
+            lines.append(
+                f"🕯️ 成交串流: {status['symbols']} 個交易對 | 積壓 {status['backlog']} 筆"
+                f" | 延遲 {status['lag_ms']:.0f} ms | 已處理 {status['processed']:,} 筆"
+            )
+        if self.history is not None:
+            status = self.history.get_status()
+            lines.append(
+                f"🗄️ 歷史紀錄: {status['records']:,} 筆 | 已寫入 {status['bytes_written'] / 1e6:,.1f} MB"
+                f" | 緩衝 {status['buffered'] / 1e3:,.0f} KB"
+            )
+        if self.anomaly_detector is not None:
+            status = self.anomaly_detector.get_stats()
+            lines.append(
+                f"📡 異常偵測: {status['symbols']} 個交易對 | 統計 {status['states']:,} 組"
+                f" | 已處理 {status['bars']:,} 根 K 線 | 異常 {status['hits']} 次"
+            )
+        if self.mark_monitor is not None:
+            status = self.mark_monitor.get_status()
+            lines.append(
+                f"⚡ 標記價格串流: {status['symbols']} 個合約 | 已處理 {status['frames']:,} 批"
+                f" | 延遲 {status['lag_ms']:.0f} ms | 警報評估 {status['eval_ms']:.2f} ms"
+            )
+        stats = self.executor.get_stats()
+        lines.append(
+            f"🧵 背景任務: {stats['active']}/{stats['workers']} 執行中 | 佇列 {stats['queued']} | 排程 {stats['scheduled']}"
+            f" | 合併 {stats['coalesced']} 次 | 等待 {stats['avg_wait_ms']:.0f} ms"
+            f" | 執行 {stats['avg_run_ms']:.0f} ms（最長 {stats['max_run_ms']:.0f} ms）"
+        )
+        bus = self.snapshots.get_stats()
+        lines.append(f"📸 快照版本 {bus['version']:,}（{bus['symbols']} 個交易對）")
+        for name, sub in bus['subscribers'].items():
+            lines.append(
+                f"  📢 {name}: 已派送 {sub['delivered']:,} 次 | 合併 {sub['merged']:,} 筆"
+                f" | 待處理 {sub['pending']} | 延遲 {sub['lag_ms']:.0f} ms"
+            )
+        if self.automation is not None:
+            stats = self.automation.get_stats()
+            mode = "🛑 緊急停止" if stats['killed'] else ("🧪 模擬" if stats['dry_run'] else "🤖 執行中")
+            lines.append(
+                f"{mode} 自動下單: {stats['armed']}/{stats['actions']} 待命 | 成功 {stats['fired']} | 失敗 {stats['failed']}"
+                f" | 今日 {stats['daily_orders']} 筆 {stats['daily_usdt']:,.0f} USDT"
+                f" | 送出延遲 p50 {stats['p50_send_ms']:.2f} ms（最長 {stats['max_send_ms']:.2f} ms）"
+                f" | 回應 {stats['avg_ack_ms']:.0f} ms"
+            )
+        if self.sharded_feed is not None:
+            for index, status in sorted(self.sharded_feed.get_status().items()):
+                lines.append(
+                    f"{'🧩' if status['alive'] else '💀'} 分片 {index}: 已處理 {status['processed']:,} 筆"
+                    f" | 延遲 {status['lag_ms']:.0f} ms"
+                )
+        rumps.alert("🩺 連線狀態", "\n".join(lines))
     
     def show_alert_settings(self, sender):
         """使用 osascript 顯示警報設定對話框，解決焦點問題"""
@@ -812,6 +1439,10 @@ class CryptoMenuBarMonitor(rumps.App):
                 self.alert_triggered[high_key] = False
                 self.alert_triggered[low_key] = False
                 
+                # 自動下單動作改用新的閾值
+                if self.automation is not None:
+                    self.automation.load(self.get_automation_thresholds())
+                
                 # 儲存配置到檔案
                 self.save_alert_config()
                 
@@ -834,23 +1465,196 @@ class CryptoMenuBarMonitor(rumps.App):
                 pass
     
     def save_alert_config(self):
-        """儲存警報配置到檔案"""
-        try:
-            # 讀取現有配置
-            with open('config.json', 'r', encoding='utf-8') as f:
-                config = json.load(f)
+        """排程儲存警報配置，短時間內的多次變更會合併成一次寫入"""
+        with self.config_lock:
+            if self.config_save_timer:
+                self.config_save_timer.cancel()
+            self.config_save_timer = threading.Timer(self.config_save_delay, self.flush_config_save)
+            self.config_save_timer.daemon = True
+            self.config_save_timer.start()
+        print(f"📝 警報配置將在 {self.config_save_delay} 秒後儲存到 config.json")
+    
+    def flush_config_save(self):
+        """立即寫入待儲存的警報配置"""
+        with self.config_lock:
+            if self.config_save_timer is None:
+                return
+            self.config_save_timer.cancel()
+            self.config_save_timer = None
             
-            # 更新警報設定
-            config['alert_thresholds'] = self.alert_thresholds
+            try:
+                # 以檔案目前的內容為基礎，保留其他人在外部修改的欄位
+                try:
+                    config = self.read_config_file()
+                except Exception:
+                    config = dict(self.config)
+                
+                # 更新警報設定
+                config['alert_thresholds'] = self.alert_thresholds
+                self.write_config_atomic(config)
+                
+                print("📄 警報配置已儲存到 config.json")
             
-            # 寫入檔案
-            with open('config.json', 'w', encoding='utf-8') as f:
+            except Exception as e:
+                print(f"⚠️ 儲存警報配置失敗: {e}")
+    
+    def write_config_atomic(self, config):
+        """先寫入暫存檔再重新命名，避免當機時留下被截斷的 config.json"""
+        config_path = os.path.abspath(self.config_path)
+        fd, temp_path = tempfile.mkstemp(
+            prefix='.config.', suffix='.tmp', dir=os.path.dirname(config_path)
+        )
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
                 json.dump(config, f, indent=4, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            if os.path.exists(config_path):
+                shutil.copymode(config_path, temp_path)
+            os.replace(temp_path, config_path)
+        except Exception:
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
+            raise
+    
+    # ==================== 配置熱重載 ====================
+    
+    def start_config_watcher(self):
+        """啟動配置檔案監看迴圈"""
+        self.executor.submit(self.config_watch_worker, key='config_watcher')
+    
+    def config_watch_worker(self):
+        """定期檢查 config.json 是否被修改"""
+        print("👀 配置監看執行緒已啟動")
+        while self.running:
+            time.sleep(self.config_watch_interval)
             
-            print("📄 警報配置已儲存到 config.json")
+            mtime = self.get_config_mtime()
+            if mtime is None or mtime == self.config_mtime:
+                continue
+            self.config_mtime = mtime
             
+            try:
+                if self.reload_config():
+                    self.update_display()
+            except Exception as e:
+                print(f"❌ 套用配置變更時發生錯誤: {e}")
+    
+    def diff_config(self, old_config, new_config):
+        """比較新舊配置，回傳有變更的頂層欄位"""
+        keys = set(old_config) | set(new_config)
+        return {key for key in keys if old_config.get(key) != new_config.get(key)}
+    
+    def reload_config(self):
+        """重新讀取 config.json，只套用有變更的部分"""
+        try:
+            new_config = self.read_config_file()
         except Exception as e:
-            print(f"⚠️ 儲存警報配置失敗: {e}")
+            print(f"⚠️ 重新載入配置失敗，保留目前設定: {e}")
+            return False
+        
+        if not new_config.get('trading_pairs'):
+            print("⚠️ 新配置中沒有交易對，忽略這次變更")
+            return False
+        
+        with self.config_lock:
+            changed = self.diff_config(self.config, new_config)
+            if not changed:
+                return False
+            
+            old_pairs = list(self.trading_pairs)
+            old_thresholds = self.alert_thresholds
+            old_alert_enabled = self.price_alert_enabled
+            current_pair = old_pairs[self.current_crypto_index]
+            self.apply_config(new_config)
+        
+        print(f"🔄 偵測到配置變更：{', '.join(sorted(changed))}")
+        
+        if 'trading_pairs' in changed:
+            self.apply_trading_pairs_change(old_pairs, current_pair)
+        
+        if 'alert_thresholds' in changed or 'price_alert_enabled' in changed:
+            self.rebuild_alert_state(old_thresholds, old_alert_enabled)
+        
+        if self.automation is not None and changed & {'alert_thresholds', 'automation'}:
+            self.reload_automation()
+        
+        if self.sharded_feed is not None and changed & {'alert_thresholds', 'price_alert_enabled', 'alert_cooldown'}:
+            self.sharded_feed.update_thresholds(*self.get_shard_thresholds())
+        
+        if 'bars' in changed or 'trading_pairs' in changed:
+            self.update_bar_subscriptions()
+        
+        if 'display' in changed or 'trading_pairs' in changed:
+            self.apply_display_config()
+            self.renderer.call_soon(self.update_ticker_states)
+        
+        if 'update_interval' in changed:
+            print(f"⏰ 更新間隔已變更為 {self.update_interval} 秒（下一輪生效）")
+        
+        if 'alert_cooldown' in changed:
+            print(f"⏰ 警報冷卻時間已變更為 {self.alert_cooldown} 秒")
+        
+        if 'binance_api' in changed:
+            print("⚠️ binance_api 設定變更需要重新啟動應用程式才會生效")
+        
+        if self.mark_monitor is not None and 'mark_price' in changed:
+            self.mark_monitor.update_thresholds(**self.get_mark_thresholds())
+            print("⚡ 資金費率與基差警報閾值已更新")
+        
+        if 'derived' in changed:
+            print("⚠️ derived 設定變更需要重新啟動應用程式才會生效")
+        
+        if 'history' in changed:
+            print("⚠️ history 設定變更需要重新啟動應用程式才會生效")
+        
+        if 'anomaly' in changed:
+            print("⚠️ anomaly 設定變更需要重新啟動應用程式才會生效（cooldown 立即生效）")
+        
+        if 'rolling_stats' in changed:
+            print("⚠️ rolling_stats 設定變更需要重新啟動應用程式才會生效")
+        
+        return True
+    
+    def apply_trading_pairs_change(self, old_pairs, current_pair):
+        """套用交易對清單變更，保留仍在監控中的交易對資料"""
+        added = [pair for pair in self.trading_pairs if pair not in old_pairs]
+        removed = [pair for pair in old_pairs if pair not in self.trading_pairs]
+        
+        for pair in removed:
+            self.crypto_data.pop(pair, None)
+        
+        # 盡量維持原本選擇的交易對
+        if current_pair in self.trading_pairs:
+            self.current_crypto_index = self.trading_pairs.index(current_pair)
+        else:
+            self.current_crypto_index = 0
+        
+        # 由設定監看執行緒呼叫：選單只能在主執行緒修改，交給渲染計時器重建
+        self.renderer.call_soon(self.rebuild_crypto_submenu)
+        self.follow_selected_order_book()
+        
+        if added:
+            print(f"➕ 新增交易對：{', '.join(added)}")
+        if removed:
+            print(f"➖ 移除交易對：{', '.join(removed)}")
+    
+    def rebuild_alert_state(self, old_thresholds, old_alert_enabled):
+        """重設閾值有變更的交易對的警報狀態"""
+        if self.price_alert_enabled != old_alert_enabled:
+            status = "已啟用" if self.price_alert_enabled else "已停用"
+            print(f"🚨 價格警報{status}")
+        
+        pairs = set(old_thresholds) | set(self.alert_thresholds)
+        for pair in pairs:
+            if old_thresholds.get(pair) == self.alert_thresholds.get(pair):
+                continue
+            self.alert_triggered.pop(f"{pair}_high", None)
+            self.alert_triggered.pop(f"{pair}_low", None)
+            self.alert_ranges.pop(pair, None)
+            print(f"🔁 {pair} 的警報閾值已更新")
     
     def test_notification(self, sender):
         """測試通知功能"""
@@ -869,6 +1673,11 @@ class CryptoMenuBarMonitor(rumps.App):
         """立即檢查所有警報"""
         print("⚡ 立即檢查所有價格警報...")
         self.get_prices_for_alerts()
+        # 價格沒有變更時不會產生事件，這裡直接以目前快照再檢查一次
+        for pair in list(self.get_alert_symbols()):
+            row = self.snapshots.get(pair)
+            if row is not None:
+                self.check_price_alerts(pair, row['price'])
         rumps.alert("✅ 完成", "已完成立即警報檢查，請查看終端輸出了解詳情。")
     
     # ==================== 交易功能方法 ====================
@@ -1026,8 +1835,8 @@ class CryptoMenuBarMonitor(rumps.App):
             except:
                 return {'confirmed': False}
     
-    def execute_order(self, params):
-        """執行訂單"""
+    def execute_order(self, params, interactive=True):
+        """執行訂單；interactive 為 False 時（自動下單）失敗直接拋出例外，不顯示對話框"""
         try:
             symbol = params['symbol']
             order_type = params['order_type']
@@ -1052,14 +1861,25 @@ class CryptoMenuBarMonitor(rumps.App):
             else:
                 raise Exception("未知的訂單類型")
             
-            # 設定止盈止損
+            # 設定止盈止損：失敗時主訂單已成交，標記在結果中讓呼叫端知道沒有保護單
             if result and (params['stop_loss']['enabled'] or params['take_profit']['enabled']):
-                self.set_stop_loss_take_profit(result, params)
+                try:
+                    self.set_stop_loss_take_profit(result, params)
+                except Exception as e:
+                    print(f"⚠️ 設定止盈止損失敗: {e}")
+                    result['protection_error'] = str(e)
+                    if interactive:
+                        rumps.alert(
+                            "⚠️ 止盈止損設定失敗",
+                            f"訂單 #{result.get('orderId', '?')} 已成交，但止盈止損沒有掛上，請手動設定：\n{e}"
+                        )
             
             return result
             
         except Exception as e:
             print(f"❌ 執行訂單失敗: {e}")
+            if not interactive:
+                raise
             rumps.alert("交易失敗", str(e))
             return None
     
@@ -1145,12 +1965,10 @@ class CryptoMenuBarMonitor(rumps.App):
         # 設定槓桿
         self.binance_client.futures_change_leverage(symbol=symbol, leverage=leverage)
         
-        # 計算合約數量
-        current_price = self.crypto_data[symbol]['price']
+        # 計算合約數量（使用訂單簿的即時中間價）
+        current_price = self.get_fresh_price(symbol)
         quantity_float = float(quantity)
         contract_quantity = quantity_float / current_price
-        # 格式化數量以符合 Binance API 要求
-        formatted_contract_quantity = f"{contract_quantity:.8f}".rstrip('0').rstrip('.')
         
         if side == 'CLOSE':
             # 平倉：獲取當前持倉
@@ -1167,7 +1985,13 @@ class CryptoMenuBarMonitor(rumps.App):
                     print(f"✅ 合約平倉成功: {order['orderId']}")
                     return order
         else:
-            # 開倉
+            # 開倉：數量依合約的 LOT_SIZE stepSize 無條件捨去
+            step_size, _ = self.get_symbol_filters(symbol, futures=True)
+            formatted_contract_quantity = self.round_to_step(contract_quantity, step_size)
+            if Decimal(formatted_contract_quantity) <= 0:
+                raise Exception(
+                    f"{quantity_float} USDT 換算的合約數量 {contract_quantity:.8f} 低於最小下單單位 {step_size}"
+                )
             order = self.binance_client.futures_create_order(
                 symbol=symbol,
                 side=side,
@@ -1180,50 +2004,129 @@ class CryptoMenuBarMonitor(rumps.App):
         return None
     
     def set_stop_loss_take_profit(self, order, params):
-        """設定止盈止損"""
-        try:
-            if "現貨" in params['order_type']:
-                # 現貨止盈止損 (OCO 訂單)
-                pass  # 需要更複雜的邏輯
-            elif "合約" in params['order_type']:
-                # 合約止盈止損
-                symbol = params['symbol']
-                current_price = self.crypto_data[symbol]['price']
+        """設定止盈止損，失敗時拋出例外"""
+        if "現貨" in params['order_type']:
+            self.set_spot_stop_loss_take_profit(order, params)
+        elif "合約" in params['order_type']:
+            # 合約止盈止損
+            symbol = params['symbol']
+            current_price = self.get_fresh_price(symbol)
+            _, tick_size = self.get_symbol_filters(symbol, futures=True)
+            
+            if params['stop_loss']['enabled']:
+                sl_percentage = params['stop_loss']['percentage']
+                if 'BUY' in order.get('side', ''):
+                    sl_price = current_price * (1 - sl_percentage / 100)
+                else:
+                    sl_price = current_price * (1 + sl_percentage / 100)
+                sl_price = self.round_to_step(sl_price, tick_size, ROUND_HALF_UP)
                 
-                if params['stop_loss']['enabled']:
-                    sl_percentage = params['stop_loss']['percentage']
-                    if 'BUY' in order.get('side', ''):
-                        sl_price = current_price * (1 - sl_percentage / 100)
-                    else:
-                        sl_price = current_price * (1 + sl_percentage / 100)
-                    
-                    self.binance_client.futures_create_order(
-                        symbol=symbol,
-                        side='SELL' if 'BUY' in order.get('side', '') else 'BUY',
-                        type='STOP_MARKET',
-                        stopPrice=sl_price,
-                        closePosition=True
-                    )
-                    print(f"✅ 止損訂單設定成功: {sl_price}")
+                self.binance_client.futures_create_order(
+                    symbol=symbol,
+                    side='SELL' if 'BUY' in order.get('side', '') else 'BUY',
+                    type='STOP_MARKET',
+                    stopPrice=sl_price,
+                    closePosition=True
+                )
+                print(f"✅ 止損訂單設定成功: {sl_price}")
+            
+            if params['take_profit']['enabled']:
+                tp_percentage = params['take_profit']['percentage']
+                if 'BUY' in order.get('side', ''):
+                    tp_price = current_price * (1 + tp_percentage / 100)
+                else:
+                    tp_price = current_price * (1 - tp_percentage / 100)
+                tp_price = self.round_to_step(tp_price, tick_size, ROUND_HALF_UP)
                 
-                if params['take_profit']['enabled']:
-                    tp_percentage = params['take_profit']['percentage']
-                    if 'BUY' in order.get('side', ''):
-                        tp_price = current_price * (1 + tp_percentage / 100)
-                    else:
-                        tp_price = current_price * (1 - tp_percentage / 100)
-                    
-                    self.binance_client.futures_create_order(
-                        symbol=symbol,
-                        side='SELL' if 'BUY' in order.get('side', '') else 'BUY',
-                        type='TAKE_PROFIT_MARKET',
-                        stopPrice=tp_price,
-                        closePosition=True
-                    )
-                    print(f"✅ 止盈訂單設定成功: {tp_price}")
-                    
-        except Exception as e:
-            print(f"⚠️ 設定止盈止損失敗: {e}")
+                self.binance_client.futures_create_order(
+                    symbol=symbol,
+                    side='SELL' if 'BUY' in order.get('side', '') else 'BUY',
+                    type='TAKE_PROFIT_MARKET',
+                    stopPrice=tp_price,
+                    closePosition=True
+                )
+                print(f"✅ 止盈訂單設定成功: {tp_price}")
+    
+    def get_symbol_filters(self, symbol, futures=False):
+        """回傳交易對下單規則的 (stepSize, tickSize) 字串，從 exchangeInfo 取得後快取"""
+        market = 'futures' if futures and hasattr(self.binance_client, 'futures_exchange_info') else 'spot'
+        cached = self.symbol_filters.get((market, symbol))
+        if cached is not None:
+            return cached
+        if market == 'futures':
+            symbols = self.binance_client.futures_exchange_info()['symbols']
+        else:
+            symbols = self.endpoint_pool.get_json('/api/v3/exchangeInfo', {'symbol': symbol})['symbols']
+        for info in symbols:
+            filters = {item['filterType']: item for item in info.get('filters', [])}
+            if 'LOT_SIZE' in filters and 'PRICE_FILTER' in filters:
+                self.symbol_filters[(market, info['symbol'])] = (
+                    filters['LOT_SIZE']['stepSize'], filters['PRICE_FILTER']['tickSize']
+                )
+        if (market, symbol) not in self.symbol_filters:
+            raise Exception(f"找不到 {symbol} 的下單規則")
+        return self.symbol_filters[(market, symbol)]
+    
+    def round_to_step(self, value, step, rounding=ROUND_DOWN):
+        """依 stepSize / tickSize 取整，回傳幣安接受的十進位字串"""
+        step = Decimal(step)
+        if step <= 0:
+            return f"{value:.8f}".rstrip('0').rstrip('.')
+        rounded = (Decimal(repr(value)) / step).to_integral_value(rounding) * step
+        return format(rounded.normalize(), 'f')
+    
+    def set_spot_stop_loss_take_profit(self, order, params):
+        """現貨買入成交後，以成交均價掛出止損 / 止盈賣單（兩者都有時使用 OCO 訂單）"""
+        if order.get('side') != 'BUY' or float(order.get('executedQty', 0)) <= 0:
+            return
+        symbol = params['symbol']
+        base_asset = symbol.replace('USDT', '')
+        executed = float(order['executedQty'])
+        entry_price = float(order['cummulativeQuoteQty']) / executed
+        # 以買入幣種支付的手續費不在餘額中
+        fee = sum(float(fill['commission']) for fill in order.get('fills', []) if fill.get('commissionAsset') == base_asset)
+        step_size, tick_size = self.get_symbol_filters(symbol)
+        quantity = self.round_to_step(executed - fee, step_size)
+        if Decimal(quantity) <= 0:
+            raise Exception(f"扣除手續費後的數量 {executed - fee:.8f} 小於最小下單單位 {step_size}")
+        
+        sl_price = tp_price = None
+        if params['stop_loss']['enabled']:
+            sl_price = entry_price * (1 - params['stop_loss']['percentage'] / 100)
+        if params['take_profit']['enabled']:
+            tp_price = entry_price * (1 + params['take_profit']['percentage'] / 100)
+        
+        def fmt(value, rounding=ROUND_HALF_UP):
+            return self.round_to_step(value, tick_size, rounding)
+        
+        if sl_price and tp_price:
+            self.binance_client.order_oco_sell(
+                symbol=symbol,
+                quantity=quantity,
+                price=fmt(tp_price),
+                stopPrice=fmt(sl_price),
+                stopLimitPrice=fmt(sl_price * 0.995, ROUND_DOWN),
+                stopLimitTimeInForce='GTC'
+            )
+            print(f"✅ 止盈止損 OCO 訂單設定成功: 止盈 {fmt(tp_price)} / 止損 {fmt(sl_price)}")
+        elif sl_price:
+            self.binance_client.create_order(
+                symbol=symbol,
+                side='SELL',
+                type='STOP_LOSS_LIMIT',
+                timeInForce='GTC',
+                quantity=quantity,
+                stopPrice=fmt(sl_price),
+                price=fmt(sl_price * 0.995, ROUND_DOWN)
+            )
+            print(f"✅ 止損訂單設定成功: {fmt(sl_price)}")
+        elif tp_price:
+            self.binance_client.order_limit_sell(
+                symbol=symbol,
+                quantity=quantity,
+                price=fmt(tp_price)
+            )
+            print(f"✅ 止盈訂單設定成功: {fmt(tp_price)}")
     
     # ==================== 現貨交易方法 ====================
     
@@ -1246,7 +2149,7 @@ class CryptoMenuBarMonitor(rumps.App):
         result = self.show_trading_dialog("現貨市價", "買入")
         if result.get('confirmed'):
             if self.trading_settings.get('order_confirmation', True):
-                if rumps.alert("確認下單", f"確定要執行現貨市價買入嗎？\n數量: {result['params']['quantity']} USDT", ok="確認", cancel="取消") != 1:
+                if rumps.alert("確認下單", f"確定要執行現貨市價買入嗎？\n數量: {result['params']['quantity']} USDT{self.describe_slippage(result['params']['symbol'], 'BUY', result['params']['quantity'])}", ok="確認", cancel="取消") != 1:
                     return
             self.execute_order(result['params'])
         else:
@@ -1312,7 +2215,7 @@ class CryptoMenuBarMonitor(rumps.App):
         result = self.show_trading_dialog("合約交易", "做多")
         if result['confirmed']:
             if self.trading_settings.get('order_confirmation', True):
-                if rumps.alert("確認下單", f"確定要執行合約做多嗎？\n數量: {result['params']['quantity']} USDT\n槓桿: {result['params']['leverage']}x", ok="確認", cancel="取消") != 1:
+                if rumps.alert("確認下單", f"確定要執行合約做多嗎？\n數量: {result['params']['quantity']} USDT\n槓桿: {result['params']['leverage']}x{self.describe_slippage(result['params']['symbol'], 'BUY', result['params']['quantity'])}", ok="確認", cancel="取消") != 1:
                     return
             self.execute_order(result['params'])
     
@@ -1325,7 +2228,7 @@ class CryptoMenuBarMonitor(rumps.App):
         result = self.show_trading_dialog("合約交易", "做空")
         if result['confirmed']:
             if self.trading_settings.get('order_confirmation', True):
-                if rumps.alert("確認下單", f"確定要執行合約做空嗎？\n數量: {result['params']['quantity']} USDT\n槓桿: {result['params']['leverage']}x", ok="確認", cancel="取消") != 1:
+                if rumps.alert("確認下單", f"確定要執行合約做空嗎？\n數量: {result['params']['quantity']} USDT\n槓桿: {result['params']['leverage']}x{self.describe_slippage(result['params']['symbol'], 'SELL', result['params']['quantity'])}", ok="確認", cancel="取消") != 1:
                     return
             self.execute_order(result['params'])
     
@@ -1342,33 +2245,800 @@ class CryptoMenuBarMonitor(rumps.App):
                     return
             self.execute_order(result['params'])
     
+    # ==================== 本地訂單簿 ====================
+    
+    def get_ws_manager(self):
+        """取得共用的幣安 WebSocket 管理器，第一次使用時才啟動"""
+        if getattr(self, 'ws_manager', None) is None:
+            self.ws_manager = ThreadedWebsocketManager()
+            self.ws_manager.start()
+        return self.ws_manager
+    
+    def setup_order_book(self):
+        """建立訂單簿管理器並開始維護選擇中的交易對"""
+        order_book_config = self.config.get('order_book', {})
+        self.order_books = None
+        self.spread_alert_bps = order_book_config.get('spread_alert_bps')
+        if not BINANCE_AVAILABLE or self.is_client_mode() or not order_book_config.get('enabled', True):
+            return
+        # 滑價估算只需要前幾百檔，limit 100 的權重為 5（1000 檔為 50）
+        depth_limit = order_book_config.get('depth_limit', 100)
+        self.order_books = OrderBookManager(
+            self.get_ws_manager(),
+            fetch_snapshot=lambda symbol: self.endpoint_pool.get_json(
+                '/api/v3/depth', {'symbol': symbol, 'limit': depth_limit}
+            ),
+            executor=self.executor,
+            on_update=self.on_order_book_update,
+            retry_after=self.endpoint_pool.retry_after,
+        )
+        self.follow_selected_order_book()
+    
+    def follow_selected_order_book(self):
+        """訂單簿跟著選擇中的交易對切換"""
+        if self.order_books is None:
+            return
+        current_pair = self.trading_pairs[self.current_crypto_index]
+        try:
+            self.order_books.watch_only([current_pair])
+        except Exception as e:
+            print(f"⚠️ 無法訂閱 {current_pair} 深度串流: {e}")
+    
+    def on_order_book_update(self, symbol, book):
+        """深度串流回呼：更新價差顯示並檢查價差警報"""
+        spread = book.spread()
+        if spread is None:
+            return
+        spread_value, spread_bps = spread
+        if symbol == self.trading_pairs[self.current_crypto_index]:
+            self.renderer.stage({
+                'detail_spread': f"↔️ 買賣價差：{format_price(spread_value, 'full')} ({spread_bps:.1f} bps)"
+            })
+        
+        if self.spread_alert_bps and spread_bps >= self.spread_alert_bps:
+            alert_key = f"{symbol}_spread"
+            current_time = time.time()
+            if current_time - self.last_alert_time.get(alert_key, 0) >= self.alert_cooldown:
+                self.last_alert_time[alert_key] = current_time
+                symbol_icon = self.get_crypto_symbol(symbol)
+                title = f"↔️ {symbol_icon} {symbol} 價差擴大！"
+                message = f"買賣價差 {spread_bps:.1f} bps 已超過設定的 {self.spread_alert_bps} bps"
+                self.send_price_alert(title, message)
+                self.record_alert(symbol, 'spread', title, message)
+    
+    def describe_slippage(self, symbol, side, quote_quantity):
+        """依本地訂單簿估算市價單滑價，產生確認對話框的說明文字"""
+        if self.order_books is None:
+            return ""
+        book = self.order_books.get_book(symbol)
+        if book is None:
+            return ""
+        estimate = book.estimate_market_order(side, quote_quantity=float(quote_quantity))
+        if estimate is None:
+            return ""
+        text = (
+            f"\n預估成交均價: {format_price(estimate['average_price'], 'full')}"
+            f"\n預估滑價: {estimate['slippage_bps']:.2f} bps（吃掉 {estimate['levels']} 檔）"
+        )
+        if estimate['unfilled'] > 0:
+            text += f"\n⚠️ 訂單簿深度不足，約 {estimate['unfilled']:,.2f} USDT 無法在目前深度成交"
+        return text
+    
+    def estimate_paper_fill(self, symbol, side, base_quantity):
+        """模擬交易的市價單成交均價：依本地訂單簿深度估算，深度不足或沒有訂單簿時回傳 None"""
+        if self.order_books is None:
+            return None
+        book = self.order_books.get_book(symbol)
+        if book is None:
+            return None
+        estimate = book.estimate_market_order(side, base_quantity=base_quantity)
+        if estimate is None or estimate['unfilled'] > 0:
+            return None
+        return estimate['average_price']
+    
+    def get_fresh_price(self, symbol):
+        """下單用價格：優先使用訂單簿中間價，沒有時使用最後一次的 ticker 價格"""
+        if self.order_books is not None:
+            book = self.order_books.get_book(symbol)
+            if book is not None:
+                mid = book.mid_price()
+                if mid:
+                    return mid
+        return self.crypto_data[symbol]['price']
+    
+    # ==================== 本地行情歷史 ====================
+    
+    def setup_history(self):
+        """啟用 history 時將成交、K 線與警報事件附加寫入本地歷史，供匯出 Parquet"""
+        self.history_config = self.config.get('history', {})
+        self.history = None
+        if not self.history_config.get('enabled', False):
+            return
+        self.history = HistoryRecorder(
+            self.history_config.get('path', 'history'),
+            flush_interval=self.history_config.get('flush_interval', 1.0),
+        )
+        print(f"🗄️ 本地歷史紀錄寫入 {self.history.root}")
+    
+    def record_alert(self, symbol, kind, title, message):
+        """將已發送的警報寫入本地歷史"""
+        if self.history is not None and self.history_config.get('alerts', True):
+            self.history.record_alert(symbol, kind, title, message)
+    
+    def export_history(self, sender):
+        """選單：在背景匯出上次匯出之後新增的歷史資料"""
+        if not PYARROW_AVAILABLE:
+            rumps.alert("📦 匯出歷史資料", "Parquet 匯出需要 pyarrow，請執行 pip install pyarrow")
+            return
+        self.executor.submit(self.run_history_export, key='history_export')
+    
+    def run_history_export(self):
+        """先寫入緩衝中的紀錄，再以 since-last-run 模式匯出"""
+        self.history.flush()
+        try:
+            exporter = ParquetExporter(self.history.root, self.history_config.get('export_dir', 'export'))
+            stats = exporter.export(since_last_run=True)
+        except Exception as e:
+            print(f"⚠️ 匯出歷史資料失敗: {e}")
+            self.send_price_alert("📦 匯出歷史資料失敗", str(e))
+            return
+        print(f"📦 已匯出 {stats['files']} 個檔案、{stats['rows']:,} 列（{stats['seconds']:.1f} 秒）")
+        self.send_price_alert(
+            "📦 歷史資料已匯出",
+            f"{stats['rows']:,} 列寫入 {exporter.out_dir}（{stats['seconds']:.1f} 秒）",
+        )
+    
+    # ==================== 成交串流 K 線 ====================
+    
+    def setup_bar_stream(self):
+        """建立多週期 K 線聚合器並訂閱監控中交易對的成交串流"""
+        bars_config = self.config.get('bars', {})
+        self.bar_aggregator = TradeAggregator(
+            resolutions=bars_config.get('resolutions'),
+            capacity=bars_config.get('capacity'),
+        )
+        self.bar_stream = None
+        self.rolling_stats = None
+        self.anomaly_detector = None
+        self.alert_resolution = None
+        if not BINANCE_AVAILABLE or self.is_client_mode() or not bars_config.get('enabled', True):
+            return
+        self.setup_rolling_stats()
+        self.setup_anomaly()
+        if self.history is not None:
+            resolutions = [name for name in self.history_config.get('bars', ['1m']) if name in self.bar_aggregator.resolutions]
+            if resolutions:
+                self.bar_aggregator.subscribe(self.history.record_bar, resolutions=resolutions)
+        
+        # 以最細的週期檢查插針：K 線高低點觸及閾值時立即判斷警報
+        self.alert_resolution = next((name for name in ('1s', '1m') if name in self.bar_aggregator.resolutions), None)
+        if self.alert_resolution is not None:
+            self.bar_aggregator.subscribe(self.on_alert_bar, resolutions=[self.alert_resolution])
+        recorder = self.history if self.history is not None and self.history_config.get('trades', True) else None
+        self.bar_stream = AggTradeStream(self.get_ws_manager(), self.bar_aggregator, recorder=recorder)
+        self.update_bar_subscriptions()
+    
+    def on_alert_bar(self, symbol, resolution, bar):
+        """K 線訂閱者：高低點觸及閾值時立即檢查，不必等下一次取樣"""
+        if symbol not in self.get_alert_symbols():
+            return
+        if self.merge_alert_range(symbol, bar.high, bar.low) and self.alert_armed(symbol, bar.high, bar.low):
+            # 通知與自動下單交給執行器，不阻塞成交串流執行緒；已在檢查中時，範圍留給下一次檢查
+            self.executor.submit(self.check_price_alerts, symbol, bar.close, key=('alert_bar', symbol))
+    
+    def alert_armed(self, trading_pair, high, low):
+        """觸及的一側尚未觸發且不在冷卻期時才需要立即檢查；已觸發的警報留給下一次取樣重置"""
+        if time.time() - self.last_alert_time.get(trading_pair, 0) < self.alert_cooldown:
+            return False
+        thresholds = self.alert_thresholds.get(trading_pair, {})
+        if thresholds.get('high') and high >= thresholds['high'] and not self.alert_triggered.get(f"{trading_pair}_high"):
+            return True
+        if thresholds.get('low') and low <= thresholds['low'] and not self.alert_triggered.get(f"{trading_pair}_low"):
+            return True
+        return False
+    
+    def update_bar_subscriptions(self):
+        """依配置更新成交串流訂閱的交易對"""
+        if self.bar_stream is None:
+            return
+        symbols = self.config.get('bars', {}).get('symbols') or self.trading_pairs
+        try:
+            self.bar_stream.start(symbols)
+        except Exception as e:
+            print(f"⚠️ 無法訂閱成交串流: {e}")
+    
+    # ==================== 滾動視窗統計 ====================
+    
+    def setup_rolling_stats(self):
+        """以 1m K 線在本地維護 24h 與自訂視窗的統計，取代輪詢 /ticker/24hr"""
+        if not self.rolling_config.get('enabled', True) or '1m' not in self.bar_aggregator.resolutions:
+            return
+        self.rolling_stats = RollingStats(
+            parse_windows(self.rolling_config.get('windows')),
+            on_seed_needed=self.request_rolling_seed,
+        )
+        self.bar_aggregator.subscribe(self.on_rolling_bar, resolutions=['1m'])
+    
+    def request_rolling_seed(self, symbol):
+        """排入播種工作，同一交易對同時只會有一個"""
+        self.executor.submit(self.seed_rolling_stats, symbol, key=('rolling_seed', symbol))
+    
+    def seed_rolling_stats(self, symbol):
+        """以 REST 1m K 線播種交易對的滾動視窗（每次最多 1000 根，24h 需要兩次請求）"""
+        now_ms = int(time.time() * 1000)
+        cursor = now_ms - self.rolling_stats.max_window
+        bars = []
+        try:
+            while cursor < now_ms:
+                batch = self.endpoint_pool.get_json('/api/v3/klines', {
+                    'symbol': symbol, 'interval': '1m', 'startTime': cursor, 'limit': 1000,
+                })
+                # 收盤時間還沒到的 K 線尚未完成，交給串流
+                bars.extend(
+                    (row[0], float(row[1]), float(row[2]), float(row[3]), float(row[4]), float(row[5]))
+                    for row in batch if row[6] < now_ms
+                )
+                if len(batch) < 1000:
+                    break
+                cursor = batch[-1][0] + 1
+        except Exception as e:
+            # 下一根 K 線完成時會再要求播種
+            print(f"⚠️ 無法播種 {symbol} 的滾動視窗: {e}")
+            return
+        self.rolling_stats.seed(symbol, bars)
+        print(f"📐 {symbol} 的滾動視窗已由 {len(bars)} 根 1m K 線播種")
+        if self.anomaly_detector is not None:
+            self.anomaly_detector.seed(symbol, [Bar(*row, 0) for row in bars])
+        rows = self.get_rolling_rows([symbol])
+        if rows:
+            self.store_rows(rows)
+    
+    def on_rolling_bar(self, symbol, resolution, bar):
+        """K 線訂閱者：更新滾動視窗，並把新的 24h 統計寫入價格表"""
+        self.rolling_stats.on_bar(symbol, resolution, bar)
+        rows = self.get_rolling_rows([symbol])
+        if rows:
+            self.store_rows(rows)
+    
+    def get_rolling_rows(self, pairs):
+        """回傳滾動視窗能涵蓋的交易對資料列：已播種且成交串流仍在更新"""
+        if self.rolling_stats is None:
+            return {}
+        now_ms = time.time() * 1000
+        rows = {}
+        for pair in pairs:
+            current = self.bar_aggregator.get_current(pair, '1m')
+            if not self.rolling_stats.is_fresh(pair, now_ms, current):
+                continue
+            row = self.rolling_stats.get_row(pair, current)
+            if row is not None:
+                rows[pair] = row
+        return rows
+    
+    # ==================== 成交量與波動異常 ====================
+    
+    def setup_anomaly(self):
+        """啟用 anomaly 時以 1m K 線串流統計偵測成交額、報酬與振幅異常"""
+        anomaly_config = self.config.get('anomaly', {})
+        if not anomaly_config.get('enabled', False) or '1m' not in self.bar_aggregator.resolutions:
+            return
+        thresholds = dict(ANOMALY_THRESHOLDS, **anomaly_config.get('thresholds', {}))
+        self.anomaly_detector = AnomalyDetector(
+            thresholds={name: value for name, value in thresholds.items() if value},
+            halflife=anomaly_config.get('halflife', 1440),
+            min_samples=anomaly_config.get('min_samples', 30),
+            hourly=anomaly_config.get('hourly', True),
+        )
+        self.bar_aggregator.subscribe(
+            self.on_anomaly_bar, resolutions=['1m'], symbols=anomaly_config.get('symbols'),
+        )
+        if self.rolling_stats is None:
+            print("📡 異常偵測未啟用滾動視窗播種，需要由即時 K 線暖機")
+    
+    def on_anomaly_bar(self, symbol, resolution, bar):
+        """K 線訂閱者：偵測到異常時依偵測器各自的冷卻時間發送通知"""
+        anomalies = self.anomaly_detector.on_bar(symbol, resolution, bar)
+        if not anomalies:
+            return
+        current_time = time.time()
+        for anomaly in anomalies:
+            alert_key = f"anomaly_{anomaly.detector}_{symbol}"
+            if current_time - self.last_alert_time.get(alert_key, 0) < self.get_anomaly_cooldown(anomaly.detector):
+                continue
+            self.last_alert_time[alert_key] = current_time
+            title, message = describe_anomaly(anomaly)
+            self.executor.submit(self.send_price_alert, title, message)
+            self.record_alert(symbol, f"anomaly_{anomaly.detector}", title, message)
+    
+    def get_anomaly_cooldown(self, detector):
+        """偵測器的冷卻時間：anomaly.cooldown 可以是秒數或 {偵測器: 秒數}，預設沿用 alert_cooldown"""
+        cooldown = self.config.get('anomaly', {}).get('cooldown', self.alert_cooldown)
+        if isinstance(cooldown, dict):
+            return cooldown.get(detector, self.alert_cooldown)
+        return cooldown
+    
+    # ==================== 價格伺服器客戶端 ====================
+    
+    def is_client_mode(self):
+        """設定了 server.url 時為客戶端模式，不自行連線幣安的深度與成交串流"""
+        return bool(self.config.get('server', {}).get('url'))
+    
+    def setup_price_client(self):
+        """config.json 設定 server.url 時，改從本地價格伺服器接收推送"""
+        server_url = self.config.get('server', {}).get('url')
+        self.price_client = None
+        if not server_url:
+            return
+        self.price_client = PriceServerClient(server_url, self.on_price_server_update)
+        self.price_client.start(self.get_price_client_symbols())
+        print(f"🖥️ 客戶端模式：價格來自 {server_url}（訂單簿、K 線與滾動統計已停用）")
+    
+    def get_price_client_symbols(self):
+        """要向價格伺服器訂閱的交易對：顯示中的交易對加上有設定警報的交易對"""
+        symbols = self.get_display_pairs()
+        if self.price_alert_enabled:
+            symbols += [pair for pair in self.get_exchange_alert_pairs() if pair not in symbols]
+        return symbols
+    
+    def on_price_server_update(self, rows):
+        """價格伺服器推送變更：寫入後由顯示與警報訂閱者處理"""
+        self.store_rows(rows)
+    
+    # ==================== 全市場異動掃描 ====================
+    
+    def build_scanner_menu(self):
+        """建立「🔥 異動」子選單，每個排行有固定數量的項目"""
+        top_k = self.scanner_config.get('top_k', 5)
+        self.scanner_submenu = rumps.MenuItem("🔥 異動")
+        self.scanner_status = rumps.MenuItem("🔍 掃描中...", callback=None)
+        self.scanner_submenu.add(self.scanner_status)
+        self.scanner_slots = {}
+        for category, title in SCANNER_CATEGORIES.items():
+            self.scanner_submenu.add(rumps.separator)
+            self.scanner_submenu.add(rumps.MenuItem(title, callback=None))
+            for i in range(top_k):
+                item = rumps.MenuItem(f"{i + 1}. —", callback=None)
+                self.scanner_slots[f"scanner_{category}_{i}"] = item
+                self.scanner_submenu.add(item)
+        self.menu.add(self.scanner_submenu)
+    
+    def setup_scanner(self):
+        """啟用 scanner 時訂閱全市場行情並維護異動排行"""
+        self.scanner = None
+        if not self.scanner_config.get('enabled', False):
+            return
+        self.renderer.add_target('scanner_status', self.scanner_status)
+        for name, item in self.scanner_slots.items():
+            self.renderer.add_target(name, item)
+        self.scanner = MarketScanner(
+            self.on_scanner_update,
+            k=self.scanner_config.get('top_k', 5),
+            quote=self.scanner_config.get('quote', 'USDT'),
+            min_quote_volume=self.scanner_config.get('min_quote_volume', 1000000),
+            spike_window=self.scanner_config.get('spike_window', 60),
+        )
+        source = self.scanner_config.get('source', 'stream' if BINANCE_AVAILABLE else 'rest')
+        try:
+            if source == 'stream':
+                self.scanner.start_stream(self.get_ws_manager())
+                return
+        except Exception as e:
+            print(f"⚠️ 無法訂閱全市場行情串流，改為定期抓取: {e}")
+        decoder = SelectiveTickerDecoder(SCANNER_FIELDS)
+        self.scanner.start_polling(
+            lambda: decoder.decode(self.endpoint_pool.get_json('/api/v3/ticker/24hr', raw=True)),
+            self.executor,
+            interval=self.scanner_config.get('poll_interval', 60),
+        )
+    
+    def on_scanner_update(self, results):
+        """將異動排行排入選單渲染"""
+        updates = {
+            'scanner_status': f"🔍 {self.scanner.symbol_count} 個交易對 | 排行 {self.scanner.last_scan_ms:.2f} ms"
+        }
+        top_k = self.scanner_config.get('top_k', 5)
+        for category, rows in results.items():
+            for i in range(top_k):
+                text = self.format_scanner_row(category, i, rows[i]) if i < len(rows) else f"{i + 1}. —"
+                updates[f"scanner_{category}_{i}"] = text
+        self.renderer.stage(updates)
+    
+    def format_scanner_row(self, category, index, row):
+        """格式化單一排行項目"""
+        symbol, score, price, change, position = row
+        price_str = format_price(price, "compact")
+        _, change_str = format_change(change)
+        if category == 'volume_spikes':
+            return f"{index + 1}. {symbol}  ×{score:.1f}  {change_str}"
+        if category == 'breakouts':
+            arrow = "⬆️" if position >= 0.5 else "⬇️"
+            return f"{index + 1}. {arrow} {symbol}  {price_str}  區間 {position * 100:.0f}%"
+        return f"{index + 1}. {symbol}  {price_str}  {change_str}"
+    
+    # ==================== 合約標記價格 ====================
+    
+    def setup_mark_prices(self):
+        """啟用 mark_price 時訂閱全市場標記價格串流，提供持倉估值與資金費率、基差警報"""
+        self.mark_monitor = None
+        if not self.mark_price_config.get('enabled', False):
+            return
+        if not BINANCE_AVAILABLE:
+            print("⚠️ 合約標記價格監控需要 python-binance")
+            return
+        self.renderer.add_target('detail_mark', self.detail_mark)
+        self.mark_monitor = MarkPriceMonitor(
+            self.on_mark_prices,
+            symbols=self.get_mark_alert_symbols if self.mark_price_config.get('scope', 'watched') == 'watched' else None,
+            **self.get_mark_thresholds(),
+        )
+        try:
+            self.mark_monitor.start_stream(self.get_ws_manager())
+        except Exception as e:
+            print(f"⚠️ 無法訂閱合約標記價格串流: {e}")
+            self.mark_monitor = None
+    
+    def get_mark_thresholds(self):
+        """mark_price 配置中的警報閾值"""
+        return {
+            'funding_alert': self.mark_price_config.get('funding_alert'),
+            'basis_alert': self.mark_price_config.get('basis_alert'),
+            'rules': self.mark_price_config.get('alerts', {}),
+        }
+    
+    def get_mark_alert_symbols(self):
+        """scope 為 watched 時只對監控中的交易對與持倉中的合約發出警報"""
+        return set(self.trading_pairs) | set(self.portfolio.positions)
+    
+    def on_mark_prices(self, changes, alerts):
+        """標記價格串流回呼：更新持倉估值、詳細資訊與資金費率 / 基差警報"""
+        if self.portfolio_enabled and self.portfolio.on_mark_prices(
+            {symbol: mark.mark_price for symbol, mark in changes.items()}
+        ):
+            self.renderer.stage({'equity_menu': self.format_equity_menu()})
+        
+        current_pair = self.trading_pairs[self.current_crypto_index]
+        if current_pair in changes:
+            self.renderer.stage({'detail_mark': self.format_mark_price(current_pair)})
+        
+        if self.derived_perp_legs:
+            self.update_derived({
+                PERP_PREFIX + symbol: changes[symbol].mark_price for symbol in self.derived_perp_legs & changes.keys()
+            })
+        
+        current_time = time.time()
+        for key, title, message in alerts:
+            alert_key = f"mark_{key}"
+            if current_time - self.last_alert_time.get(alert_key, 0) < self.alert_cooldown:
+                continue
+            self.last_alert_time[alert_key] = current_time
+            self.executor.submit(self.send_price_alert, title, message)
+            kind, symbol = key.split('_', 1)
+            self.record_alert(symbol, kind, title, message)
+    
+    def format_mark_price(self, pair):
+        """詳細資訊中的標記價格、資金費率與基差"""
+        mark = self.mark_monitor.get(pair)
+        if mark is None:
+            return "⚡ 合約標記價格：無永續合約"
+        settle = datetime.fromtimestamp(mark.next_funding_time / 1000).strftime('%H:%M')
+        return (
+            f"⚡ 標記 {format_price(mark.mark_price, 'compact')} | 資金費率 {mark.funding_rate * 100:+.4f}%"
+            f"（{settle} 結算）| 基差 {basis_percentage(mark):+.3f}%"
+        )
+    
+    # ==================== 跨交易對衍生序列 ====================
+    
+    def build_derived_menu(self):
+        """建立衍生序列的相依圖與「🔗 衍生序列」子選單"""
+        try:
+            self.derived_graph = DerivedGraph(self.derived_config)
+        except ValueError as e:
+            print(f"⚠️ 衍生序列配置錯誤，已停用: {e}")
+            return
+        self.derived_series = self.derived_graph.series
+        self.derived_submenu = rumps.MenuItem("🔗 衍生序列")
+        self.derived_items = {}
+        for name, series in self.derived_series.items():
+            item = rumps.MenuItem(f"🔗 {name}：載入中...（{series.describe()}）", callback=None)
+            self.derived_items[name] = item
+            self.derived_submenu.add(item)
+        self.menu.add(self.derived_submenu)
+    
+    def setup_derived(self):
+        """現貨腿由快照匯流排的 derived 訂閱者提供，perp: 腿由標記價格串流提供"""
+        if self.derived_graph is None:
+            return
+        for name, item in self.derived_items.items():
+            self.renderer.add_target(f"derived_{name}", item)
+        self.derived_perp_legs = self.derived_graph.perp_legs()
+        if self.derived_perp_legs and self.mark_monitor is None:
+            print(f"⚠️ {PERP_PREFIX} 腿需要啟用 mark_price，相關衍生序列不會更新")
+        print(f"🔗 {len(self.derived_series)} 個衍生序列，依賴 {len(self.derived_graph.external_legs())} 個腿")
+    
+    def update_derived(self, prices):
+        """腿的價格更新後只重算受影響的衍生序列，並更新選單與警報"""
+        changed = self.derived_graph.update(prices)
+        if not changed:
+            return
+        self.renderer.stage({
+            f"derived_{name}": f"🔗 {name}：{self.derived_series[name].format(value)}（{self.derived_series[name].describe()}）"
+            for name, value in changed.items()
+        })
+        for name, value in changed.items():
+            if self.price_alert_enabled and name in self.alert_thresholds:
+                self.check_price_alerts(name, value)
+    
+    def get_fetch_pairs(self):
+        """每輪需要抓取的交易對：顯示中的交易對加上衍生序列的現貨腿"""
+        pairs = self.get_display_pairs()
+        if self.derived_graph is not None:
+            pairs += sorted(self.derived_graph.spot_legs() - set(pairs))
+        return pairs
+    
+    # ==================== 多程序分片監控 ====================
+    
+    def setup_sharding(self):
+        """config.json 啟用 sharding 時，由多個工作程序監看大量交易對"""
+        sharding_config = self.config.get('sharding', {})
+        self.sharded_feed = None
+        self.futures_data = {}
+        if not sharding_config.get('enabled', False):
+            return
+        if not BINANCE_AVAILABLE:
+            print("⚠️ 分片模式需要 python-binance")
+            return
+        self.sharded_feed = ShardedFeed(
+            sharding_config.get('workers') or os.cpu_count() or 1,
+            self.on_shard_delta,
+            self.on_shard_alert,
+            flush_interval=sharding_config.get('flush_interval', 0.5),
+        )
+        # 取得交易對清單需要網路，在背景啟動
+        self.executor.submit(self.start_sharding, key='sharding')
+    
+    def start_sharding(self):
+        """決定各市場要監看的交易對並啟動工作程序"""
+        sharding_config = self.config.get('sharding', {})
+        quote = sharding_config.get('quote', 'USDT')
+        symbols_by_market = {}
+        full_markets = []  # 自動列出整個市場的交易對，單一分片時可改用全市場串流
+        for market in sharding_config.get('markets', ['spot']):
+            symbols = sharding_config.get('symbols', {}).get(market)
+            if not symbols:
+                try:
+                    symbols = discover_symbols(market, quote, self.endpoint_pool)
+                except Exception as e:
+                    print(f"❌ 無法取得 {market} 交易對清單: {e}")
+                    continue
+                full_markets.append(market)
+            if market == 'spot':
+                # 顯示與警報的交易對一定要包含在內
+                symbols = sorted(set(symbols) | set(self.trading_pairs) | set(self.get_exchange_alert_pairs()))
+            symbols_by_market[market] = symbols
+        if self.running and symbols_by_market:
+            self.sharded_feed.start(symbols_by_market, *self.get_shard_thresholds(), full_markets=full_markets)
+    
+    def get_shard_thresholds(self):
+        """送給工作程序的 (市場 → 警報閾值, 冷卻秒數)；警報閾值是現貨價格，只套用在現貨，警報停用時不送閾值"""
+        if not self.price_alert_enabled:
+            return {}, self.alert_cooldown
+        spot = {pair: self.alert_thresholds[pair] for pair in self.get_exchange_alert_pairs()}
+        return {'spot': spot}, self.alert_cooldown
+    
+    def on_shard_delta(self, market, rows):
+        """工作程序送回的價格變更"""
+        if market != 'spot':
+            self.futures_data.update(rows)
+            return
+        self.store_rows(rows)
+    
+    def on_shard_alert(self, market, trading_pair, side, price, threshold):
+        """工作程序觸發的價格警報"""
+        symbol = self.get_crypto_symbol(trading_pair)
+        name = self.get_crypto_name(trading_pair)
+        if market != 'spot':
+            name = f"{name}（合約）"
+        if side == 'high':
+            self.send_price_alert(
+                f"🚨 {symbol} {name} 高價警報！",
+                f"當前價格 ${price:,.2f} 已達到或超過設定的高價閾值 ${threshold:,.2f}"
+            )
+        else:
+            self.send_price_alert(
+                f"🚨 {symbol} {name} 低價警報！",
+                f"當前價格 ${price:,.2f} 已達到或低於設定的低價閾值 ${threshold:,.2f}"
+            )
+    
+    # ==================== 共享記憶體價格表 ====================
+    
+    def setup_shared_prices(self):
+        """config.json 啟用 shared_memory 時建立共享價格表"""
+        shared_config = self.config.get('shared_memory', {})
+        self.shared_prices = None
+        if not shared_config.get('enabled', False):
+            return
+        name = shared_config.get('name', SHARED_PRICES_NAME)
+        try:
+            self.shared_prices = SharedPriceTable(name, capacity=shared_config.get('capacity', 512))
+            print(f"🧠 共享價格表已建立: {name}")
+        except Exception as e:
+            print(f"⚠️ 無法建立共享價格表: {e}")
+    
+    # ==================== 條件式自動下單 ====================
+    
+    def setup_automation(self):
+        """config.json 啟用 automation 時，依警報閾值的 on_high / on_low 建立自動下單動作"""
+        self.automation = None
+        if not self.automation_config.get('enabled', False):
+            return
+        if not (self.trading_enabled and self.binance_client):
+            print("⚠️ 自動下單需要啟用交易功能")
+            return
+        self.renderer.add_target('automation_menu', self.automation_menu)
+        self.automation = AutomationEngine(
+            lambda params: self.execute_order(params, interactive=False),
+            notify=self.send_price_alert,
+            limits=self.automation_config,
+            dry_run=self.automation_config.get('dry_run', False),
+            on_kill_switch=self.on_automation_kill_switch,
+        )
+        self.automation.load(self.get_automation_thresholds())
+        mode = "模擬模式" if self.automation.dry_run else "實際下單"
+        print(f"🤖 自動下單已啟用（{mode}，{self.automation.get_stats()['actions']} 個動作）")
+    
+    def reload_automation(self):
+        """配置變更時更新自動下單的限制與動作；停用 automation 等同緊急停止"""
+        self.automation_config = self.config.get('automation', {})
+        self.automation.update_limits(self.automation_config, self.automation_config.get('dry_run', False))
+        self.automation.load(self.get_automation_thresholds())
+        if not self.automation_config.get('enabled', False):
+            self.automation.set_killed(True)
+    
+    def toggle_automation(self, sender):
+        """緊急停止 / 恢復自動下單：停止立即生效，恢復需要確認"""
+        if self.automation is None:
+            return
+        if not self.automation.killed:
+            self.automation.set_killed(True)
+            return
+        if rumps.alert("恢復自動下單", "確定要恢復自動下單嗎？待命中的動作觸發時會直接下單。", ok="確認", cancel="取消") == 1:
+            self.automation.set_killed(False)
+    
+    def on_automation_kill_switch(self, killed):
+        """緊急停止狀態變更時更新選單（可能在訂閱者執行緒呼叫）"""
+        title = "🛑 自動下單：已停止（點擊恢復）" if killed else "🤖 自動下單：待命中"
+        self.renderer.stage({'automation_menu': title})
+    
+    # ==================== 投資組合估值 ====================
+    
+    def setup_portfolio(self):
+        """建立投資組合估值引擎"""
+        portfolio_config = self.config.get('portfolio', {})
+        self.portfolio = PortfolioEngine()
+        self.portfolio_enabled = bool(portfolio_config.get('enabled', True) and self.binance_client)
+        self.portfolio_in_title = portfolio_config.get('show_in_title', True)
+        self.portfolio_refresh_interval = portfolio_config.get('refresh_interval', 300)
+        self.portfolio_invalid_symbols = set()  # 幣安沒有現貨交易對的資產（例如 LD 開頭的理財資產）
+        self.portfolio_alerts = {
+            'low': portfolio_config.get('equity_alert_low'),
+            'high': portfolio_config.get('equity_alert_high'),
+            'max_drawdown': portfolio_config.get('max_drawdown_percentage'),
+        }
+    
+    def refresh_portfolio_accounts(self):
+        """以簽名請求重新載入現貨餘額與合約持倉"""
+        account = self.binance_client.get_account()
+        self.portfolio.load_spot_balances(account['balances'])
+        try:
+            self.portfolio.load_futures_account(self.binance_client.futures_account())
+        except Exception as e:
+            print(f"⚠️ 獲取合約帳戶失敗: {e}")
+        print(f"💼 帳戶資料已更新，總資產 ${self.portfolio.equity:,.2f}")
+    
+    def update_portfolio(self):
+        """更新投資組合使用的價格，帳戶資料只在過期時重新載入"""
+        if not self.portfolio_enabled:
+            return False
+        try:
+            if time.time() - self.portfolio.loaded_at >= self.portfolio_refresh_interval:
+                self.refresh_portfolio_accounts()
+            
+            # 只請求持有資產相關的交易對，不下載全市場的價格
+            spot_symbols = self.portfolio.spot_symbols() - self.portfolio_invalid_symbols
+            positions = self.portfolio.position_symbols()
+            if positions and self.mark_monitor is None:
+                if hasattr(self.binance_client, 'futures_mark_price'):
+                    self.update_portfolio_marks(positions)
+                else:
+                    # 模擬交易客戶端沒有標記價格，合約持倉以現貨最新價估算
+                    spot_symbols |= positions - self.portfolio_invalid_symbols
+            if spot_symbols:
+                for symbol, price in self.get_portfolio_prices(sorted(spot_symbols)).items():
+                    self.portfolio.on_price(symbol, price)
+            
+            self.check_portfolio_alerts()
+            return True
+        except Exception as e:
+            print(f"⚠️ 更新投資組合估值失敗: {e}")
+            return False
+    
+    def get_portfolio_prices(self, symbols):
+        """以 symbols 參數批次取得最新價格；含有無效交易對時改為逐一請求並記住無效的交易對"""
+        try:
+            items = self.endpoint_pool.get_json(
+                '/api/v3/ticker/price', {'symbols': json.dumps(symbols, separators=(',', ':'))}
+            )
+            return {item['symbol']: float(item['price']) for item in items}
+        except requests.exceptions.HTTPError as e:
+            if e.response is None or e.response.status_code != 400:
+                raise
+        prices = {}
+        for symbol in symbols:
+            try:
+                item = self.endpoint_pool.get_json('/api/v3/ticker/price', {'symbol': symbol})
+            except requests.exceptions.HTTPError as e:
+                if e.response is None or e.response.status_code != 400:
+                    raise
+                self.portfolio_invalid_symbols.add(symbol)
+                print(f"⚠️ {symbol} 沒有現貨價格，估值時略過")
+                continue
+            prices[symbol] = float(item['price'])
+        return prices
+    
+    def update_portfolio_marks(self, positions):
+        """沒有標記價格串流時，以 /fapi/v1/premiumIndex 的標記價格計算合約未實現盈虧"""
+        if len(positions) == 1:
+            items = [self.binance_client.futures_mark_price(symbol=next(iter(positions)))]
+        else:
+            items = self.binance_client.futures_mark_price()
+        marks = {item['symbol']: float(item['markPrice']) for item in items if item['symbol'] in positions}
+        self.portfolio.on_mark_prices(marks)
+    
+    def check_portfolio_alerts(self):
+        """檢查總資產與回撤警報"""
+        alerts = self.portfolio.check_alerts(
+            low=self.portfolio_alerts['low'],
+            high=self.portfolio_alerts['high'],
+            max_drawdown=self.portfolio_alerts['max_drawdown'],
+        )
+        current_time = time.time()
+        for key, title, message in alerts:
+            alert_key = f"portfolio_{key}"
+            if current_time - self.last_alert_time.get(alert_key, 0) < self.alert_cooldown:
+                continue
+            self.send_price_alert(title, message)
+            self.last_alert_time[alert_key] = current_time
+    
     # ==================== 帳戶資訊方法 ====================
     
     def show_account_balance(self, sender):
-        """顯示帳戶餘額"""
+        """顯示帳戶餘額與估值"""
         if not self.binance_client:
             rumps.alert("錯誤", "幣安客戶端未初始化")
             return
         
         try:
+            # 帳戶資料過期時才重新發出簽名請求，平常直接使用估值引擎的結果
+            if time.time() - self.portfolio.loaded_at >= self.portfolio_refresh_interval:
+                self.refresh_portfolio_accounts()
+            snapshot = self.portfolio.get_snapshot()
+            
             # 現貨餘額
-            account = self.binance_client.get_account()
             spot_balances = []
-            for asset in account['balances']:
-                free = float(asset['free'])
-                locked = float(asset['locked'])
-                if free > 0 or locked > 0:
-                    spot_balances.append(f"{asset['asset']}: {free + locked:.8f} (可用: {free:.8f})")
-            
-            # 合約餘額
-            futures_account = self.binance_client.futures_account()
-            futures_balance = float(futures_account['totalWalletBalance'])
+            for asset, amount, value in snapshot['spot']:
+                spot_balances.append(f"{asset}: {amount:.8f} ≈ ${value:,.2f}")
             
-            balance_info = f"💼 帳戶餘額\n\n📈 現貨餘額:\n" + "\n".join(spot_balances[:10])
+            balance_info = f"💼 總資產: ${snapshot['equity']:,.2f} USDT\n\n"
+            balance_info += f"📈 現貨市值: ${snapshot['spot_total']:,.2f}\n" + "\n".join(spot_balances[:10])
             if len(spot_balances) > 10:
                 balance_info += f"\n... 還有 {len(spot_balances) - 10} 個幣種"
             
-            balance_info += f"\n\n⚡ 合約餘額:\n總餘額: {futures_balance:.2f} USDT"
+            # 合約餘額
+            balance_info += f"\n\n⚡ 合約餘額:\n總餘額: {snapshot['futures_wallet']:.2f} USDT"
+            balance_info += f"\n未實現盈虧: {snapshot['unrealized_pnl']:+.2f} USDT"
+            
+            updated = datetime.fromtimestamp(snapshot['loaded_at']).strftime('%H:%M:%S')
+            balance_info += f"\n\n🔄 帳戶資料更新於 {updated}，價格即時更新"
             
             rumps.alert("帳戶餘額", balance_info)
             
@@ -1382,26 +3052,43 @@ class CryptoMenuBarMonitor(rumps.App):
             return
         
         try:
-            positions = self.binance_client.futures_position_information()
+            if self.mark_monitor is not None and self.portfolio_enabled:
+                # 持倉來自估值引擎的帳戶資料，現價與盈虧使用即時標記價格，不必再發出簽名請求
+                if time.time() - self.portfolio.loaded_at >= self.portfolio_refresh_interval:
+                    self.refresh_portfolio_accounts()
+                positions = self.portfolio.get_snapshot()['positions']
+            else:
+                positions = [
+                    (
+                        pos['symbol'], float(pos['positionAmt']), float(pos['entryPrice']),
+                        float(pos['markPrice']), float(pos['unrealizedPnl']),
+                    )
+                    for pos in self.binance_client.futures_position_information()
+                ]
             active_positions = []
             
-            for pos in positions:
-                position_amt = float(pos['positionAmt'])
+            for symbol, position_amt, entry_price, mark_price, unrealized_pnl in positions:
                 if position_amt != 0:
-                    unrealized_pnl = float(pos['unrealizedPnl'])
-                    mark_price = float(pos['markPrice'])
-                    entry_price = float(pos['entryPrice'])
-                    
                     direction = "多單" if position_amt > 0 else "空單"
                     pnl_color = "📈" if unrealized_pnl >= 0 else "📉"
                     
-                    active_positions.append(
-                        f"{pos['symbol']}: {direction}\n"
+                    text = (
+                        f"{symbol}: {direction}\n"
                         f"  數量: {abs(position_amt):.6f}\n"
                         f"  開倉價: {entry_price:.6f}\n"
-                        f"  現價: {mark_price:.6f}\n"
+                        f"  現價: {mark_price or 0:.6f}\n"
                         f"  {pnl_color} 未實現盈虧: {unrealized_pnl:.2f} USDT"
                     )
+                    mark = self.mark_monitor.get(symbol) if self.mark_monitor is not None else None
+                    if mark is not None:
+                        # 持倉方在下次結算時支付（負值）或收取（正值）的資金費
+                        funding_fee = -position_amt * mark.mark_price * mark.funding_rate
+                        settle = datetime.fromtimestamp(mark.next_funding_time / 1000).strftime('%H:%M')
+                        text += (
+                            f"\n  💸 資金費率: {mark.funding_rate * 100:+.4f}%"
+                            f"（{settle} 結算，預估 {funding_fee:+.2f} USDT）"
+                        )
+                    active_positions.append(text)
             
             if active_positions:
                 positions_info = "📊 持倉資訊\n\n" + "\n\n".join(active_positions)
@@ -1451,8 +3138,30 @@ class CryptoMenuBarMonitor(rumps.App):
         """退出應用程式"""
         print("🛑 正在關閉加密貨幣監控器...")
         self.running = False
-        if self.update_thread and self.update_thread.is_alive():
-            self.update_thread.join(timeout=2)
+        self.flush_config_save()
+        if self.update_future is not None:
+            wait_futures([self.update_future], timeout=2)
+        self.executor.shutdown()
+        self.snapshots.stop()
+        if self.order_books is not None:
+            self.order_books.stop()
+        if self.bar_stream is not None:
+            self.bar_stream.stop()
+        if self.history is not None:
+            self.history.close()
+        if self.scanner is not None:
+            self.scanner.stop(getattr(self, 'ws_manager', None))
+        if self.mark_monitor is not None:
+            self.mark_monitor.stop(getattr(self, 'ws_manager', None))
+        if self.price_client is not None:
+            self.price_client.stop()
+        if self.sharded_feed is not None:
+            self.sharded_feed.stop()
+        if self.shared_prices is not None:
+            self.shared_prices.close()
+        if getattr(self, 'ws_manager', None) is not None:
+            self.ws_manager.stop()
+        self.endpoint_pool.close()
         rumps.quit_application()
 
 def main():
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+🔗 跨交易對衍生序列
+🧮 以配置定義比值（ETH/BTC）、價差、基差等合成序列，可以像一般交易對一樣顯示與設定警報
+🕸️ 依相依圖增量計算：某一腿更新時只重新計算依賴它的序列，衍生序列也可以再作為其他序列的腿
+"""
+
+import heapq
+import threading
+
+# 序列種類：名稱 → (計算函式, 運算符號)
+OPERATIONS = {
+    'ratio': (lambda a, b: a / b, '÷'),
+    'spread': (lambda a, b: a - b, '−'),
+    'basis': (lambda a, b: (a - b) / b * 100, '基差'),
+}
+
+# 以標記價格作為腿，例如 "perp:BTCUSDT"（需要啟用 mark_price）
+PERP_PREFIX = 'perp:'
+
+
+def format_value(kind, value, precision=None):
+    """依序列種類格式化數值"""
+    if kind == 'basis':
+        return f"{value:+.{3 if precision is None else precision}f}%"
+    if precision is not None:
+        return f"{value:,.{precision}f}"
+    return f"{value:,.6g}" if kind == 'ratio' else f"{value:+,.4f}"
+
+
+class DerivedSeries:
+    """單一衍生序列的定義"""
+    
+    def __init__(self, name, kind, legs, precision=None):
+        if kind not in OPERATIONS:
+            raise ValueError(f"{name}: 不支援的種類 {kind}（可用 {', '.join(OPERATIONS)}）")
+        if len(legs) != 2:
+            raise ValueError(f"{name}: 需要剛好兩個腿")
+        self.name = name
+        self.kind = kind
+        self.legs = tuple(legs)
+        self.precision = precision
+        self.compute = OPERATIONS[kind][0]
+    
+    def describe(self):
+        """例如 ETHUSDT ÷ BTCUSDT"""
+        return f"{self.legs[0]} {OPERATIONS[self.kind][1]} {self.legs[1]}"
+    
+    def format(self, value):
+        return format_value(self.kind, value, self.precision)
+
+
+class DerivedGraph:
+    """衍生序列的相依圖：腿更新時依拓撲順序只重算受影響且輸入真的改變的序列"""
+    
+    def __init__(self, definitions):
+        self.series = {
+            name: DerivedSeries(name, spec.get('type', 'ratio'), spec.get('legs', []), spec.get('precision'))
+            for name, spec in definitions.items()
+        }
+        self.dependents = {}  # 腿（交易對或衍生序列）→ 依賴它的衍生序列
+        for series in self.series.values():
+            for leg in series.legs:
+                self.dependents.setdefault(leg, []).append(series.name)
+        self.order = self.topological_order()
+        self.values = {}      # 腿與衍生序列的最新數值
+        self.recomputed = 0
+        self.lock = threading.Lock()  # 現貨與標記價格可能在不同執行緒更新
+    
+    def topological_order(self):
+        """回傳 名稱 → 拓撲順序，有循環相依時拋出 ValueError"""
+        indegree = {
+            name: sum(1 for leg in series.legs if leg in self.series)
+            for name, series in self.series.items()
+        }
+        ready = sorted(name for name, degree in indegree.items() if degree == 0)
+        order = {}
+        while ready:
+            name = ready.pop()
+            order[name] = len(order)
+            for dependent in self.dependents.get(name, ()):
+                indegree[dependent] -= 1
+                if indegree[dependent] == 0:
+                    ready.append(dependent)
+        if len(order) != len(self.series):
+            cyclic = sorted(set(self.series) - set(order))
+            raise ValueError(f"衍生序列有循環相依: {', '.join(cyclic)}")
+        return order
+    
+    def external_legs(self):
+        """需要從外部取得價格的腿（不是衍生序列的腿）"""
+        return {leg for leg in self.dependents if leg not in self.series}
+    
+    def spot_legs(self):
+        """現貨價格表提供的腿"""
+        return {leg for leg in self.external_legs() if not leg.startswith(PERP_PREFIX)}
+    
+    def perp_legs(self):
+        """標記價格提供的腿（不含前綴）"""
+        return {leg[len(PERP_PREFIX):] for leg in self.external_legs() if leg.startswith(PERP_PREFIX)}
+    
+    def update(self, prices):
+        """
+        更新外部腿的價格 {腿: 價格}，回傳數值有改變的衍生序列 {名稱: 數值}
+        以拓撲順序的堆積傳播：只有數值真的改變時才繼續通知下游
+        """
+        with self.lock:
+            return self.propagate(prices)
+    
+    def propagate(self, prices):
+        """update 的實際傳播（呼叫時需持有鎖）"""
+        heap = []
+        queued = set()
+        values = self.values
+        
+        def schedule(leg):
+            for name in self.dependents.get(leg, ()):
+                if name not in queued:
+                    queued.add(name)
+                    heapq.heappush(heap, (self.order[name], name))
+        
+        for leg, price in prices.items():
+            if leg in self.series or values.get(leg) == price:
+                continue
+            values[leg] = price
+            schedule(leg)
+        
+        changed = {}
+        while heap:
+            _, name = heapq.heappop(heap)
+            series = self.series[name]
+            a = values.get(series.legs[0])
+            b = values.get(series.legs[1])
+            if a is None or b is None:
+                continue
+            try:
+                value = series.compute(a, b)
+            except ZeroDivisionError:
+                continue
+            self.recomputed += 1
+            if values.get(name) == value:
+                continue
+            values[name] = value
+            changed[name] = value
+            schedule(name)
+        return changed
+    
+    def get(self, name):
+        """回傳衍生序列的最新數值，還沒有足夠資料時回傳 None"""
+        return self.values.get(name) if name in self.series else None
+
+
+def benchmark(legs=200, series=2000, updates=20000):
+    """比較每次更新全部重算與相依圖增量計算的速度"""
+    import random
+    import time
+    
+    symbols = [f"COIN{i}USDT" for i in range(legs)]
+    definitions = {}
+    for i in range(series):
+        a, b = random.sample(symbols, 2)
+        definitions[f"S{i}"] = {'type': random.choice(list(OPERATIONS)), 'legs': [a, b]}
+    graph = DerivedGraph(definitions)
+    graph.update({symbol: random.uniform(1, 100) for symbol in symbols})
+    ticks = [(random.choice(symbols), random.uniform(1, 100)) for _ in range(updates)]
+    
+    prices = dict(graph.values)
+    start = time.perf_counter()
+    for symbol, price in ticks:
+        prices[symbol] = price
+        for item in graph.series.values():
+            item.compute(prices[item.legs[0]], prices[item.legs[1]])
+    full_rate = updates / (time.perf_counter() - start)
+    
+    graph.recomputed = 0
+    start = time.perf_counter()
+    for symbol, price in ticks:
+        graph.update({symbol: price})
+    incremental_rate = updates / (time.perf_counter() - start)
+    
+    print(f"全部重算 {series} 個序列      {full_rate:>12,.0f} 次更新/秒")
+    print(f"相依圖增量計算            {incremental_rate:>12,.0f} 次更新/秒（平均每次重算 {graph.recomputed / updates:.1f} 個）")
+
+
+if __name__ == "__main__":
+    benchmark()
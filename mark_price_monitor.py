@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+⚡ 合約標記價格與資金費率監控
+📡 以單一 !markPrice@arr@1s 全市場串流取得所有永續合約的標記價格、指數價格、資金費率與下次結算時間
+💼 標記價格直接提供給持倉估值與持倉資訊，不需要再呼叫 futures_position_information
+🚨 每一秒的整批資料一次評估資金費率與基差警報
+"""
+
+import threading
+import time
+from collections import namedtuple
+
+# 單一永續合約的最新狀態：資金費率為小數（0.0001 = 0.01%），時間為毫秒
+MarkPrice = namedtuple('MarkPrice', ['mark_price', 'index_price', 'funding_rate', 'next_funding_time', 'event_time'])
+
+
+def basis_percentage(mark):
+    """標記價格相對指數價格（現貨加權）的基差百分比"""
+    if not mark.index_price:
+        return 0.0
+    return (mark.mark_price - mark.index_price) / mark.index_price * 100
+
+
+class MarkPriceMonitor:
+    """維護所有永續合約的標記價格，on_update(變更, 警報) 在每批資料處理完後呼叫"""
+    
+    def __init__(self, on_update=None, funding_alert=None, basis_alert=None, rules=None, symbols=None):
+        self.on_update = on_update
+        self.funding_alert = funding_alert  # |資金費率| 達到這個百分比時警報
+        self.basis_alert = basis_alert      # |基差| 達到這個百分比時警報
+        self.rules = rules or {}            # 交易對 → {'funding': %, 'basis': %}，覆寫全域閾值
+        self.symbols = symbols              # 警報範圍：集合或回傳集合的函式，None 表示所有合約
+        self.marks = {}                     # 交易對 → MarkPrice
+        self.triggered = set()              # 目前處於警報狀態的 (交易對, 種類)，回到閾值內才會重置
+        self.lock = threading.Lock()
+        self.stream = None
+        self.frames = 0
+        self.lag_ms = 0.0
+        self.last_eval_ms = 0.0
+    
+    # ==================== 串流 ====================
+    
+    def start_stream(self, ws_manager):
+        """訂閱 !markPrice@arr@1s 全市場標記價格串流"""
+        self.stream = ws_manager.start_all_mark_price_socket(callback=self.on_mark_prices, fast=True)
+        print("⚡ 已訂閱合約標記價格串流")
+    
+    def stop(self, ws_manager=None):
+        """停止串流"""
+        if self.stream and ws_manager is not None:
+            ws_manager.stop_socket(self.stream)
+            self.stream = None
+    
+    def on_mark_prices(self, msg):
+        """!markPrice@arr@1s 回呼：一次處理整批合約並評估警報"""
+        if isinstance(msg, dict):
+            if msg.get('e') == 'error':
+                print(f"⚠️ 合約標記價格串流錯誤: {msg.get('m')}")
+                return
+            msg = msg.get('data', [])
+        if not msg:
+            return
+        
+        start = time.perf_counter()
+        changes = {}
+        with self.lock:
+            for data in msg:
+                mark = MarkPrice(
+                    float(data['p']), float(data['i']), float(data['r'] or 0),
+                    int(data['T']), int(data['E']),
+                )
+                symbol = data['s']
+                previous = self.marks.get(symbol)
+                self.marks[symbol] = mark
+                # 事件時間每秒都會變，只有價格或資金費率改變才算變更
+                if previous is None or previous[:4] != mark[:4]:
+                    changes[symbol] = mark
+            alerts = self.evaluate(changes)
+            self.frames += 1
+            self.lag_ms = max(0.0, time.time() * 1000 - int(msg[-1]['E']))
+        self.last_eval_ms = (time.perf_counter() - start) * 1000
+        
+        if self.on_update:
+            try:
+                self.on_update(changes, alerts)
+            except Exception as e:
+                print(f"⚠️ 標記價格訂閱者發生錯誤: {e}")
+    
+    # ==================== 警報 ====================
+    
+    def evaluate(self, changes):
+        """一次評估整批變更的資金費率與基差警報，回傳 [(鍵, 標題, 內容)]（呼叫時需持有鎖）"""
+        symbols = self.symbols() if callable(self.symbols) else self.symbols
+        alerts = []
+        for symbol, mark in changes.items():
+            if symbols is not None and symbol not in symbols and symbol not in self.rules:
+                continue
+            rule = self.rules.get(symbol, {})
+            
+            funding_threshold = rule.get('funding', self.funding_alert)
+            if funding_threshold:
+                funding = mark.funding_rate * 100
+                if self.crossed(symbol, 'funding', abs(funding) >= funding_threshold):
+                    payer = "多方支付空方" if funding > 0 else "空方支付多方"
+                    settle = time.strftime('%H:%M', time.localtime(mark.next_funding_time / 1000))
+                    alerts.append((
+                        f"funding_{symbol}", f"💸 {symbol} 資金費率警報",
+                        f"資金費率 {funding:+.4f}% 已超過 ±{funding_threshold}%（{payer}，{settle} 結算）",
+                    ))
+            
+            basis_threshold = rule.get('basis', self.basis_alert)
+            if basis_threshold:
+                basis = basis_percentage(mark)
+                if self.crossed(symbol, 'basis', abs(basis) >= basis_threshold):
+                    direction = "溢價" if basis > 0 else "折價"
+                    alerts.append((
+                        f"basis_{symbol}", f"📐 {symbol} 基差警報",
+                        f"標記價格 ${mark.mark_price:,.4f} 相對指數 ${mark.index_price:,.4f} "
+                        f"{direction} {basis:+.3f}%，已超過 ±{basis_threshold}%",
+                    ))
+        return alerts
+    
+    def crossed(self, symbol, kind, active):
+        """邊緣觸發：剛進入警報狀態時回傳 True，回到閾值內重置"""
+        key = (symbol, kind)
+        if not active:
+            self.triggered.discard(key)
+            return False
+        if key in self.triggered:
+            return False
+        self.triggered.add(key)
+        return True
+    
+    def update_thresholds(self, funding_alert=None, basis_alert=None, rules=None):
+        """更新警報閾值，重置所有警報狀態"""
+        with self.lock:
+            self.funding_alert = funding_alert
+            self.basis_alert = basis_alert
+            self.rules = rules or {}
+            self.triggered = set()
+    
+    # ==================== 查詢 ====================
+    
+    def get(self, symbol):
+        """回傳交易對的 MarkPrice，沒有資料時回傳 None"""
+        return self.marks.get(symbol)
+    
+    def get_status(self):
+        """回傳處理統計"""
+        return {
+            'symbols': len(self.marks),
+            'frames': self.frames,
+            'lag_ms': self.lag_ms,
+            'eval_ms': self.last_eval_ms,
+        }
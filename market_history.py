@@ -0,0 +1,428 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+🗄️ 本地行情歷史與 Parquet 匯出
+💾 成交與 K 線以固定長度的二進位紀錄、警報事件以 JSON Lines 附加寫入 history/{資料集}/{交易對}/{日期}
+📦 匯出時以位移串流讀取，每批最多 batch_rows 筆轉成 Arrow 欄位，寫入依交易對與日期分區的 Parquet
+⏩ --since-last-run 只匯出上次之後新增的紀錄，在既有分區內附加新的 part 檔案
+
+用法：python3 market_history.py --since-last-run [--datasets trades,bars_1m] [--symbols BTCUSDT]
+匯出結果可直接以 pandas.read_parquet('export/bars_1m') 或 DuckDB 的 read_parquet(..., hive_partitioning=true) 讀取
+"""
+
+import argparse
+import json
+import os
+import struct
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import quote, unquote
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = NUMPY_AVAILABLE
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+# 固定長度紀錄的欄位（小端序），第一個欄位是毫秒時間
+RECORD_FIELDS = {
+    'trades': [('time', '<i8'), ('price', '<f8'), ('quantity', '<f8')],
+    'bars': [('open_time', '<i8'), ('open', '<f8'), ('high', '<f8'), ('low', '<f8'),
+             ('close', '<f8'), ('volume', '<f8'), ('trades', '<i8')],
+}
+
+# 警報事件的欄位（JSON Lines）
+ALERT_FIELDS = ['time', 'kind', 'title', 'message']
+
+STATE_FILE = '_export_state.json'
+DAY_MS = 24 * 60 * 60 * 1000
+
+
+def record_fields(dataset):
+    """資料集的紀錄欄位，例如 bars_1m 使用 bars 的欄位；警報事件回傳 None"""
+    return RECORD_FIELDS.get(dataset.split('_', 1)[0])
+
+
+def symbol_dir(symbol):
+    """交易對的目錄名稱：以百分比編碼，ETH/BTC 之類含分隔符號的名稱不會變成巢狀目錄"""
+    return quote(symbol, safe='')
+
+
+def day_string(day_index):
+    """UTC 日期字串"""
+    return time.strftime('%Y-%m-%d', time.gmtime(day_index * DAY_MS / 1000))
+
+
+# ==================== 紀錄 ====================
+
+class HistoryRecorder:
+    """在記憶體中依檔案緩衝紀錄，由背景執行緒定期（或緩衝超過上限時）附加寫入"""
+    
+    def __init__(self, root, flush_interval=1.0, max_buffer_bytes=8 * 1024 * 1024):
+        self.root = root
+        self.flush_interval = flush_interval
+        self.max_buffer_bytes = max_buffer_bytes
+        self.packers = {
+            name: struct.Struct('<' + ''.join('q' if kind == '<i8' else 'd' for _, kind in fields))
+            for name, fields in RECORD_FIELDS.items()
+        }
+        self.buffers = {}   # 相對路徑 → bytearray
+        self.buffered = 0
+        self.days = {}      # 日期序號 → 日期字串
+        self.dirs = {}      # 交易對 → 編碼後的目錄名稱
+        self.opened = set() # 這次執行已檢查過結尾的檔案
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.event = threading.Event()
+        self.running = True
+        self.records = 0
+        self.bytes_written = 0
+        self.thread = threading.Thread(target=self.flush_worker, daemon=True)
+        self.thread.start()
+    
+    def append(self, dataset, symbol, time_ms, data):
+        """將一筆已編碼的紀錄排入對應分區的緩衝"""
+        day_index = int(time_ms // DAY_MS)
+        day = self.days.get(day_index)
+        if day is None:
+            day = self.days[day_index] = day_string(day_index)
+        directory = self.dirs.get(symbol)
+        if directory is None:
+            directory = self.dirs[symbol] = symbol_dir(symbol)
+        path = os.path.join(dataset, directory, day + ('.jsonl' if record_fields(dataset) is None else '.bin'))
+        with self.lock:
+            buffer = self.buffers.get(path)
+            if buffer is None:
+                buffer = self.buffers[path] = bytearray()
+            buffer += data
+            self.buffered += len(data)
+            self.records += 1
+            full = self.buffered >= self.max_buffer_bytes
+        if full:
+            self.event.set()
+    
+    def record_trade(self, symbol, time_ms, price, quantity):
+        self.append('trades', symbol, time_ms, self.packers['trades'].pack(int(time_ms), price, quantity))
+    
+    def record_bar(self, symbol, resolution, bar):
+        """可直接訂閱 TradeAggregator：callback(symbol, resolution, bar)"""
+        data = self.packers['bars'].pack(int(bar.open_time), bar.open, bar.high, bar.low, bar.close,
+                                         bar.volume, int(bar.trades))
+        self.append(f'bars_{resolution}', symbol, bar.open_time, data)
+    
+    def record_alert(self, symbol, kind, title, message, time_ms=None):
+        time_ms = int(time.time() * 1000) if time_ms is None else int(time_ms)
+        line = json.dumps({'time': time_ms, 'kind': kind, 'title': title, 'message': message}, ensure_ascii=False)
+        self.append('alerts', symbol, time_ms, (line + '\n').encode('utf-8'))
+    
+    def flush(self):
+        """取出所有緩衝並附加寫入檔案，每個檔案一次寫入完整的紀錄"""
+        with self.flush_lock:
+            with self.lock:
+                buffers, self.buffers = self.buffers, {}
+                self.buffered = 0
+            for path, data in buffers.items():
+                full_path = os.path.join(self.root, path)
+                try:
+                    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+                    if path not in self.opened:
+                        self.truncate_partial(path, full_path)
+                        self.opened.add(path)
+                    with open(full_path, 'ab') as f:
+                        f.write(data)
+                    self.bytes_written += len(data)
+                except OSError as e:
+                    print(f"⚠️ 無法寫入歷史資料 {path}: {e}")
+    
+    def truncate_partial(self, path, full_path):
+        """上次執行中斷時檔案結尾可能留下不完整的紀錄，先截掉以免之後的紀錄錯位"""
+        packer = self.packers.get(path.split(os.sep, 1)[0].split('_', 1)[0])
+        if packer is None or not os.path.exists(full_path):
+            return
+        size = os.path.getsize(full_path)
+        partial = size % packer.size
+        if partial:
+            os.truncate(full_path, size - partial)
+    
+    def flush_worker(self):
+        while self.running:
+            self.event.wait(timeout=self.flush_interval)
+            self.event.clear()
+            self.flush()
+    
+    def close(self):
+        """停止背景執行緒並寫入剩餘的緩衝"""
+        self.running = False
+        self.event.set()
+        self.thread.join(timeout=2)
+        self.flush()
+    
+    def get_status(self):
+        return {
+            'records': self.records,
+            'bytes_written': self.bytes_written,
+            'buffered': self.buffered,
+        }
+
+
+# ==================== 匯出 ====================
+
+class ParquetExporter:
+    """將本地歷史串流匯出為 {資料集}/symbol={交易對}/date={日期}/part-{位移}.parquet"""
+    
+    def __init__(self, root, out_dir, batch_rows=1_000_000, compression='zstd', workers=None):
+        if not PYARROW_AVAILABLE:
+            raise RuntimeError("Parquet 匯出需要 pyarrow（pip install pyarrow）")
+        self.root = root
+        self.out_dir = out_dir
+        self.batch_rows = batch_rows
+        self.compression = compression
+        self.workers = workers or min(8, os.cpu_count() or 1)  # pyarrow 編碼與壓縮時會釋放 GIL
+        self.state_path = os.path.join(out_dir, STATE_FILE)
+        self.state = self.load_state()  # 來源相對路徑 → 已匯出的位元組位移
+    
+    def load_state(self):
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+    
+    def save_state(self):
+        """先寫入暫存檔再替換，中斷時不會留下損壞的狀態"""
+        os.makedirs(self.out_dir, exist_ok=True)
+        temp_path = self.state_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f, indent=2, sort_keys=True)
+        os.replace(temp_path, self.state_path)
+    
+    def sources(self, datasets=None, symbols=None):
+        """列出 (資料集, 交易對, 日期, 相對路徑)；目錄名稱解碼回交易對"""
+        if not os.path.isdir(self.root):
+            return
+        for dataset in sorted(os.listdir(self.root)):
+            if datasets and dataset not in datasets:
+                continue
+            dataset_dir = os.path.join(self.root, dataset)
+            if not os.path.isdir(dataset_dir):
+                continue
+            for directory in sorted(os.listdir(dataset_dir)):
+                symbol = unquote(directory)
+                if symbols and symbol not in symbols:
+                    continue
+                for name in sorted(os.listdir(os.path.join(dataset_dir, directory))):
+                    day, extension = os.path.splitext(name)
+                    if extension in ('.bin', '.jsonl'):
+                        yield dataset, symbol, day, os.path.join(dataset, directory, name)
+    
+    def export(self, since_last_run=False, datasets=None, symbols=None):
+        """
+        匯出歷史資料，回傳統計
+        since_last_run 為 False 時重建選定的分區；為 True 時只附加上次匯出之後的新紀錄
+        """
+        start = time.perf_counter()
+        stats = {'files': 0, 'rows': 0, 'bytes': 0}
+        last_save = time.monotonic()
+        with ThreadPoolExecutor(self.workers) as pool:
+            futures = {}
+            for dataset, symbol, day, path in self.sources(datasets, symbols):
+                # Hive 分區值同樣以百分比編碼，pyarrow / DuckDB 讀取時會解碼
+                partition = os.path.join(self.out_dir, dataset, f"symbol={symbol_dir(symbol)}", f"date={day}")
+                offset = self.state.get(path, 0) if since_last_run else 0
+                future = pool.submit(self.export_file, dataset, path, partition, offset, not since_last_run)
+                futures[future] = (path, offset)
+            for future in as_completed(futures):
+                path, offset = futures[future]
+                rows, end = future.result()
+                if end != offset:
+                    stats['files'] += 1
+                    stats['rows'] += rows
+                    stats['bytes'] += end - offset
+                self.state[path] = end
+                # 每秒最多儲存一次狀態；中斷後重新匯出的 part 檔名相同，會直接覆蓋
+                if time.monotonic() - last_save >= 1:
+                    self.save_state()
+                    last_save = time.monotonic()
+        self.save_state()
+        stats['seconds'] = time.perf_counter() - start
+        return stats
+    
+    def export_file(self, dataset, path, partition, offset, rebuild=False):
+        """將單一來源檔案從 offset 起匯出成一個 part 檔案，回傳 (列數, 新位移)；rebuild 時先清除分區"""
+        if rebuild and os.path.isdir(partition):
+            for name in os.listdir(partition):
+                if name.startswith('part-') and name.endswith('.parquet'):
+                    os.remove(os.path.join(partition, name))
+        batches = self.read_batches(dataset, os.path.join(self.root, path), offset)
+        writer = None
+        rows = 0
+        end = offset
+        try:
+            for table, end in batches:
+                if writer is None:
+                    os.makedirs(partition, exist_ok=True)
+                    writer = pq.ParquetWriter(
+                        os.path.join(partition, f"part-{offset:015d}.parquet"),
+                        table.schema, compression=self.compression,
+                    )
+                writer.write_table(table)  # 每批一個 row group，記憶體只保留一批
+                rows += table.num_rows
+        finally:
+            if writer is not None:
+                writer.close()
+        return rows, end
+    
+    def read_batches(self, dataset, full_path, offset):
+        """依序產生 (Arrow 表格, 讀到的位移)，只讀取完整的紀錄"""
+        fields = record_fields(dataset)
+        if fields is None:
+            yield from self.read_alert_batches(full_path, offset)
+            return
+        dtype = np.dtype(fields)
+        size = os.path.getsize(full_path)
+        end = size - size % dtype.itemsize  # 寫入中途的不完整紀錄留到下次
+        with open(full_path, 'rb') as f:
+            f.seek(offset)
+            while offset < end:
+                data = f.read(min(end - offset, self.batch_rows * dtype.itemsize))
+                records = np.frombuffer(data, dtype=dtype)
+                offset += len(data)
+                yield records_to_table(records, fields), offset
+    
+    def read_alert_batches(self, full_path, offset):
+        """警報事件：只讀取以換行結尾的完整行"""
+        with open(full_path, 'rb') as f:
+            f.seek(offset)
+            while True:
+                columns = {name: [] for name in ALERT_FIELDS}
+                for _ in range(self.batch_rows):
+                    line = f.readline()
+                    if not line.endswith(b'\n'):
+                        break
+                    offset += len(line)
+                    event = json.loads(line)
+                    for name in ALERT_FIELDS:
+                        columns[name].append(event.get(name))
+                if not columns['time']:
+                    return
+                yield pa.table({
+                    'time': pa.array(columns['time'], type=pa.timestamp('ms', tz='UTC')),
+                    'kind': pa.array(columns['kind'], type=pa.string()),
+                    'title': pa.array(columns['title'], type=pa.string()),
+                    'message': pa.array(columns['message'], type=pa.string()),
+                }), offset
+                if len(columns['time']) < self.batch_rows:
+                    return
+
+
+def records_to_table(records, fields):
+    """結構化陣列轉成 Arrow 表格，時間欄位為 UTC 毫秒時間戳記"""
+    arrays = {}
+    for index, (name, _) in enumerate(fields):
+        column = np.ascontiguousarray(records[name])
+        if index == 0:
+            arrays[name] = pa.array(column, type=pa.int64()).cast(pa.timestamp('ms', tz='UTC'))
+        else:
+            arrays[name] = pa.array(column)
+    return pa.table(arrays)
+
+
+# ==================== 命令列 ====================
+
+def benchmark(symbols=100, days=3, root=None):
+    """產生 symbols 個交易對 × days 天的 1s K 線歷史（每天約 480 MB），量測完整匯出與增量匯出的時間"""
+    import shutil
+    import tempfile
+    
+    if not PYARROW_AVAILABLE:
+        print("⚠️ 效能測試需要 numpy 與 pyarrow")
+        return
+    work_dir = root or tempfile.mkdtemp(prefix='history_benchmark_')
+    history_dir = os.path.join(work_dir, 'history')
+    dtype = np.dtype(RECORD_FIELDS['bars'])
+    start_ms = int(time.time() * 1000) // DAY_MS * DAY_MS - days * DAY_MS
+    rng = np.random.default_rng(0)
+    seconds = DAY_MS // 1000
+    
+    start = time.perf_counter()
+    for i in range(symbols):
+        symbol_dir = os.path.join(history_dir, 'bars_1s', f"COIN{i}USDT")
+        os.makedirs(symbol_dir, exist_ok=True)
+        for day in range(days):
+            records = np.zeros(seconds, dtype=dtype)
+            day_start = start_ms + day * DAY_MS
+            records['open_time'] = day_start + np.arange(seconds, dtype=np.int64) * 1000
+            close = 100 * np.exp(np.cumsum(rng.normal(0, 0.0002, seconds)))
+            records['open'] = records['high'] = records['low'] = records['close'] = close
+            records['volume'] = rng.exponential(1.0, seconds)
+            records['trades'] = 1
+            records.tofile(os.path.join(symbol_dir, f"{day_string(day_start // DAY_MS)}.bin"))
+    total_rows = symbols * days * seconds
+    print(f"📝 產生 {total_rows:,} 根 1s K 線：{time.perf_counter() - start:.1f} 秒")
+    
+    exporter = ParquetExporter(history_dir, os.path.join(work_dir, 'export'))
+    stats = exporter.export()
+    print(
+        f"📦 完整匯出 {stats['files']} 個檔案 {stats['rows']:,} 列：{stats['seconds']:.1f} 秒"
+        f"（{stats['bytes'] / stats['seconds'] / 1e6:,.0f} MB/秒）"
+    )
+    stats = exporter.export(since_last_run=True)
+    print(f"⏩ 沒有新資料的增量匯出：{stats['seconds'] * 1000:.0f} ms")
+    if root is None:
+        shutil.rmtree(work_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="將本地歷史資料匯出為 Parquet")
+    parser.add_argument('--config', default='config.json')
+    parser.add_argument('--history', help="歷史資料目錄（預設為 history.path 或 history）")
+    parser.add_argument('--out', help="匯出目錄（預設為 history.export_dir 或 export）")
+    parser.add_argument('--since-last-run', action='store_true', help="只匯出上次匯出之後新增的紀錄")
+    parser.add_argument('--datasets', help="只匯出這些資料集，例如 trades,bars_1m,alerts")
+    parser.add_argument('--symbols', help="只匯出這些交易對，例如 BTCUSDT,ETHUSDT")
+    parser.add_argument('--batch-rows', type=int, default=1_000_000, help="每批（row group）最多幾列")
+    parser.add_argument('--workers', type=int, help="同時匯出的檔案數（預設為 CPU 核心數，最多 8）")
+    parser.add_argument('--benchmark', action='store_true', help="以合成的 1s K 線量測匯出速度")
+    args = parser.parse_args()
+    
+    if args.benchmark:
+        benchmark()
+        return 0
+    if not PYARROW_AVAILABLE:
+        print("❌ Parquet 匯出需要 numpy 與 pyarrow：pip install pyarrow")
+        return 1
+    
+    history_config = {}
+    if os.path.exists(args.config):
+        with open(args.config, 'r', encoding='utf-8') as f:
+            history_config = json.load(f).get('history', {})
+    exporter = ParquetExporter(
+        args.history or history_config.get('path', 'history'),
+        args.out or history_config.get('export_dir', 'export'),
+        batch_rows=args.batch_rows,
+        workers=args.workers,
+    )
+    stats = exporter.export(
+        since_last_run=args.since_last_run,
+        datasets=set(args.datasets.split(',')) if args.datasets else None,
+        symbols=set(args.symbols.split(',')) if args.symbols else None,
+    )
+    print(
+        f"📦 已匯出 {stats['files']} 個檔案、{stats['rows']:,} 列到 {exporter.out_dir}"
+        f"（{stats['seconds']:.1f} 秒）"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+🔥 全市場異動掃描器
+📡 訂閱 !miniTicker@arr（或定期抓取完整 /api/v3/ticker/24hr）監看所有交易對
+🏆 以延遲失效的堆積維護漲幅、跌幅、成交量暴增與區間突破的前 k 名
+⚡ 每次行情只做 O(log n) 的堆積插入，查詢前 k 名不需要對全市場排序
+"""
+
+import heapq
+import math
+import threading
+import time
+
+# 掃描的排行類別：名稱 → 標題
+CATEGORIES = {
+    'gainers': "🚀 漲幅",
+    'losers': "📉 跌幅",
+    'volume_spikes': "💥 成交量暴增",
+    'breakouts': "📐 區間突破",
+}
+
+
+class TopK:
+    """支援任意更新的前 k 名：舊的堆積項目在查詢時才丟棄（延遲失效）"""
+    
+    def __init__(self, k):
+        self.k = k
+        self.values = {}
+        self.heap = []  # (-分數, 交易對)
+    
+    def update(self, symbol, score):
+        """更新交易對的分數，O(log n)"""
+        if self.values.get(symbol) == score:
+            return
+        self.values[symbol] = score
+        heapq.heappush(self.heap, (-score, symbol))
+        # 失效項目太多時重建，避免堆積無限制成長
+        if len(self.heap) > 4 * len(self.values) + 64:
+            self.heap = [(-value, name) for name, value in self.values.items()]
+            heapq.heapify(self.heap)
+    
+    def remove(self, symbol):
+        """移除交易對（堆積中的項目會在查詢時丟棄）"""
+        self.values.pop(symbol, None)
+    
+    def top(self):
+        """回傳分數最高的 k 個 (交易對, 分數)"""
+        heap = self.heap
+        values = self.values
+        result = []
+        kept = []
+        seen = set()
+        while heap and len(result) < self.k:
+            entry = heapq.heappop(heap)
+            score, symbol = -entry[0], entry[1]
+            if symbol in seen or values.get(symbol) != score:
+                continue  # 已失效的項目直接丟棄
+            seen.add(symbol)
+            result.append((symbol, score))
+            kept.append(entry)
+        for entry in kept:
+            heapq.heappush(heap, entry)
+        return result
+
+
+class MarketScanner:
+    """維護全市場的排行，on_update(results) 在每批行情處理完後呼叫"""
+    
+    def __init__(self, on_update=None, k=5, quote='USDT', min_quote_volume=1000000, spike_window=60):
+        self.on_update = on_update
+        self.quote = quote
+        self.min_quote_volume = min_quote_volume
+        self.spike_window = spike_window
+        self.rankings = {
+            'gainers': TopK(k),
+            'losers': TopK(k),
+            'volume_spikes': TopK(k),
+            'breakouts': TopK(k),
+        }
+        self.last_seen = {}    # 交易對 → (時間, 24h 成交額)
+        self.spike_rate = {}   # 交易對 → 成交額速率的指數移動平均
+        self.details = {}      # 交易對 → (價格, 漲跌幅, 區間位置)
+        self.lock = threading.Lock()
+        self.stream = None
+        self.running = False
+        self.executor = None   # 輪詢模式使用的 TaskExecutor
+        self.last_scan_ms = 0.0
+        self.symbol_count = 0
+    
+    # ==================== 行情處理 ====================
+    
+    def on_ticker(self, symbol, price, open_price, high, low, quote_volume, now):
+        """處理單一交易對的行情，更新各排行分數"""
+        if not symbol.endswith(self.quote):
+            return
+        if quote_volume < self.min_quote_volume:
+            # 成交額太低的交易對容易出現雜訊，移出排行
+            for ranking in self.rankings.values():
+                ranking.remove(symbol)
+            return
+        
+        change = (price - open_price) / open_price * 100 if open_price else 0.0
+        self.rankings['gainers'].update(symbol, change)
+        self.rankings['losers'].update(symbol, -change)
+        
+        # 區間位置：0 為 24h 最低、1 為 24h 最高，越靠近兩端分數越高
+        position = (price - low) / (high - low) if high > low else 0.5
+        self.rankings['breakouts'].update(symbol, abs(2 * position - 1))
+        self.details[symbol] = (price, change, position)
+        
+        # 成交量暴增：近期成交額速率相對 24h 平均速率的倍數
+        previous = self.last_seen.get(symbol)
+        self.last_seen[symbol] = (now, quote_volume)
+        if previous is None or now <= previous[0]:
+            return
+        elapsed = now - previous[0]
+        rate = max(0.0, quote_volume - previous[1]) / elapsed
+        alpha = 1 - math.exp(-elapsed / self.spike_window)
+        smoothed = self.spike_rate.get(symbol, rate)
+        smoothed += alpha * (rate - smoothed)
+        self.spike_rate[symbol] = smoothed
+        baseline = quote_volume / 86400
+        self.rankings['volume_spikes'].update(symbol, smoothed / baseline if baseline else 0.0)
+    
+    def on_mini_tickers(self, msg):
+        """!miniTicker@arr 回呼：一次處理整批行情"""
+        if isinstance(msg, dict):
+            if msg.get('e') == 'error':
+                print(f"⚠️ 全市場行情串流錯誤: {msg.get('m')}")
+            return
+        now = time.time()
+        with self.lock:
+            for data in msg:
+                self.on_ticker(
+                    data['s'], float(data['c']), float(data['o']), float(data['h']),
+                    float(data['l']), float(data['q']), now,
+                )
+        self.publish()
+    
+    def on_ticker_rows(self, rows):
+        """處理已解碼的 24hr ticker：[(交易對, (價格, 開盤價, 最高, 最低, 成交額))]"""
+        now = time.time()
+        with self.lock:
+            for symbol, (price, open_price, high, low, quote_volume) in rows:
+                self.on_ticker(symbol, price, open_price, high, low, quote_volume, now)
+        self.publish()
+    
+    def get_results(self):
+        """回傳各排行的前 k 名：類別 → [(交易對, 分數, 價格, 漲跌幅, 區間位置)]"""
+        start = time.perf_counter()
+        with self.lock:
+            results = {}
+            for name, ranking in self.rankings.items():
+                results[name] = [
+                    (symbol, score) + self.details.get(symbol, (0.0, 0.0, 0.5))
+                    for symbol, score in ranking.top()
+                ]
+            self.symbol_count = len(self.details)
+        self.last_scan_ms = (time.perf_counter() - start) * 1000
+        return results
+    
+    def publish(self):
+        """通知訂閱者最新排行"""
+        if self.on_update:
+            try:
+                self.on_update(self.get_results())
+            except Exception as e:
+                print(f"⚠️ 異動排行訂閱者發生錯誤: {e}")
+    
+    # ==================== 資料來源 ====================
+    
+    def start_stream(self, ws_manager):
+        """訂閱 !miniTicker@arr 全市場串流"""
+        self.stream = ws_manager.start_miniticker_socket(callback=self.on_mini_tickers)
+        print("🔥 已訂閱全市場行情串流")
+    
+    def start_polling(self, fetch_rows, executor, interval=60):
+        """
+        沒有 WebSocket 時改為定期抓取完整 ticker 清單（fetch_rows 回傳已解碼的資料列）
+        每輪由 executor 排程，key 相同的抓取同時只會有一個
+        """
+        self.running = True
+        self.executor = executor
+        executor.submit(self.poll, fetch_rows, interval, key='scanner_poll')
+        print(f"🔥 全市場掃描改為每 {interval} 秒抓取一次")
+    
+    def poll(self, fetch_rows, interval):
+        """抓取並處理一次完整 ticker 清單，完成後排程下一輪"""
+        if not self.running:
+            return
+        try:
+            self.on_ticker_rows(fetch_rows())
+        except Exception as e:
+            print(f"❌ 全市場掃描失敗: {e}")
+        finally:
+            if self.running:
+                # 至少間隔 1 秒，避免下一輪在這一輪結束前到期而被 single-flight 合併掉
+                self.executor.schedule(max(interval, 1.0), self.poll, fetch_rows, interval, key='scanner_poll')
+    
+    def stop(self, ws_manager=None):
+        """停止串流或輪詢"""
+        self.running = False
+        if self.stream and ws_manager is not None:
+            ws_manager.stop_socket(self.stream)
+            self.stream = None
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+🎨 選單欄渲染層
+🔍 記住上一次顯示的文字，只更新內容真的有變更的選單項目
+⏱️ 以固定畫面更新率在主執行緒批次套用，背景執行緒只負責排入更新
+🧵 重建選單等無法以文字表示的變更也可排入，在下一幀由主執行緒執行
+💾 依價格區間快取格式化結果
+"""
+
+import threading
+from functools import lru_cache
+
+
+@lru_cache(maxsize=4096)
+def format_price(price, display_mode):
+    """格式化價格 - 根據顯示模式使用不同格式"""
+    # 為簡潔模式和完整模式提供更詳細的價格顯示
+    if display_mode in ["compact", "full"]:
+        # 簡潔模式和完整模式：顯示完整數字和小數點
+        if price >= 1000:
+            return f"${price:,.2f}"  # 如 $67,234.56
+        elif price >= 1:
+            return f"${price:.2f}"   # 如 $123.45
+        elif price >= 0.0001:
+            return f"${price:.4f}"   # 如 $0.1234
+        else:
+            return f"${price:.6f}"   # 如 $0.000123
+    else:
+        # 僅符號模式：使用簡化格式節省空間
+        if price >= 1000000:
+            return f"${price/1000000:.1f}M"
+        elif price >= 1000:
+            return f"${price/1000:.0f}K"
+        elif price >= 1:
+            return f"${price:.0f}"
+        else:
+            return f"${price:.4f}"
+
+
+@lru_cache(maxsize=1024)
+def format_change(change_24h):
+    """格式化漲跌幅，回傳 (emoji, 文字)"""
+    if change_24h > 0:
+        return "🟢", f"+{change_24h:.2f}%"
+    elif change_24h < 0:
+        return "🔴", f"{change_24h:.2f}%"
+    else:
+        return "⚪", "0.00%"
+
+
+@lru_cache(maxsize=1024)
+def format_volume(volume):
+    """格式化成交量顯示"""
+    if volume >= 1000000000:
+        return f"{volume/1000000000:.2f}B"
+    elif volume >= 1000000:
+        return f"{volume/1000000:.2f}M"
+    elif volume >= 1000:
+        return f"{volume/1000:.2f}K"
+    else:
+        return f"{volume:.2f}"
+
+
+class MenuRenderer:
+    """差異化、限速的選單欄渲染器"""
+    
+    def __init__(self, targets):
+        # targets: 名稱 → 具有 title 屬性的物件（rumps.App 或 rumps.MenuItem）
+        self.targets = dict(targets)
+        self.last_rendered = {}
+        self.pending = {}
+        self.calls = []     # 要在主執行緒執行的函式
+        self.lock = threading.Lock()
+        self.frames = 0
+        self.applied_updates = 0
+        self.skipped_updates = 0
+    
+    def add_target(self, name, target):
+        """新增可渲染的目標"""
+        with self.lock:
+            self.targets[name] = target
+            self.last_rendered.pop(name, None)
+    
+    def stage(self, updates):
+        """排入要顯示的文字（可在任何執行緒呼叫），與目前顯示相同的會被略過"""
+        with self.lock:
+            for name, text in updates.items():
+                if self.last_rendered.get(name) == text:
+                    self.pending.pop(name, None)
+                    self.skipped_updates += 1
+                else:
+                    self.pending[name] = text
+    
+    def call_soon(self, fn):
+        """排入要在主執行緒執行的函式（可在任何執行緒呼叫），下一幀套用文字前執行"""
+        with self.lock:
+            self.calls.append(fn)
+    
+    def flush(self, _timer=None):
+        """在主執行緒把累積的更新一次套用（由 rumps.Timer 以固定頻率呼叫）"""
+        with self.lock:
+            if not self.pending and not self.calls:
+                return 0
+            batch = self.pending
+            self.pending = {}
+            calls = self.calls
+            self.calls = []
+        
+        for fn in calls:
+            try:
+                fn()
+            except Exception as e:
+                print(f"⚠️ 主執行緒更新失敗: {e}")
+        
+        applied = {}
+        failed = {}
+        for name, text in batch.items():
+            target = self.targets.get(name)
+            if target is None:
+                continue
+            try:
+                target.title = text
+            except Exception as e:
+                print(f"⚠️ 更新 {name} 顯示失敗: {e}")
+                failed[name] = text
+                continue
+            applied[name] = text
+        
+        with self.lock:
+            # 只記錄真的套用的文字；失敗的留到下一幀重試（期間排入的新文字優先）
+            self.last_rendered.update(applied)
+            for name, text in failed.items():
+                self.pending.setdefault(name, text)
+            self.frames += 1
+            self.applied_updates += len(applied)
+        return len(applied)
+    
+    def invalidate(self):
+        """清除已渲染紀錄，下一次 stage 會重新套用所有項目"""
+        with self.lock:
+            self.last_rendered.clear()
+    
+    def get_stats(self):
+        """回傳渲染統計"""
+        with self.lock:
+            return {
+                'frames': self.frames,
+                'applied_updates': self.applied_updates,
+                'skipped_updates': self.skipped_updates,
+                'pending': len(self.pending),
+            }
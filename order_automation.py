@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+🤖 條件式自動下單
+🎯 在警報規則上掛載動作，例如「BTCUSDT 跌破 104650 時市價買入 50 USDT 並設定 2% 止損」
+⚡ 直接在價格事件路徑上判斷並送出訂單，不經過對話框
+🛡️ 每筆 / 每日金額、每日次數、下單間隔、價格偏離與行情新鮮度限制，加上緊急停止開關
+⏱️ 量測從價格寫入快照到送出訂單的延遲
+"""
+
+import threading
+import time
+from collections import Counter, deque
+
+# 自動下單支援的訂單類型 → 允許的方向
+# 現貨市價賣出會賣出全部餘額，金額無法受限制，因此不開放
+SUPPORTED_ORDERS = {
+    '現貨市價': ('買入',),
+    '現貨限價': ('買入', '賣出'),
+    '合約交易': ('做多', '做空', '平倉'),
+}
+
+# 安全限制預設值
+DEFAULT_LIMITS = {
+    'max_order_usdt': 100,      # 單筆最大金額
+    'max_daily_usdt': 300,      # 每日累計最大金額
+    'max_daily_orders': 3,      # 每日最多下單次數
+    'min_interval': 60,         # 兩次自動下單的最短間隔秒數
+    'max_tick_age': 2.0,        # 價格寫入後超過幾秒就不下單
+    'max_deviation_pct': 5,     # 價格偏離觸發價超過幾 % 視為異常行情
+    'max_failures': 2,          # 連續失敗幾次後自動啟動緊急停止
+}
+
+# 跳過下單的原因
+# 這些原因跳過後解除待命：限制解除時價格可能仍在觸發範圍內，舊的穿越不應在那時才下單
+DISARM_REASONS = {'killed', 'interval', 'daily_orders', 'daily_usdt'}
+
+SKIP_REASONS = {
+    'killed': "緊急停止中",
+    'order_usdt': "超過單筆金額上限",
+    'stale': "行情過舊",
+    'deviation': "價格偏離觸發價過多",
+    'interval': "距離上次下單太近",
+    'daily_orders': "已達每日下單次數上限",
+    'daily_usdt': "已達每日金額上限",
+}
+
+
+class ArmedAction:
+    """掛在單一警報閾值上的待命動作"""
+    
+    def __init__(self, symbol, trigger, threshold, config):
+        self.symbol = symbol
+        self.trigger = trigger  # 'high' 或 'low'
+        self.threshold = float(threshold)
+        self.config = dict(config)
+        self.order_type = config.get('order_type', '現貨市價')
+        self.side = config.get('side', '買入')
+        self.quantity = float(config.get('quantity', 0))
+        self.price = config.get('price')
+        self.leverage = int(config.get('leverage', 1))
+        self.stop_loss = config.get('stop_loss')
+        self.take_profit = config.get('take_profit')
+        self.once = config.get('once', True)
+        # 新動作要先看到閾值另一側的價格才待命：啟動或重新載入時價格已越過閾值不會立即下單
+        self.armed = False
+        self.waiting_reset = True   # 可重複的動作觸發後，同樣要等價格回到閾值另一側才重新待命
+        self.fired = 0
+        self.last_skip = None
+        self.validate()
+    
+    def validate(self):
+        """檢查設定是否為支援的訂單"""
+        sides = SUPPORTED_ORDERS.get(self.order_type)
+        if sides is None:
+            raise ValueError(f"不支援的訂單類型 {self.order_type}")
+        if self.side not in sides:
+            raise ValueError(f"{self.order_type} 不支援 {self.side}")
+        if self.side != '平倉' and self.quantity <= 0:
+            raise ValueError("數量必須大於 0")
+        if self.price is not None and float(self.price) <= 0:
+            raise ValueError("價格必須大於 0")
+    
+    @property
+    def notional(self):
+        """計入金額限制的 USDT 數量（平倉只會減少曝險，不計入）"""
+        return 0.0 if self.side == '平倉' else self.quantity
+    
+    def crossed(self, price):
+        """價格是否在觸發的一側"""
+        if self.trigger == 'high':
+            return price >= self.threshold
+        return price <= self.threshold
+    
+    def describe(self):
+        """動作說明文字"""
+        condition = '>=' if self.trigger == 'high' else '<='
+        text = f"{self.symbol} {condition} {self.threshold:,.8g} → {self.order_type} {self.side}"
+        if self.side != '平倉':
+            text += f" {self.quantity:,.8g} USDT"
+        if self.stop_loss:
+            text += f" SL {self.stop_loss}%"
+        if self.take_profit:
+            text += f" TP {self.take_profit}%"
+        return text
+    
+    def build_params(self, price):
+        """產生與交易對話框相同格式的 execute_order 參數"""
+        limit_price = None
+        if "限價" in self.order_type:
+            limit_price = f"{float(self.price or price):.8f}".rstrip('0').rstrip('.')
+        return {
+            'symbol': self.symbol,
+            'order_type': self.order_type,
+            'side': self.side,
+            'quantity': f"{self.quantity:.8f}".rstrip('0').rstrip('.'),
+            'price': limit_price,
+            'leverage': self.leverage if "合約" in self.order_type else None,
+            'stop_loss': {'enabled': bool(self.stop_loss), 'percentage': float(self.stop_loss or 0)},
+            'take_profit': {'enabled': bool(self.take_profit), 'percentage': float(self.take_profit or 0)},
+        }
+
+
+class AutomationEngine:
+    """依價格事件判斷待命動作並直接下單"""
+    
+    def __init__(self, execute, notify=None, limits=None, dry_run=False, on_kill_switch=None):
+        self.execute = execute                # execute(params) → 訂單結果，失敗時拋出例外；止盈止損失敗時結果帶有 protection_error
+        self.notify = notify                  # notify(標題, 內容)
+        self.on_kill_switch = on_kill_switch  # on_kill_switch(是否停止)
+        self.limits = dict(DEFAULT_LIMITS)
+        self.update_limits(limits or {}, dry_run)
+        self.actions = {}  # 交易對 → [ArmedAction]
+        self.lock = threading.Lock()
+        self.killed = False
+        self.day = None
+        self.daily_orders = 0
+        self.daily_usdt = 0.0
+        self.last_order_at = 0.0
+        self.consecutive_failures = 0
+        self.fired = 0
+        self.failed = 0
+        self.skipped = Counter()
+        self.tick_to_send = deque(maxlen=100)
+        self.send_to_ack = deque(maxlen=100)
+        self.history = deque(maxlen=20)
+    
+    # ==================== 規則與限制 ====================
+    
+    def update_limits(self, limits, dry_run=False):
+        """更新安全限制（未指定的項目使用預設值）"""
+        self.limits = {key: limits.get(key, default) for key, default in DEFAULT_LIMITS.items()}
+        self.dry_run = dry_run
+    
+    def load(self, alert_thresholds):
+        """從警報閾值的 on_high / on_low 建立待命動作，設定沒變的動作保留原本的待命狀態"""
+        previous = {
+            (action.symbol, action.trigger): action
+            for actions in self.actions.values() for action in actions
+        }
+        actions = {}
+        for symbol, thresholds in alert_thresholds.items():
+            for trigger in ('high', 'low'):
+                config = thresholds.get(f"on_{trigger}")
+                threshold = thresholds.get(trigger)
+                if not config or not threshold:
+                    continue
+                old = previous.get((symbol, trigger))
+                if old is not None and old.threshold == float(threshold) and old.config == config:
+                    actions.setdefault(symbol, []).append(old)
+                    continue
+                try:
+                    action = ArmedAction(symbol, trigger, threshold, config)
+                except (TypeError, ValueError) as e:
+                    print(f"⚠️ 忽略 {symbol} on_{trigger} 自動下單設定: {e}")
+                    continue
+                actions.setdefault(symbol, []).append(action)
+                print(f"🤖 已載入（價格位於閾值另一側時待命）: {action.describe()}")
+        with self.lock:
+            self.actions = actions
+    
+    def get_symbols(self):
+        """有待命動作的交易對（快照匯流排的篩選條件）"""
+        return self.actions.keys()
+    
+    def set_killed(self, killed):
+        """啟動或解除緊急停止"""
+        with self.lock:
+            if self.killed == killed:
+                return
+            self.killed = killed
+            if not killed:
+                self.consecutive_failures = 0
+        print("🛑 自動下單已緊急停止" if killed else "🤖 自動下單已恢復")
+        if self.on_kill_switch:
+            self.on_kill_switch(killed)
+    
+    # ==================== 價格事件 ====================
+    
+    def on_prices(self, version, changes, published_at):
+        """快照匯流排訂閱者：changes 為有變更的交易對，published_at 為價格寫入時間"""
+        for symbol, row in changes.items():
+            for action in self.actions.get(symbol, ()):
+                self.evaluate(action, row['price'], published_at)
+    
+    def evaluate(self, action, price, published_at):
+        """判斷單一動作，條件成立且通過安全限制時下單"""
+        if not action.crossed(price):
+            if action.waiting_reset:
+                action.waiting_reset = False
+                action.armed = True
+            action.last_skip = None
+            return
+        if not action.armed:
+            return
+        
+        with self.lock:
+            now = time.monotonic()
+            reason = self.check_limits(action, price, published_at, now)
+            if reason is None:
+                # 先扣除額度並解除待命，下單期間再來的價格事件不會重複觸發
+                action.armed = False
+                action.waiting_reset = not action.once
+                action.last_skip = None
+                self.daily_orders += 1
+                self.daily_usdt += action.notional
+                self.last_order_at = now
+            elif reason in DISARM_REASONS:
+                # 要等價格回到閾值另一側、再次穿越才會觸發
+                action.armed = False
+                action.waiting_reset = True
+        if reason is not None:
+            self.skip(action, reason, price)
+            return
+        
+        self.fire(action, price, published_at)
+    
+    def check_limits(self, action, price, published_at, now):
+        """回傳不能下單的原因，可以下單時回傳 None（呼叫時需持有鎖）"""
+        limits = self.limits
+        today = time.strftime('%Y-%m-%d')
+        if self.day != today:
+            self.day = today
+            self.daily_orders = 0
+            self.daily_usdt = 0.0
+        if self.killed:
+            return 'killed'
+        if action.notional > limits['max_order_usdt']:
+            return 'order_usdt'
+        if now - published_at > limits['max_tick_age']:
+            return 'stale'
+        if abs(price - action.threshold) / action.threshold * 100 > limits['max_deviation_pct']:
+            return 'deviation'
+        if self.last_order_at and now - self.last_order_at < limits['min_interval']:
+            return 'interval'
+        if self.daily_orders >= limits['max_daily_orders']:
+            return 'daily_orders'
+        if self.daily_usdt + action.notional > limits['max_daily_usdt']:
+            return 'daily_usdt'
+        return None
+    
+    def skip(self, action, reason, price):
+        """記錄跳過的原因，同一原因只提示一次"""
+        self.skipped[reason] += 1
+        if action.last_skip == reason:
+            return
+        action.last_skip = reason
+        print(f"⏸️ {action.symbol} ${price:,.8g} 觸發自動下單但已跳過：{SKIP_REASONS[reason]}")
+    
+    def fire(self, action, price, published_at):
+        """送出訂單並記錄延遲"""
+        params = action.build_params(price)
+        sent_at = time.monotonic()
+        latency_ms = (sent_at - published_at) * 1000
+        self.tick_to_send.append(latency_ms)
+        action.fired += 1
+        
+        if self.dry_run:
+            self.record(action, price, "🧪 模擬", latency_ms)
+            print(f"🧪 模擬自動下單: {action.describe()} @ ${price:,.8g}（延遲 {latency_ms:.2f} ms）")
+            return
+        
+        try:
+            result = self.execute(params)
+            if not result:
+                raise RuntimeError("沒有產生訂單")
+        except Exception as e:
+            self.on_failure(action, price, latency_ms, e)
+            return
+        ack_ms = (time.monotonic() - sent_at) * 1000
+        self.send_to_ack.append(ack_ms)
+        if result.get('protection_error'):
+            # 主訂單已成交但沒有保護單，計入連續失敗讓緊急停止生效
+            self.on_failure(action, price, latency_ms, RuntimeError(
+                f"訂單 #{result.get('orderId', '?')} 已成交，但止盈止損設定失敗：{result['protection_error']}"
+            ))
+            return
+        with self.lock:
+            self.fired += 1
+            self.consecutive_failures = 0
+        self.record(action, price, f"✅ #{result.get('orderId', '?')}", latency_ms)
+        print(f"🤖 自動下單成功: {action.describe()} @ ${price:,.8g}（送出延遲 {latency_ms:.2f} ms，回應 {ack_ms:.0f} ms）")
+        if self.notify:
+            self.notify(
+                f"🤖 {action.symbol} 自動下單已執行",
+                f"{action.describe()}，觸發價 ${price:,.8g}，送出延遲 {latency_ms:.1f} ms"
+            )
+    
+    def on_failure(self, action, price, latency_ms, error):
+        """下單失敗：連續失敗達上限時自動緊急停止"""
+        with self.lock:
+            self.failed += 1
+            self.consecutive_failures += 1
+            trip = self.consecutive_failures >= self.limits['max_failures']
+        self.record(action, price, f"❌ {error}", latency_ms)
+        print(f"❌ 自動下單失敗: {action.describe()}: {error}")
+        if self.notify:
+            self.notify(f"❌ {action.symbol} 自動下單失敗", str(error))
+        if trip:
+            self.set_killed(True)
+            if self.notify:
+                self.notify("🛑 自動下單已緊急停止", f"連續失敗 {self.limits['max_failures']} 次")
+    
+    def record(self, action, price, result, latency_ms):
+        """保留最近的執行紀錄"""
+        self.history.append((time.time(), action.describe(), price, result, latency_ms))
+    
+    # ==================== 狀態 ====================
+    
+    def get_stats(self):
+        """回傳待命數量、執行結果與送出延遲（毫秒）"""
+        with self.lock:
+            actions = [action for actions in self.actions.values() for action in actions]
+            latencies = sorted(self.tick_to_send)
+            acks = list(self.send_to_ack)
+            return {
+                'actions': len(actions),
+                'armed': sum(1 for action in actions if action.armed),
+                'killed': self.killed,
+                'dry_run': self.dry_run,
+                'fired': self.fired,
+                'failed': self.failed,
+                'skipped': dict(self.skipped),
+                'daily_orders': self.daily_orders,
+                'daily_usdt': self.daily_usdt,
+                'p50_send_ms': latencies[len(latencies) // 2] if latencies else 0.0,
+                'max_send_ms': latencies[-1] if latencies else 0.0,
+                'avg_ack_ms': sum(acks) / len(acks) if acks else 0.0,
+                'history': list(self.history),
+            }
@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+📚 本地訂單簿
+📸 以 REST 深度快照建立，之後由 @depth@100ms 差異串流持續更新
+🔢 偵測序號缺口並自動重新同步，快照失敗時以指數退避重試並遵守 Retry-After
+⚡ 價位以排序陣列保存，可快速查詢最佳買賣價、累積深度與滑價估算
+"""
+
+import threading
+import time
+from bisect import bisect_left, insort
+
+from binance_endpoints import backoff_delay
+
+
+class OrderBookSide:
+    """訂單簿單邊：價格 → 數量，價格另存為遞增排序陣列"""
+    
+    def __init__(self, is_bid):
+        self.is_bid = is_bid
+        self.levels = {}
+        self.prices = []
+    
+    def clear(self):
+        """清除所有價位"""
+        self.levels.clear()
+        self.prices.clear()
+    
+    def update(self, price, quantity):
+        """設定價位數量，數量為 0 時移除價位"""
+        if quantity == 0:
+            if price in self.levels:
+                del self.levels[price]
+                index = bisect_left(self.prices, price)
+                if index < len(self.prices) and self.prices[index] == price:
+                    del self.prices[index]
+            return
+        if price not in self.levels:
+            insort(self.prices, price)
+        self.levels[price] = quantity
+    
+    def best(self):
+        """最佳價位 (價格, 數量)，沒有掛單時回傳 None"""
+        if not self.prices:
+            return None
+        price = self.prices[-1] if self.is_bid else self.prices[0]
+        return price, self.levels[price]
+    
+    def iter_levels(self):
+        """由最佳價位往外依序產生 (價格, 數量)"""
+        prices = reversed(self.prices) if self.is_bid else iter(self.prices)
+        for price in prices:
+            yield price, self.levels[price]
+    
+    def depth_to(self, limit_price):
+        """最佳價位到 limit_price（含）之間的累積數量與金額"""
+        if self.is_bid:
+            start = bisect_left(self.prices, limit_price)
+            prices = self.prices[start:]
+        else:
+            end = bisect_left(self.prices, limit_price)
+            if end < len(self.prices) and self.prices[end] == limit_price:
+                end += 1
+            prices = self.prices[:end]
+        quantity = sum(self.levels[p] for p in prices)
+        notional = sum(p * self.levels[p] for p in prices)
+        return quantity, notional
+
+
+class OrderBookOutOfSync(Exception):
+    """差異事件與快照序號不連續，需要重新同步"""
+
+
+class LocalOrderBook:
+    """單一交易對的本地訂單簿"""
+    
+    def __init__(self, symbol):
+        self.symbol = symbol
+        self.bids = OrderBookSide(is_bid=True)
+        self.asks = OrderBookSide(is_bid=False)
+        self.last_update_id = None
+        self.synced = False
+        self.updated_at = 0.0
+        self.lock = threading.Lock()
+    
+    def apply_snapshot(self, snapshot):
+        """套用 /api/v3/depth 快照"""
+        with self.lock:
+            self.bids.clear()
+            self.asks.clear()
+            for price, quantity in snapshot['bids']:
+                self.bids.update(float(price), float(quantity))
+            for price, quantity in snapshot['asks']:
+                self.asks.update(float(price), float(quantity))
+            self.last_update_id = snapshot['lastUpdateId']
+            self.synced = False  # 等第一個銜接的差異事件才算同步完成
+            self.updated_at = time.time()
+    
+    def apply_diff(self, event):
+        """套用 depthUpdate 事件，回傳是否有更新；序號不連續時拋出 OrderBookOutOfSync"""
+        first_id, final_id = event['U'], event['u']
+        with self.lock:
+            if self.last_update_id is None:
+                return False
+            # 快照之前的舊事件直接丟棄
+            if final_id <= self.last_update_id:
+                return False
+            if self.synced:
+                if first_id != self.last_update_id + 1:
+                    self.synced = False
+                    raise OrderBookOutOfSync(
+                        f"{self.symbol} 序號缺口：預期 {self.last_update_id + 1}，收到 {first_id}"
+                    )
+            elif not (first_id <= self.last_update_id + 1 <= final_id):
+                raise OrderBookOutOfSync(f"{self.symbol} 第一個差異事件無法銜接快照")
+            
+            for price, quantity in event['b']:
+                self.bids.update(float(price), float(quantity))
+            for price, quantity in event['a']:
+                self.asks.update(float(price), float(quantity))
+            self.last_update_id = final_id
+            self.synced = True
+            self.updated_at = time.time()
+            return True
+    
+    # ==================== 查詢 ====================
+    
+    def best_bid(self):
+        """買一 (價格, 數量)"""
+        with self.lock:
+            return self.bids.best()
+    
+    def best_ask(self):
+        """賣一 (價格, 數量)"""
+        with self.lock:
+            return self.asks.best()
+    
+    def mid_price(self):
+        """買一與賣一的中間價"""
+        with self.lock:
+            bid, ask = self.bids.best(), self.asks.best()
+        if not bid or not ask:
+            return None
+        return (bid[0] + ask[0]) / 2
+    
+    def spread(self):
+        """回傳 (價差, 價差基點)，資料不足時回傳 None"""
+        with self.lock:
+            bid, ask = self.bids.best(), self.asks.best()
+        if not bid or not ask:
+            return None
+        spread = ask[0] - bid[0]
+        mid = (bid[0] + ask[0]) / 2
+        return spread, spread / mid * 10000
+    
+    def depth_within(self, percentage):
+        """中間價上下 percentage% 內的累積 (買方數量, 買方金額, 賣方數量, 賣方金額)"""
+        mid = self.mid_price()
+        if mid is None:
+            return None
+        with self.lock:
+            bid_qty, bid_notional = self.bids.depth_to(mid * (1 - percentage / 100))
+            ask_qty, ask_notional = self.asks.depth_to(mid * (1 + percentage / 100))
+        return bid_qty, bid_notional, ask_qty, ask_notional
+    
+    def estimate_market_order(self, side, quote_quantity=None, base_quantity=None):
+        """估算市價單吃單結果：均價、相對最佳價的滑價與未成交數量"""
+        with self.lock:
+            book = self.asks if side == 'BUY' else self.bids
+            best = book.best()
+            if not best:
+                return None
+            
+            filled_base = 0.0
+            filled_quote = 0.0
+            levels = 0
+            for price, quantity in book.iter_levels():
+                levels += 1
+                if quote_quantity is not None:
+                    take = min(quantity, (quote_quantity - filled_quote) / price)
+                else:
+                    take = min(quantity, base_quantity - filled_base)
+                filled_base += take
+                filled_quote += take * price
+                if quote_quantity is not None and filled_quote >= quote_quantity * (1 - 1e-12):
+                    break
+                if base_quantity is not None and filled_base >= base_quantity * (1 - 1e-12):
+                    break
+        
+        if filled_base <= 0:
+            return None
+        average_price = filled_quote / filled_base
+        slippage_bps = abs(average_price - best[0]) / best[0] * 10000
+        if quote_quantity is not None:
+            unfilled = max(0.0, quote_quantity - filled_quote)
+        else:
+            unfilled = max(0.0, base_quantity - filled_base)
+        return {
+            'average_price': average_price,
+            'best_price': best[0],
+            'slippage_bps': slippage_bps,
+            'filled_base': filled_base,
+            'filled_quote': filled_quote,
+            'levels': levels,
+            'unfilled': unfilled,
+        }
+
+
+class OrderBookManager:
+    """維護選擇中交易對的本地訂單簿：快照 + 差異串流 + 缺口重新同步"""
+    
+    def __init__(self, ws_manager, fetch_snapshot, executor, on_update=None, interval=100, retry_after=None):
+        # fetch_snapshot(symbol) 回傳 /api/v3/depth 的 JSON；executor 為共用的 TaskExecutor
+        # retry_after() 回傳限流剩餘秒數
+        self.ws_manager = ws_manager
+        self.fetch_snapshot = fetch_snapshot
+        self.executor = executor
+        self.on_update = on_update
+        self.interval = interval
+        self.retry_after = retry_after
+        self.books = {}
+        self.streams = {}
+        self.buffers = {}
+        self.resyncing = set()
+        self.failures = {}   # 交易對 → 連續快照失敗次數
+        self.lock = threading.Lock()
+    
+    def watch(self, symbol):
+        """開始維護指定交易對的訂單簿"""
+        with self.lock:
+            if symbol in self.streams:
+                return self.books[symbol]
+            book = LocalOrderBook(symbol)
+            self.books[symbol] = book
+            self.buffers[symbol] = []
+            self.streams[symbol] = self.ws_manager.start_depth_socket(
+                callback=lambda msg, symbol=symbol: self.handle_message(symbol, msg),
+                symbol=symbol,
+                interval=self.interval,
+            )
+        self.resync(symbol)
+        return book
+    
+    def unwatch(self, symbol):
+        """停止維護指定交易對的訂單簿"""
+        with self.lock:
+            stream = self.streams.pop(symbol, None)
+            self.books.pop(symbol, None)
+            self.buffers.pop(symbol, None)
+        if stream:
+            self.ws_manager.stop_socket(stream)
+    
+    def watch_only(self, symbols):
+        """只保留指定交易對的訂單簿"""
+        for symbol in list(self.streams):
+            if symbol not in symbols:
+                self.unwatch(symbol)
+        for symbol in symbols:
+            self.watch(symbol)
+    
+    def get_book(self, symbol):
+        """取得已同步的訂單簿，尚未同步時回傳 None"""
+        book = self.books.get(symbol)
+        if book and book.synced:
+            return book
+        return None
+    
+    def resync(self, symbol):
+        """在背景重新抓取快照並套用暫存的差異事件"""
+        with self.lock:
+            if symbol in self.resyncing or symbol not in self.books:
+                return
+            self.resyncing.add(symbol)
+            self.buffers[symbol] = []
+        self.executor.submit(self.resync_worker, symbol, key=('order_book_resync', symbol))
+    
+    def resync_worker(self, symbol):
+        """抓取快照，失敗時以指數退避排程重試（不早於 Retry-After 到期）"""
+        try:
+            print(f"📸 正在取得 {symbol} 訂單簿快照...")
+            snapshot = self.fetch_snapshot(symbol)
+            with self.lock:
+                self.resyncing.discard(symbol)
+                self.failures.pop(symbol, None)
+                book = self.books.get(symbol)
+                if book is None:
+                    return
+                # 暫存的事件留給串流執行緒依序套用，避免兩個執行緒同時寫入
+                book.apply_snapshot(snapshot)
+            print(f"✅ {symbol} 訂單簿已同步（lastUpdateId {book.last_update_id}）")
+        except Exception as e:
+            with self.lock:
+                if symbol not in self.books:
+                    self.resyncing.discard(symbol)
+                    self.failures.pop(symbol, None)
+                    return
+                failures = self.failures[symbol] = self.failures.get(symbol, 0) + 1
+                # 重試的快照比暫存的事件新，舊事件不再需要
+                self.buffers[symbol] = []
+            delay = max(1.0, backoff_delay(failures - 1, base=1.0, cap=60.0))
+            if self.retry_after is not None:
+                delay = max(delay, self.retry_after())
+            print(f"❌ {symbol} 訂單簿同步失敗: {e}，{delay:.1f} 秒後重試")
+            self.executor.schedule(delay, self.resync_worker, symbol, key=('order_book_resync', symbol))
+    
+    def handle_message(self, symbol, msg):
+        """差異串流回呼"""
+        if msg.get('e') == 'error':
+            print(f"⚠️ {symbol} 深度串流錯誤: {msg.get('m')}")
+            self.resync(symbol)
+            return
+        if msg.get('e') != 'depthUpdate':
+            return
+        with self.lock:
+            book = self.books.get(symbol)
+            if book is None:
+                return
+            # 重新同步期間先暫存事件，等快照到了再套用
+            self.buffers[symbol].append(msg)
+            if symbol in self.resyncing:
+                return
+            events, self.buffers[symbol] = self.buffers[symbol], []
+        for event in events:
+            if not self.apply_event(symbol, book, event):
+                break
+    
+    def apply_event(self, symbol, book, event):
+        """套用單一差異事件，序號不連續時觸發重新同步並回傳 False"""
+        try:
+            if book.apply_diff(event) and self.on_update:
+                self.on_update(symbol, book)
+            return True
+        except OrderBookOutOfSync as e:
+            print(f"🔁 {e}，重新同步")
+            self.resync(symbol)
+            return False
+    
+    def stop(self):
+        """停止所有深度串流"""
+        for symbol in list(self.streams):
+            self.unwatch(symbol)
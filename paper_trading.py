@@ -0,0 +1,655 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+📝 模擬交易客戶端
+🔌 提供與 python-binance Client 相同的下單與帳戶方法，交易流程不需要修改就能離線演練
+⚖️ 本地撮合引擎：市價、限價、STOP_MARKET / TAKE_PROFIT_MARKET、止損限價與 OCO，含手續費與滑價
+📚 模擬餘額帳本，每筆資金變動都有紀錄
+🗂️ 掛單依觸發價排序索引，每個價格只取出被觸發的訂單，不掃描所有掛單
+
+效能比較：python3 paper_trading.py [掛單數量]
+"""
+
+import json
+import threading
+import time
+from bisect import bisect_left, bisect_right, insort
+from collections import deque
+
+# 觸發方向：rising 在價格 >= 觸發價時觸發，falling 在價格 <= 觸發價時觸發
+RISING = True
+FALLING = False
+
+
+class PaperTradingError(Exception):
+    """模擬交易的下單錯誤，格式與幣安 API 錯誤相同"""
+    
+    def __init__(self, code, message):
+        super().__init__(f"APIError(code={code}): {message}")
+        self.code = code
+        self.message = message
+
+
+class TriggerIndex:
+    """單一交易對的掛單索引，依觸發價排序"""
+    
+    def __init__(self):
+        self.rising = []   # 由低到高的 (觸發價, 訂單編號)
+        self.falling = []
+    
+    def add(self, level, order_id, direction):
+        insort(self.rising if direction else self.falling, (level, order_id))
+    
+    def remove(self, level, order_id, direction):
+        entries = self.rising if direction else self.falling
+        i = bisect_left(entries, (level, order_id))
+        if i < len(entries) and entries[i] == (level, order_id):
+            del entries[i]
+    
+    def pop_triggered(self, price):
+        """取出被這個價格觸發的訂單編號：O(log n + 觸發數量)"""
+        cut = bisect_right(self.rising, (price, float('inf')))
+        triggered = self.rising[:cut]
+        del self.rising[:cut]
+        cut = bisect_left(self.falling, (price, -1))
+        triggered += self.falling[cut:]
+        del self.falling[cut:]
+        return [order_id for _, order_id in triggered]
+    
+    def __len__(self):
+        return len(self.rising) + len(self.falling)
+
+
+def trigger_direction(order_type, side):
+    """掛單的觸發方向：限價買與止盈買在下跌時觸發，止損買在上漲時觸發，賣單相反"""
+    if order_type.startswith('STOP'):
+        return RISING if side == 'BUY' else FALLING
+    return FALLING if side == 'BUY' else RISING
+
+
+def fmt(value):
+    """與幣安回應相同的字串數值"""
+    return f"{value:.8f}"
+
+
+class PaperTradingClient:
+    """以本地撮合引擎模擬 python-binance Client"""
+    
+    def __init__(self, balances=None, futures_balance=0.0, fee_rate=0.001, futures_fee_rate=0.0004,
+                 slippage_bps=2.0, quote='USDT', price_source=None, fill_estimator=None, ledger_path=None):
+        self.quote = quote
+        self.fee_rate = fee_rate
+        self.futures_fee_rate = futures_fee_rate
+        self.slippage_bps = slippage_bps
+        self.price_source = price_source        # price_source(交易對) → 價格，沒有收到行情時使用
+        self.fill_estimator = fill_estimator    # fill_estimator(交易對, 方向, 數量) → 市價單成交均價
+        self.ledger_path = ledger_path
+        self.lock = threading.RLock()
+        
+        self.balances = {}                      # 資產 → [可用, 凍結]
+        self.futures_wallet = 0.0
+        self.positions = {}                     # 交易對 → {'amount', 'entry_price'}
+        self.leverage = {}
+        self.prices = {}                        # 交易對 → 最新價格
+        self.orders = {}                        # 訂單編號 → 訂單
+        self.indexes = {}                       # (市場, 交易對) → TriggerIndex
+        self.next_id = 1
+        self.ledger = deque(maxlen=1000)
+        self.triggered = 0
+        
+        for asset, amount in (balances or {self.quote: 10000.0}).items():
+            self.credit(asset, float(amount), 'deposit')
+        if futures_balance:
+            self.credit_futures(float(futures_balance), 'deposit')
+    
+    @classmethod
+    def from_config(cls, paper_config, price_source=None, fill_estimator=None):
+        """依 config.json 的 paper_trading 區塊建立"""
+        return cls(
+            balances=paper_config.get('balances', {'USDT': 10000}),
+            futures_balance=paper_config.get('futures_balance', 10000),
+            fee_rate=paper_config.get('fee_rate', 0.001),
+            futures_fee_rate=paper_config.get('futures_fee_rate', 0.0004),
+            slippage_bps=paper_config.get('slippage_bps', 2),
+            price_source=price_source,
+            fill_estimator=fill_estimator,
+            ledger_path=paper_config.get('ledger'),
+        )
+    
+    # ==================== 帳本 ====================
+    
+    def record(self, market, asset, amount, reason, order=None):
+        """記錄一筆資金變動（呼叫時需持有鎖）"""
+        if market == 'futures':
+            balance = self.futures_wallet
+        else:
+            free, locked = self.balances.get(asset, (0.0, 0.0))
+            balance = free + locked
+        entry = {
+            'time': time.time(), 'market': market, 'asset': asset, 'amount': amount,
+            'balance': balance, 'reason': reason,
+            'symbol': order['symbol'] if order else None, 'orderId': order['orderId'] if order else None,
+        }
+        self.ledger.append(entry)
+        if self.ledger_path:
+            with open(self.ledger_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+    
+    def credit(self, asset, amount, reason, order=None):
+        """現貨可用餘額增加（負數為減少）"""
+        balance = self.balances.setdefault(asset, [0.0, 0.0])
+        balance[0] += amount
+        self.record('spot', asset, amount, reason, order)
+    
+    def credit_futures(self, amount, reason, order=None):
+        """合約錢包增加（負數為減少）"""
+        self.futures_wallet += amount
+        self.record('futures', self.quote, amount, reason, order)
+    
+    def lock_funds(self, asset, amount):
+        """掛單凍結資金，餘額不足時拋出例外"""
+        balance = self.balances.setdefault(asset, [0.0, 0.0])
+        if balance[0] < amount * (1 - 1e-9):
+            raise PaperTradingError(-2010, "Account has insufficient balance for requested action.")
+        amount = min(amount, balance[0])
+        balance[0] -= amount
+        balance[1] += amount
+        return [asset, amount]
+    
+    def release(self, lock):
+        """取消訂單時解凍資金"""
+        if lock and lock[1] > 0:
+            balance = self.balances[lock[0]]
+            balance[0] += lock[1]
+            balance[1] -= lock[1]
+            lock[1] = 0.0
+    
+    def get_ledger(self):
+        """回傳最近的資金變動紀錄"""
+        with self.lock:
+            return list(self.ledger)
+    
+    # ==================== 行情 ====================
+    
+    def on_price(self, symbol, price):
+        """行情更新：撮合被這個價格觸發的掛單"""
+        with self.lock:
+            self.prices[symbol] = price
+            for market in ('spot', 'futures'):
+                index = self.indexes.get((market, symbol))
+                if not index:
+                    continue
+                for order_id in index.pop_triggered(price):
+                    order = self.orders[order_id]
+                    if order['status'] != 'NEW':
+                        continue
+                    self.triggered += 1
+                    try:
+                        self.on_trigger(order, price)
+                    except PaperTradingError as e:
+                        print(f"⚠️ 模擬掛單 #{order_id} 無法成交: {e.message}")
+    
+    def on_prices(self, changes):
+        """快照匯流排訂閱者：changes 為 交易對 → 資料列"""
+        for symbol, row in changes.items():
+            self.on_price(symbol, row['price'])
+    
+    def current_price(self, symbol):
+        """最新價格：優先使用收到的行情，沒有時詢問價格來源"""
+        price = self.prices.get(symbol)
+        if price is None and self.price_source is not None:
+            try:
+                price = self.price_source(symbol)
+            except (KeyError, TypeError):
+                price = None
+        if not price:
+            raise PaperTradingError(-1121, f"No price for symbol {symbol}.")
+        return price
+    
+    def market_fill_price(self, symbol, side, quantity, price):
+        """市價單成交價：有本地訂單簿時依深度估算，否則以固定 bps 滑價計算"""
+        if self.fill_estimator is not None:
+            estimate = self.fill_estimator(symbol, side, quantity)
+            if estimate:
+                return estimate
+        slippage = self.slippage_bps / 10000
+        return price * (1 + slippage) if side == 'BUY' else price * (1 - slippage)
+    
+    # ==================== 訂單與撮合 ====================
+    
+    def new_order(self, market, symbol, side, order_type, quantity=None, price=None, stop_price=None, **extra):
+        """建立訂單紀錄（呼叫時需持有鎖）"""
+        order = {
+            'market': market, 'symbol': symbol, 'orderId': self.next_id, 'side': side, 'type': order_type,
+            'quantity': float(quantity) if quantity is not None else None,
+            'price': float(price) if price is not None else 0.0,
+            'stop_price': float(stop_price) if stop_price is not None else 0.0,
+            'status': 'NEW', 'executed': 0.0, 'quote': 0.0, 'fills': [],
+            'time': int(time.time() * 1000), 'lock': None, 'oco': None, 'resting': None,
+        }
+        order.update(extra)
+        self.next_id += 1
+        self.orders[order['orderId']] = order
+        return order
+    
+    def rest(self, order, level, direction):
+        """將訂單放入觸發價索引（呼叫時需持有鎖）"""
+        key = (order['market'], order['symbol'])
+        index = self.indexes.get(key)
+        if index is None:
+            index = self.indexes[key] = TriggerIndex()
+        index.add(level, order['orderId'], direction)
+        order['resting'] = (level, direction)
+    
+    def unrest(self, order):
+        """將訂單移出觸發價索引（呼叫時需持有鎖）"""
+        if order['resting'] is not None:
+            level, direction = order['resting']
+            self.indexes[(order['market'], order['symbol'])].remove(level, order['orderId'], direction)
+            order['resting'] = None
+    
+    def rest_trigger(self, order):
+        """停損 / 止盈單依觸發價掛入索引（呼叫時需持有鎖）"""
+        self.rest(order, order['stop_price'], trigger_direction(order['type'], order['side']))
+    
+    def on_trigger(self, order, price):
+        """掛單被觸發：限價單以限價成交，停損 / 止盈單轉為市價或限價（呼叫時需持有鎖）"""
+        order['resting'] = None
+        if order['type'] == 'LIMIT' or order.get('activated'):
+            self.fill(order, order['price'])
+            return
+        # OCO 的停損單一觸發，另一張限價單就取消
+        self.cancel_siblings(order)
+        if order['type'] in ('STOP_LOSS_LIMIT', 'TAKE_PROFIT_LIMIT'):
+            order['activated'] = True
+            self.place_limit(order, price)
+        else:
+            self.fill(order, self.market_fill_price(order['symbol'], order['side'], self.order_quantity(order, price), price))
+    
+    def place_limit(self, order, price):
+        """限價單：可立即成交時以目前價格成交，否則掛在限價（呼叫時需持有鎖）"""
+        marketable = price <= order['price'] if order['side'] == 'BUY' else price >= order['price']
+        if marketable:
+            self.fill(order, price)
+        else:
+            self.rest(order, order['price'], trigger_direction('LIMIT', order['side']))
+    
+    def order_quantity(self, order, price):
+        """成交數量：市價買入以 USDT 計算，合約全部平倉以目前持倉計算"""
+        if order.get('quote_quantity'):
+            return order['quote_quantity'] / price
+        if order.get('close_position'):
+            return abs(self.positions.get(order['symbol'], {}).get('amount', 0.0))
+        return order['quantity']
+    
+    def cancel_siblings(self, order):
+        """取消同一 OCO 的另一張訂單，凍結的資金由這張訂單使用（呼叫時需持有鎖）"""
+        if order['oco'] is not None:
+            for other_id in order['oco']:
+                if other_id != order['orderId']:
+                    self.cancel(self.orders[other_id], release=False)
+    
+    def fill(self, order, price):
+        """成交並更新餘額或持倉；同一 OCO 的另一張訂單會被取消（呼叫時需持有鎖）"""
+        self.cancel_siblings(order)
+        if order['market'] == 'spot':
+            self.fill_spot(order, price)
+        else:
+            self.fill_futures(order, price)
+    
+    def fill_spot(self, order, price):
+        """現貨成交：買入的手續費以買到的幣支付，賣出以 USDT 支付"""
+        symbol = order['symbol']
+        base = symbol[:-len(self.quote)] if symbol.endswith(self.quote) else symbol
+        quantity = self.order_quantity(order, price)
+        cost = quantity * price
+        lock = order['lock']
+        try:
+            if order['side'] == 'BUY':
+                if lock:
+                    self.release(lock)
+                self.spend(self.quote, cost)
+                commission = quantity * self.fee_rate
+                self.record('spot', self.quote, -cost, 'buy', order)
+                self.credit(base, quantity - commission, 'buy', order)
+                commission_asset = base
+            else:
+                if lock:
+                    self.release(lock)
+                self.spend(base, quantity)
+                self.record('spot', base, -quantity, 'sell', order)
+                commission = cost * self.fee_rate
+                self.credit(self.quote, cost - commission, 'sell', order)
+                commission_asset = self.quote
+        except PaperTradingError:
+            order['status'] = 'EXPIRED'
+            raise
+        order['fills'].append({
+            'price': fmt(price), 'qty': fmt(quantity),
+            'commission': fmt(commission), 'commissionAsset': commission_asset,
+        })
+        self.complete(order, quantity, cost)
+    
+    def spend(self, asset, amount):
+        """扣除可用餘額，不足時拋出例外"""
+        balance = self.balances.setdefault(asset, [0.0, 0.0])
+        if balance[0] < amount * (1 - 1e-9):
+            raise PaperTradingError(-2010, "Account has insufficient balance for requested action.")
+        balance[0] -= min(amount, balance[0])
+    
+    def fill_futures(self, order, price):
+        """合約成交：同方向加倉並平均開倉價，反方向先平倉並實現盈虧"""
+        symbol = order['symbol']
+        quantity = self.order_quantity(order, price)
+        if quantity <= 0:
+            order['status'] = 'EXPIRED'
+            return
+        position = self.positions.get(symbol, {'amount': 0.0, 'entry_price': 0.0})
+        amount = position['amount']
+        if order.get('reduce_only') or order.get('close_position'):
+            # 與實盤相同：只減倉的訂單最多成交到持倉歸零，不會反手
+            quantity = min(quantity, abs(amount))
+        signed = quantity if order['side'] == 'BUY' else -quantity
+        notional = quantity * price
+        fee = notional * self.futures_fee_rate
+        
+        if amount == 0 or (amount > 0) == (signed > 0):
+            if order.get('reduce_only') or order.get('close_position'):
+                order['status'] = 'EXPIRED'
+                return
+            required = notional / self.leverage.get(symbol, 1) + fee
+            if required > self.available_futures_balance() * (1 + 1e-9):
+                order['status'] = 'EXPIRED'
+                raise PaperTradingError(-2019, "Margin is insufficient.")
+            total = amount + signed
+            position = {
+                'amount': total,
+                'entry_price': (abs(amount) * position['entry_price'] + quantity * price) / abs(total),
+            }
+        else:
+            closed = min(abs(amount), quantity)
+            pnl = closed * (price - position['entry_price']) * (1 if amount > 0 else -1)
+            self.credit_futures(pnl, 'realized_pnl', order)
+            total = amount + signed
+            if abs(total) < 1e-12:
+                position = None
+            elif (total > 0) == (amount > 0):
+                position = {'amount': total, 'entry_price': position['entry_price']}
+            else:
+                position = {'amount': total, 'entry_price': price}  # 反手
+        if position is None:
+            self.positions.pop(symbol, None)
+        else:
+            self.positions[symbol] = position
+        self.credit_futures(-fee, 'fee', order)
+        self.complete(order, quantity, notional)
+        if position is None:
+            self.cancel_close_position(symbol)
+    
+    def cancel_close_position(self, symbol):
+        """持倉歸零後取消該交易對的全部平倉單，止盈成交後止損不會繼續掛著（呼叫時需持有鎖）"""
+        index = self.indexes.get(('futures', symbol))
+        if not index:
+            return
+        for _, order_id in index.rising + index.falling:
+            order = self.orders[order_id]
+            if order.get('close_position'):
+                self.cancel(order)
+    
+    def complete(self, order, quantity, quote):
+        """標記訂單成交（呼叫時需持有鎖）"""
+        order['executed'] = quantity
+        order['quote'] = quote
+        order['status'] = 'FILLED'
+        order['update_time'] = int(time.time() * 1000)
+    
+    def cancel(self, order, release=True):
+        """取消掛單並解凍資金（呼叫時需持有鎖）"""
+        if order['status'] != 'NEW':
+            return
+        self.unrest(order)
+        order['status'] = 'CANCELED'
+        if release:
+            self.release(order['lock'])
+    
+    def available_futures_balance(self):
+        """合約可用餘額：錢包 + 未實現盈虧 - 持倉保證金（呼叫時需持有鎖）"""
+        used = 0.0
+        unrealized = 0.0
+        for symbol, position in self.positions.items():
+            price = self.prices.get(symbol, position['entry_price'])
+            used += abs(position['amount']) * position['entry_price'] / self.leverage.get(symbol, 1)
+            unrealized += position['amount'] * (price - position['entry_price'])
+        return self.futures_wallet + unrealized - used
+    
+    # ==================== 現貨介面 ====================
+    
+    def submit_spot(self, symbol, side, order_type, quantity=None, price=None, stop_price=None, quote_quantity=None):
+        """建立現貨訂單：市價立即成交，其他掛入索引"""
+        with self.lock:
+            current = self.current_price(symbol)
+            order = self.new_order('spot', symbol, side, order_type, quantity, price, stop_price,
+                                   quote_quantity=float(quote_quantity) if quote_quantity else None)
+            if order_type == 'MARKET':
+                self.fill(order, self.market_fill_price(symbol, side, self.order_quantity(order, current), current))
+                return self.format_spot(order)
+            
+            base = symbol[:-len(self.quote)] if symbol.endswith(self.quote) else symbol
+            if side == 'BUY':
+                order['lock'] = self.lock_funds(self.quote, order['quantity'] * (order['price'] or current))
+            else:
+                order['lock'] = self.lock_funds(base, order['quantity'])
+            if order_type == 'LIMIT':
+                self.place_limit(order, current)
+            else:
+                self.rest_trigger(order)
+            return self.format_spot(order)
+    
+    def order_market_buy(self, symbol, quantity=None, quoteOrderQty=None, **params):
+        return self.submit_spot(symbol, 'BUY', 'MARKET', quantity=quantity, quote_quantity=quoteOrderQty)
+    
+    def order_market_sell(self, symbol, quantity=None, **params):
+        return self.submit_spot(symbol, 'SELL', 'MARKET', quantity=quantity)
+    
+    def order_limit_buy(self, symbol, quantity, price, **params):
+        return self.submit_spot(symbol, 'BUY', 'LIMIT', quantity=quantity, price=price)
+    
+    def order_limit_sell(self, symbol, quantity, price, **params):
+        return self.submit_spot(symbol, 'SELL', 'LIMIT', quantity=quantity, price=price)
+    
+    def create_order(self, symbol, side, type, quantity=None, price=None, stopPrice=None, quoteOrderQty=None, **params):
+        return self.submit_spot(symbol, side, type, quantity=quantity, price=price, stop_price=stopPrice,
+                                quote_quantity=quoteOrderQty)
+    
+    def order_oco_sell(self, symbol, quantity, price, stopPrice, stopLimitPrice=None, **params):
+        """OCO 賣單：止盈限價與止損限價共用凍結的幣，一張成交時取消另一張"""
+        with self.lock:
+            current = self.current_price(symbol)
+            base = symbol[:-len(self.quote)] if symbol.endswith(self.quote) else symbol
+            lock = self.lock_funds(base, float(quantity))
+            limit = self.new_order('spot', symbol, 'SELL', 'LIMIT', quantity, price, lock=lock)
+            stop_type = 'STOP_LOSS_LIMIT' if stopLimitPrice else 'STOP_LOSS'
+            stop = self.new_order('spot', symbol, 'SELL', stop_type, quantity, stopLimitPrice or 0.0, stopPrice, lock=lock)
+            limit['oco'] = stop['oco'] = (limit['orderId'], stop['orderId'])
+            self.rest_trigger(stop)
+            self.place_limit(limit, current)
+            return {
+                'orderListId': limit['orderId'], 'symbol': symbol, 'listOrderStatus': 'EXECUTING',
+                'orderReports': [self.format_spot(limit), self.format_spot(stop)],
+            }
+    
+    def get_account(self, **params):
+        with self.lock:
+            return {
+                'canTrade': True,
+                'balances': [
+                    {'asset': asset, 'free': fmt(free), 'locked': fmt(locked)}
+                    for asset, (free, locked) in self.balances.items()
+                ],
+            }
+    
+    def get_open_orders(self, symbol=None, **params):
+        return self.list_orders('spot', symbol, open_only=True)
+    
+    def get_all_orders(self, symbol, limit=500, **params):
+        return self.list_orders('spot', symbol, limit=limit)
+    
+    def cancel_order(self, symbol, orderId, **params):
+        with self.lock:
+            order = self.orders.get(int(orderId))
+            if order is None or order['symbol'] != symbol or order['status'] != 'NEW':
+                raise PaperTradingError(-2011, "Unknown order sent.")
+            if order['oco'] is not None:
+                for order_id in order['oco']:
+                    self.cancel(self.orders[order_id])
+            else:
+                self.cancel(order)
+            return self.format_spot(order)
+    
+    # ==================== 合約介面 ====================
+    
+    def futures_change_leverage(self, symbol, leverage, **params):
+        with self.lock:
+            self.leverage[symbol] = int(leverage)
+            return {'symbol': symbol, 'leverage': int(leverage), 'maxNotionalValue': '1000000'}
+    
+    def futures_create_order(self, symbol, side, type, quantity=None, price=None, stopPrice=None,
+                             closePosition=False, reduceOnly=False, **params):
+        with self.lock:
+            current = self.current_price(symbol)
+            order = self.new_order(
+                'futures', symbol, side, type, quantity, price, stopPrice,
+                close_position=str(closePosition).lower() == 'true',
+                reduce_only=str(reduceOnly).lower() == 'true',
+            )
+            if type == 'MARKET':
+                self.fill(order, self.market_fill_price(symbol, side, self.order_quantity(order, current), current))
+            elif type == 'LIMIT':
+                self.place_limit(order, current)
+            elif type in ('STOP_MARKET', 'TAKE_PROFIT_MARKET'):
+                # 與實盤相同：觸發價已被目前價格越過時拒絕，不會當成市價單立即成交
+                stop = order['stop_price']
+                if current >= stop if trigger_direction(type, side) == RISING else current <= stop:
+                    del self.orders[order['orderId']]
+                    raise PaperTradingError(-2021, "Order would immediately trigger.")
+                self.rest_trigger(order)
+            else:
+                del self.orders[order['orderId']]
+                raise PaperTradingError(-1116, f"Invalid orderType {type}.")
+            return self.format_futures(order)
+    
+    def futures_cancel_order(self, symbol, orderId, **params):
+        with self.lock:
+            order = self.orders.get(int(orderId))
+            if order is None or order['symbol'] != symbol or order['status'] != 'NEW':
+                raise PaperTradingError(-2011, "Unknown order sent.")
+            self.cancel(order)
+            return self.format_futures(order)
+    
+    def futures_get_open_orders(self, symbol=None, **params):
+        return self.list_orders('futures', symbol, open_only=True)
+    
+    def futures_get_all_orders(self, symbol, limit=500, **params):
+        return self.list_orders('futures', symbol, limit=limit)
+    
+    def futures_position_information(self, symbol=None, **params):
+        with self.lock:
+            symbols = [symbol] if symbol else list(self.positions)
+            return [self.format_position(name) for name in symbols]
+    
+    def futures_account(self, **params):
+        with self.lock:
+            positions = [self.format_position(symbol) for symbol in self.positions]
+            unrealized = sum(float(pos['unRealizedProfit']) for pos in positions)
+            return {
+                'totalWalletBalance': fmt(self.futures_wallet),
+                'totalUnrealizedProfit': fmt(unrealized),
+                'availableBalance': fmt(self.available_futures_balance()),
+                'positions': positions,
+            }
+    
+    # ==================== 回應格式 ====================
+    
+    def list_orders(self, market, symbol, open_only=False, limit=500):
+        with self.lock:
+            orders = [
+                order for order in self.orders.values()
+                if order['market'] == market and (symbol is None or order['symbol'] == symbol)
+                and (not open_only or order['status'] == 'NEW')
+            ][-limit:]
+            formatter = self.format_spot if market == 'spot' else self.format_futures
+            return [formatter(order) for order in orders]
+    
+    def format_spot(self, order):
+        return {
+            'symbol': order['symbol'], 'orderId': order['orderId'], 'clientOrderId': f"paper_{order['orderId']}",
+            'transactTime': order['time'], 'price': fmt(order['price']),
+            'origQty': fmt(order['quantity'] if order['quantity'] is not None else order['executed']),
+            'executedQty': fmt(order['executed']), 'cummulativeQuoteQty': fmt(order['quote']),
+            'status': order['status'], 'timeInForce': 'GTC', 'type': order['type'], 'side': order['side'],
+            'stopPrice': fmt(order['stop_price']), 'fills': list(order['fills']),
+        }
+    
+    def format_futures(self, order):
+        executed = order['executed']
+        return {
+            'symbol': order['symbol'], 'orderId': order['orderId'], 'clientOrderId': f"paper_{order['orderId']}",
+            'status': order['status'], 'type': order['type'], 'side': order['side'],
+            'price': fmt(order['price']), 'stopPrice': fmt(order['stop_price']),
+            'avgPrice': fmt(order['quote'] / executed if executed else 0.0),
+            'origQty': fmt(order['quantity'] or executed), 'executedQty': fmt(executed), 'cumQuote': fmt(order['quote']),
+            'closePosition': order.get('close_position', False), 'reduceOnly': order.get('reduce_only', False),
+            'updateTime': order.get('update_time', order['time']),
+        }
+    
+    def format_position(self, symbol):
+        position = self.positions.get(symbol, {'amount': 0.0, 'entry_price': 0.0})
+        mark = self.prices.get(symbol, position['entry_price'])
+        pnl = position['amount'] * (mark - position['entry_price'])
+        return {
+            'symbol': symbol, 'positionAmt': fmt(position['amount']), 'entryPrice': fmt(position['entry_price']),
+            'markPrice': fmt(mark), 'unRealizedProfit': fmt(pnl), 'unrealizedPnl': fmt(pnl),
+            'leverage': str(self.leverage.get(symbol, 1)),
+        }
+
+
+def benchmark(count=5000, ticks=100000):
+    """比較觸發價索引與逐一檢查所有掛單的撮合速度"""
+    import random
+    
+    client = PaperTradingClient({'USDT': 1e12, 'BTC': 1e6}, slippage_bps=0)
+    client.on_price('BTCUSDT', 100000.0)
+    for _ in range(count):
+        if random.random() < 0.5:
+            client.order_limit_buy('BTCUSDT', 0.001, round(random.uniform(90000, 99990), 2))
+        else:
+            client.order_limit_sell('BTCUSDT', 0.001, round(random.uniform(100010, 110000), 2))
+    
+    prices = [100000.0]
+    for _ in range(ticks - 1):
+        prices.append(prices[-1] * (1 + random.gauss(0, 0.0003)))
+    resting = [(order['price'], order['side']) for order in client.orders.values() if order['status'] == 'NEW']
+    
+    start = time.perf_counter()
+    for price in prices:
+        client.on_price('BTCUSDT', price)
+    indexed = time.perf_counter() - start
+    
+    # 逐一檢查：每個價格都掃過所有掛單（只判斷，不成交）
+    scan_ticks = min(ticks, 2000)
+    start = time.perf_counter()
+    for price in prices[:scan_ticks]:
+        for level, side in resting:
+            if (side == 'BUY' and price <= level) or (side == 'SELL' and price >= level):
+                pass
+    scanned = (time.perf_counter() - start) * ticks / scan_ticks
+    
+    print(f"📚 {count:,} 張掛單，{ticks:,} 個價格，成交 {client.triggered:,} 張")
+    print(f"   觸發價索引 {indexed * 1000:>9,.1f} ms | {ticks / indexed:>12,.0f} 價格/秒")
+    print(f"   逐一檢查   {scanned * 1000:>9,.1f} ms | {ticks / scanned:>12,.0f} 價格/秒（以前 {scan_ticks:,} 個價格推估）")
+
+
+if __name__ == "__main__":
+    import sys
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
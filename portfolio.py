@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+💼 即時投資組合估值引擎
+📈 結合現貨餘額、合約持倉與即時價格，維持總資產、各幣種市值與未實現盈虧
+⚡ 價格變動時只重新計算受影響的資產，不做全量重算
+📉 追蹤資產高點與回撤，支援總資產與回撤警報
+"""
+
+import threading
+import time
+
+# 視為 1 USDT 的穩定幣
+STABLE_ASSETS = {'USDT', 'USDC', 'FDUSD', 'BUSD', 'TUSD', 'DAI'}
+
+
+class PortfolioEngine:
+    """以交易對為索引的增量估值引擎"""
+    
+    def __init__(self, quote='USDT'):
+        self.quote = quote
+        self.lock = threading.Lock()
+        
+        self.spot_holdings = {}      # 資產 → 數量
+        self.spot_values = {}        # 資產 → USDT 市值
+        self.positions = {}          # 合約交易對 → {'amount', 'entry_price'}
+        self.position_pnl = {}       # 合約交易對 → 未實現盈虧
+        self.futures_wallet = 0.0
+        self.prices = {}             # 交易對 → 最新價格
+        self.mark_prices = {}        # 合約交易對 → 標記價格（有標記價格串流時優先用來計算未實現盈虧）
+        self.symbol_assets = {}      # 交易對 → 依賴它估值的現貨資產
+        
+        self.spot_total = 0.0
+        self.unrealized_total = 0.0
+        self.peak_equity = 0.0
+        self.loaded_at = 0.0
+    
+    # ==================== 載入帳戶資料 ====================
+    
+    def load_spot_balances(self, balances):
+        """載入 get_account() 的 balances，重建現貨索引"""
+        with self.lock:
+            self.spot_holdings = {}
+            self.symbol_assets = {}
+            for asset in balances:
+                amount = float(asset['free']) + float(asset['locked'])
+                if amount <= 0:
+                    continue
+                name = asset['asset']
+                self.spot_holdings[name] = amount
+                if name not in STABLE_ASSETS:
+                    self.symbol_assets.setdefault(f"{name}{self.quote}", set()).add(name)
+            
+            self.spot_values = {name: self.value_asset(name) for name in self.spot_holdings}
+            self.spot_total = sum(self.spot_values.values())
+            self.loaded_at = time.time()
+            self.update_peak()
+    
+    def load_futures_account(self, account):
+        """載入 futures_account() 的錢包餘額與持倉"""
+        with self.lock:
+            self.futures_wallet = float(account.get('totalWalletBalance', 0))
+            self.positions = {}
+            for pos in account.get('positions', []):
+                amount = float(pos['positionAmt'])
+                if amount == 0:
+                    continue
+                self.positions[pos['symbol']] = {
+                    'amount': amount,
+                    'entry_price': float(pos['entryPrice']),
+                }
+            
+            self.position_pnl = {symbol: self.position_value(symbol) for symbol in self.positions}
+            self.unrealized_total = sum(self.position_pnl.values())
+            self.loaded_at = time.time()
+            self.update_peak()
+    
+    # ==================== 估值 ====================
+    
+    def value_asset(self, asset):
+        """計算單一現貨資產的 USDT 市值（呼叫時需持有鎖）"""
+        amount = self.spot_holdings.get(asset, 0.0)
+        if asset in STABLE_ASSETS:
+            return amount
+        price = self.prices.get(f"{asset}{self.quote}")
+        return amount * price if price else 0.0
+    
+    def position_value(self, symbol):
+        """計算單一合約持倉的未實現盈虧（呼叫時需持有鎖）"""
+        pos = self.positions.get(symbol)
+        price = self.mark_prices.get(symbol) or self.prices.get(symbol)
+        if not pos or not price:
+            return 0.0
+        return pos['amount'] * (price - pos['entry_price'])
+    
+    def on_price(self, symbol, price):
+        """價格更新：只重新計算依賴這個交易對的資產與持倉，回傳是否影響總資產"""
+        with self.lock:
+            if self.prices.get(symbol) == price:
+                return False
+            self.prices[symbol] = price
+            
+            affected = False
+            for asset in self.symbol_assets.get(symbol, ()):
+                new_value = self.value_asset(asset)
+                self.spot_total += new_value - self.spot_values.get(asset, 0.0)
+                self.spot_values[asset] = new_value
+                affected = True
+            
+            if symbol in self.positions:
+                new_pnl = self.position_value(symbol)
+                self.unrealized_total += new_pnl - self.position_pnl.get(symbol, 0.0)
+                self.position_pnl[symbol] = new_pnl
+                affected = True
+            
+            if affected:
+                self.update_peak()
+            return affected
+    
+    def on_mark_prices(self, marks):
+        """標記價格批次更新：只重新計算有持倉的合約，回傳是否影響總資產"""
+        with self.lock:
+            affected = False
+            for symbol in self.positions.keys() & marks.keys():
+                price = marks[symbol]
+                if self.mark_prices.get(symbol) == price:
+                    continue
+                self.mark_prices[symbol] = price
+                new_pnl = self.position_value(symbol)
+                self.unrealized_total += new_pnl - self.position_pnl.get(symbol, 0.0)
+                self.position_pnl[symbol] = new_pnl
+                affected = True
+            if affected:
+                self.update_peak()
+            return affected
+    
+    def required_symbols(self):
+        """估值需要價格的交易對"""
+        with self.lock:
+            return set(self.symbol_assets) | set(self.positions)
+    
+    def spot_symbols(self):
+        """現貨資產估值需要的交易對"""
+        with self.lock:
+            return set(self.symbol_assets)
+    
+    def position_symbols(self):
+        """有合約持倉的交易對"""
+        with self.lock:
+            return set(self.positions)
+    
+    @property
+    def equity(self):
+        """總資產 = 現貨市值 + 合約錢包 + 合約未實現盈虧"""
+        return self.spot_total + self.futures_wallet + self.unrealized_total
+    
+    def update_peak(self):
+        """更新資產高點（呼叫時需持有鎖）"""
+        self.peak_equity = max(self.peak_equity, self.equity)
+    
+    def drawdown_percentage(self):
+        """目前相對資產高點的回撤百分比"""
+        with self.lock:
+            if self.peak_equity <= 0:
+                return 0.0
+            return max(0.0, (self.peak_equity - self.equity) / self.peak_equity * 100)
+    
+    def check_alerts(self, low=None, high=None, max_drawdown=None):
+        """檢查總資產與回撤警報，回傳觸發的 (鍵, 標題, 內容) 清單"""
+        equity = self.equity
+        drawdown = self.drawdown_percentage()
+        alerts = []
+        if low and equity <= low:
+            alerts.append(('equity_low', "📉 總資產低於警戒值",
+                           f"目前總資產 ${equity:,.2f} 已低於 ${low:,.2f}"))
+        if high and equity >= high:
+            alerts.append(('equity_high', "📈 總資產達到目標",
+                           f"目前總資產 ${equity:,.2f} 已達到 ${high:,.2f}"))
+        if max_drawdown and drawdown >= max_drawdown:
+            alerts.append(('drawdown', "⚠️ 資產回撤警報",
+                           f"目前回撤 {drawdown:.2f}%（高點 ${self.peak_equity:,.2f}，現在 ${equity:,.2f}）"))
+        return alerts
+    
+    def get_snapshot(self):
+        """回傳目前估值摘要"""
+        with self.lock:
+            spot = sorted(
+                ((asset, self.spot_holdings[asset], value) for asset, value in self.spot_values.items()),
+                key=lambda item: item[2], reverse=True,
+            )
+            positions = [
+                (
+                    symbol, pos['amount'], pos['entry_price'],
+                    self.mark_prices.get(symbol) or self.prices.get(symbol), self.position_pnl.get(symbol, 0.0),
+                )
+                for symbol, pos in self.positions.items()
+            ]
+            return {
+                'equity': self.equity,
+                'spot_total': self.spot_total,
+                'futures_wallet': self.futures_wallet,
+                'unrealized_pnl': self.unrealized_total,
+                'peak_equity': self.peak_equity,
+                'spot': spot,
+                'positions': positions,
+                'loaded_at': self.loaded_at,
+            }
@@ -0,0 +1,462 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+📡 本地價格分發伺服器
+🔁 只維持一個上游連線，每個交易對每輪只向幣安抓取一次
+🌐 以 HTTP/JSON 提供目前的價格快照，並以 SSE 推送變更給所有訂閱者
+🖥️ 選單欄應用可設定 server.url 改為這個伺服器的客戶端
+
+啟動方式：
+    python3 price_server.py [--host 127.0.0.1] [--port 8765] [--config config.json]
+"""
+
+import argparse
+import json
+import re
+import sys
+import threading
+import time
+import urllib.parse
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from binance_endpoints import BinanceEndpointPool, CircuitOpenError, backoff_delay
+from shared_prices import SharedPriceTable, DEFAULT_NAME as SHARED_PRICES_NAME
+
+SYMBOL_PATTERN = re.compile(r'^[A-Z0-9]{2,20}$')
+KNOWN_SYMBOLS_TTL = 3600  # 幣安交易對清單的快取秒數
+
+
+def ticker_to_row(data):
+    """將幣安 24hr ticker 轉成與 crypto_data 相同欄位的資料列"""
+    return {
+        'price': float(data['lastPrice']),
+        'change_24h': float(data['priceChangePercent']),
+        'high_24h': float(data['highPrice']),
+        'low_24h': float(data['lowPrice']),
+        'volume': float(data['volume']),
+    }
+
+
+class PriceHub:
+    """上游抓取與訂閱者廣播的共用狀態"""
+    
+    def __init__(self, endpoint_pool, symbols, poll_interval=2, max_symbols=200, symbol_ttl=600):
+        self.endpoint_pool = endpoint_pool
+        self.poll_interval = poll_interval
+        self.max_symbols = max_symbols      # 上游交易對數量上限
+        self.symbol_ttl = symbol_ttl        # 客戶端加入的交易對多久沒人要求就移除
+        self.symbols = set(symbols)
+        self.base_symbols = set(symbols)    # 設定檔的交易對，永遠保留
+        self.last_requested = {}            # 交易對 → 最後一次被要求的時間
+        self.symbol_users = Counter()       # 交易對 → 正在訂閱的 SSE 連線數
+        self.known_symbols = set()          # 幣安目前的交易對清單
+        self.known_at = 0.0
+        self.snapshot = {}
+        self.version = 0
+        self.last_delta = (0, b'')  # (版本, 已序列化的變更事件)
+        self.last_changes = {}      # 最新版本的變更資料列
+        self.filtered_deltas = {}   # 篩選交易對 → 最新版本篩選後的變更事件，同樣篩選的訂閱者共用
+        self.condition = threading.Condition()
+        self.subscribers = 0
+        self.running = True
+        self.shared_table = None  # 可選的共享記憶體價格表
+    
+    # ==================== 上游 ====================
+    
+    def ensure_symbols(self, symbols):
+        """
+        加入客戶端要求的交易對，成功時回傳 None，否則回傳錯誤訊息
+        新交易對以快取的交易對清單驗證，再以一次批次請求取得資料，不會逐一向幣安查詢
+        """
+        now = time.monotonic()
+        with self.condition:
+            for symbol in symbols:
+                if symbol in self.symbols:
+                    self.last_requested[symbol] = now
+            new_symbols = [s for s in dict.fromkeys(symbols) if s not in self.symbols and SYMBOL_PATTERN.match(s)]
+        if not new_symbols:
+            return None
+        
+        try:
+            if now - self.known_at > KNOWN_SYMBOLS_TTL:
+                tickers = self.endpoint_pool.get_json('/api/v3/ticker/price')
+                self.known_symbols = {data['symbol'] for data in tickers}
+                self.known_at = now
+        except (requests.exceptions.RequestException, CircuitOpenError) as e:
+            # 連線失敗或斷路器開啟不代表交易對無效，下次請求再驗證
+            print(f"⚠️ 無法取得交易對清單: {e}")
+            return "Upstream unavailable"
+        invalid = [s for s in new_symbols if s not in self.known_symbols]
+        if invalid:
+            print(f"⚠️ 忽略無效的交易對: {', '.join(invalid)}")
+        new_symbols = [s for s in new_symbols if s in self.known_symbols]
+        if not new_symbols:
+            return None
+        
+        if len(self.symbols) + len(new_symbols) > self.max_symbols:
+            self.expire_symbols()
+            if len(self.symbols) + len(new_symbols) > self.max_symbols:
+                print(f"⚠️ 上游交易對已達上限 {self.max_symbols}，拒絕新增: {', '.join(new_symbols)}")
+                return "Too many symbols"
+        try:
+            tickers = self.endpoint_pool.get_json(
+                '/api/v3/ticker/24hr', {'symbols': json.dumps(new_symbols, separators=(',', ':'))}
+            )
+        except (requests.exceptions.RequestException, CircuitOpenError) as e:
+            print(f"⚠️ 無法取得新交易對 {', '.join(new_symbols)}: {e}")
+            return "Upstream unavailable"
+        with self.condition:
+            for symbol in new_symbols:
+                self.symbols.add(symbol)
+                self.last_requested[symbol] = now
+        self.publish({data['symbol']: ticker_to_row(data) for data in tickers})
+        print(f"➕ 新增上游交易對: {', '.join(new_symbols)}")
+        return None
+    
+    def expire_symbols(self):
+        """移除沒有 SSE 訂閱者、且超過 symbol_ttl 秒沒被要求的客戶端交易對"""
+        now = time.monotonic()
+        with self.condition:
+            expired = [
+                s for s in self.symbols - self.base_symbols
+                if not self.symbol_users[s] and now - self.last_requested.get(s, 0.0) > self.symbol_ttl
+            ]
+            for symbol in expired:
+                self.symbols.discard(symbol)
+                self.snapshot.pop(symbol, None)
+                self.last_requested.pop(symbol, None)
+        if expired:
+            print(f"➖ 移除沒人使用的上游交易對: {', '.join(expired)}")
+    
+    def add_subscriber(self, symbols):
+        """SSE 連線開始：訂閱中的交易對不會被移除"""
+        with self.condition:
+            self.subscribers += 1
+            self.symbol_users.update(symbols)
+    
+    def remove_subscriber(self, symbols):
+        """SSE 連線結束"""
+        now = time.monotonic()
+        with self.condition:
+            self.subscribers -= 1
+            self.symbol_users.subtract(symbols)
+            for symbol in symbols:
+                if self.symbol_users[symbol] <= 0:
+                    del self.symbol_users[symbol]
+                    self.last_requested[symbol] = now
+    
+    def poll_worker(self):
+        """每輪以一次批次請求抓取所有交易對"""
+        failures = 0
+        while self.running:
+            self.expire_symbols()
+            with self.condition:
+                symbols = sorted(self.symbols)
+            delay = self.poll_interval
+            try:
+                if symbols:
+                    tickers = self.endpoint_pool.get_json(
+                        '/api/v3/ticker/24hr', {'symbols': json.dumps(symbols, separators=(',', ':'))}
+                    )
+                    self.publish({data['symbol']: ticker_to_row(data) for data in tickers})
+                failures = 0
+            except Exception as e:
+                failures += 1
+                delay = backoff_delay(failures - 1, base=1.0, cap=self.poll_interval * 10)
+                # 被限流（Retry-After）或所有主機斷路器都開啟時，等到可以再發出請求才重試
+                delay = max(delay, self.endpoint_pool.next_request_delay())
+                print(f"❌ 上游抓取失敗: {e}，{delay:.1f} 秒後重試")
+            time.sleep(delay)
+    
+    # ==================== 廣播 ====================
+    
+    def publish(self, rows):
+        """只廣播有變更的資料列"""
+        now = time.time()
+        with self.condition:
+            changes = {}
+            for symbol, row in rows.items():
+                previous = self.snapshot.get(symbol)
+                if previous is not None and all(previous[k] == v for k, v in row.items()):
+                    continue
+                row = dict(row, updated_at=now)
+                self.snapshot[symbol] = row
+                changes[symbol] = row
+            if not changes:
+                return
+            if self.shared_table is not None:
+                self.shared_table.update_many(changes)
+            self.version += 1
+            # 每個版本只序列化一次，所有訂閱者共用同一份位元組
+            payload = json.dumps({'version': self.version, 'data': changes}, separators=(',', ':'))
+            self.last_delta = (self.version, f"event: delta\ndata: {payload}\n\n".encode('utf-8'))
+            self.last_changes = changes
+            self.filtered_deltas = {}
+            self.condition.notify_all()
+    
+    def get_snapshot(self, symbols=None):
+        """回傳 (版本, 快照)"""
+        with self.condition:
+            if symbols:
+                data = {s: self.snapshot[s] for s in symbols if s in self.snapshot}
+            else:
+                data = dict(self.snapshot)
+            return self.version, data
+    
+    def wait_for_update(self, seen_version, timeout, symbols=None):
+        """
+        等待比 seen_version 新的版本，回傳 (版本, 變更事件或 None)
+        有篩選交易對時回傳篩選後的變更事件，沒有相關變更時為空位元組
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: self.version > seen_version or not self.running, timeout)
+            version, payload = self.last_delta
+            if version != seen_version + 1:
+                # 訂閱者落後超過一個版本時改送完整快照，慢的訂閱者不會拖住其他人
+                return self.version, None
+            if symbols:
+                payload = self.filtered_delta(frozenset(symbols))
+            return version, payload
+    
+    def filtered_delta(self, symbols):
+        """最新版本篩選後的變更事件，每個版本每種篩選只序列化一次（呼叫時需持有鎖）"""
+        payload = self.filtered_deltas.get(symbols)
+        if payload is None:
+            changes = {s: row for s, row in self.last_changes.items() if s in symbols}
+            if changes:
+                data = json.dumps({'version': self.version, 'data': changes}, separators=(',', ':'))
+                payload = f"event: delta\ndata: {data}\n\n".encode('utf-8')
+            else:
+                payload = b''
+            self.filtered_deltas[symbols] = payload
+        return payload
+
+
+class PriceRequestHandler(BaseHTTPRequestHandler):
+    """/snapshot 回傳 JSON 快照，/stream 以 SSE 推送變更"""
+    
+    hub = None
+    protocol_version = 'HTTP/1.1'
+    
+    def log_message(self, format, *args):
+        """不輸出每個請求的存取紀錄"""
+        pass
+    
+    def parse_symbols(self, query):
+        """解析 ?symbols=A,B 查詢參數"""
+        symbols = query.get('symbols', [''])[0]
+        return [s.strip().upper() for s in symbols.split(',') if s.strip()]
+    
+    def do_GET(self):
+        """依路徑分派 /snapshot、/stream 與 /health"""
+        url = urllib.parse.urlparse(self.path)
+        query = urllib.parse.parse_qs(url.query)
+        symbols = self.parse_symbols(query)
+        if symbols:
+            error = self.hub.ensure_symbols(symbols)
+            if error:
+                self.send_error(503, error)
+                return
+        
+        if url.path == '/snapshot':
+            version, data = self.hub.get_snapshot(symbols)
+            body = json.dumps({'version': version, 'data': data}, separators=(',', ':')).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        elif url.path == '/stream':
+            self.stream(set(symbols))
+        elif url.path == '/health':
+            body = json.dumps({
+                'symbols': len(self.hub.symbols),
+                'subscribers': self.hub.subscribers,
+                'version': self.hub.version,
+            }).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self.send_error(404)
+    
+    def send_event(self, event, data):
+        """寫出一個 SSE 事件"""
+        payload = json.dumps(data, separators=(',', ':'))
+        self.wfile.write(f"event: {event}\ndata: {payload}\n\n".encode('utf-8'))
+    
+    def stream(self, symbols):
+        """SSE：先送完整快照，之後推送變更"""
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'keep-alive')
+        self.end_headers()
+        self.close_connection = True
+        
+        hub = self.hub
+        hub.add_subscriber(symbols)
+        try:
+            version, data = hub.get_snapshot(symbols)
+            self.send_event('snapshot', {'version': version, 'data': data})
+            self.wfile.flush()
+            last_write = time.monotonic()
+            while hub.running:
+                new_version, payload = hub.wait_for_update(version, timeout=15, symbols=symbols)
+                if payload is None and new_version != version:
+                    # 落後時送出（篩選後的）完整快照
+                    new_version, data = hub.get_snapshot(symbols)
+                    self.send_event('snapshot', {'version': new_version, 'data': data})
+                elif payload:
+                    self.wfile.write(payload)
+                elif time.monotonic() - last_write >= 15:
+                    # 沒有新版本或只有其他交易對的變更時，定期送出 keepalive
+                    self.wfile.write(b": keepalive\n\n")
+                else:
+                    version = new_version
+                    continue
+                version = new_version
+                last_write = time.monotonic()
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            hub.remove_subscriber(symbols)
+
+
+class PriceServerClient:
+    """選單欄應用使用的 SSE 客戶端，收到變更時呼叫 on_update(rows)"""
+    
+    def __init__(self, base_url, on_update):
+        self.base_url = base_url.rstrip('/')
+        self.on_update = on_update
+        self.symbols = []
+        self.running = False
+        self.thread = None
+        self.response = None
+        self.connected = False
+    
+    def get_snapshot(self, symbols):
+        """以 HTTP 取得指定交易對的快照"""
+        response = requests.get(
+            f"{self.base_url}/snapshot", params={'symbols': ','.join(symbols)}, timeout=5
+        )
+        response.raise_for_status()
+        return response.json()['data']
+    
+    def start(self, symbols):
+        """開始（或改為）訂閱指定交易對的推送"""
+        symbols = list(symbols)
+        if symbols == self.symbols and self.running:
+            return
+        self.symbols = symbols
+        if self.response is not None:
+            # 關閉目前的連線，讓背景執行緒用新的交易對重新連線
+            self.response.close()
+        if not self.running:
+            self.running = True
+            self.thread = threading.Thread(target=self.stream_worker, daemon=True)
+            self.thread.start()
+    
+    def stop(self):
+        """停止推送並關閉連線"""
+        self.running = False
+        if self.response is not None:
+            self.response.close()
+    
+    def stream_worker(self):
+        """維持 SSE 連線，斷線時以指數退避重新連線"""
+        failures = 0
+        while self.running:
+            try:
+                self.response = requests.get(
+                    f"{self.base_url}/stream",
+                    params={'symbols': ','.join(self.symbols)},
+                    stream=True,
+                    timeout=(5, 60),
+                )
+                self.response.raise_for_status()
+                self.connected = True
+                failures = 0
+                print(f"📡 已連線到價格伺服器 {self.base_url}")
+                for line in self.response.iter_lines(decode_unicode=True):
+                    if not self.running:
+                        break
+                    if line and line.startswith('data: '):
+                        message = json.loads(line[6:])
+                        self.on_update(message['data'])
+            except Exception as e:
+                if self.running:
+                    print(f"⚠️ 價格伺服器連線中斷: {e}")
+            finally:
+                self.connected = False
+            if self.running:
+                failures += 1
+                time.sleep(backoff_delay(failures - 1, base=1.0, cap=30))
+
+
+def main():
+    """以伺服器模式啟動"""
+    parser = argparse.ArgumentParser(description="加密貨幣價格分發伺服器")
+    parser.add_argument('--config', default='config.json')
+    parser.add_argument('--host')
+    parser.add_argument('--port', type=int)
+    args = parser.parse_args()
+    
+    try:
+        with open(args.config, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+    except Exception as e:
+        print(f"❌ 載入配置檔案時發生錯誤: {e}")
+        return 1
+    
+    server_config = config.get('server', {})
+    host = args.host or server_config.get('host', '127.0.0.1')
+    port = args.port or server_config.get('port', 8765)
+    symbols = set(config.get('trading_pairs', [])) | set(config.get('alert_thresholds', {}))
+    
+    hub = PriceHub(
+        BinanceEndpointPool.from_config(config.get('network', {})),
+        symbols,
+        poll_interval=server_config.get('poll_interval', 2),
+        max_symbols=server_config.get('max_symbols', 200),
+        symbol_ttl=server_config.get('symbol_ttl', 600),
+    )
+    shared_config = config.get('shared_memory', {})
+    if shared_config.get('enabled', False):
+        name = shared_config.get('name', SHARED_PRICES_NAME)
+        try:
+            hub.shared_table = SharedPriceTable(name, capacity=shared_config.get('capacity', 512))
+            print(f"🧠 共享價格表已建立: {name}")
+        except Exception as e:
+            print(f"⚠️ 無法建立共享價格表: {e}")
+    threading.Thread(target=hub.poll_worker, daemon=True).start()
+    
+    PriceRequestHandler.hub = hub
+    httpd = ThreadingHTTPServer((host, port), PriceRequestHandler)
+    httpd.daemon_threads = True
+    print(f"📡 價格伺服器已啟動: http://{host}:{port}（{len(symbols)} 個交易對）")
+    print("   GET /snapshot?symbols=BTCUSDT,ETHUSDT  取得 JSON 快照")
+    print("   GET /stream?symbols=BTCUSDT            以 SSE 接收推送")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        print("🛑 價格伺服器已停止")
+    finally:
+        hub.running = False
+        with hub.condition:
+            hub.condition.notify_all()
+        httpd.server_close()
+        if hub.shared_table is not None:
+            hub.shared_table.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
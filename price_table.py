@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+📊 欄式價格表
+🧱 取代 dict-of-dicts 的 crypto_data：每個欄位是一個 array('d')，交易對對應到列號
+✏️ 更新直接寫入原本的位置，不會為每次更新建立新的 dict
+🧮 批次 ticker 回應可一次寫入多列（有安裝 NumPy 時以向量化方式寫入）
+🔁 提供與原本相同的 dict 介面：table['BTCUSDT']['price']、in、get、pop
+
+效能比較：python3 price_table.py [交易對數量]
+"""
+
+import threading
+from array import array
+from collections.abc import Mapping, MutableMapping
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+FIELDS = ('price', 'change_24h', 'high_24h', 'low_24h', 'volume')
+
+# 24hr ticker 回應欄位 → 價格表欄位
+TICKER_FIELDS = {
+    'price': 'lastPrice',
+    'change_24h': 'priceChangePercent',
+    'high_24h': 'highPrice',
+    'low_24h': 'lowPrice',
+    'volume': 'volume',
+}
+
+
+class PriceRow(Mapping):
+    """單一交易對的唯讀檢視，欄位值直接從欄陣列讀取"""
+    
+    __slots__ = ('columns', 'row')
+    
+    def __init__(self, columns, row):
+        self.columns = columns
+        self.row = row
+    
+    def __getitem__(self, field):
+        return self.columns[field][self.row]
+    
+    def __iter__(self):
+        return iter(FIELDS)
+    
+    def __len__(self):
+        return len(FIELDS)
+    
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class PriceTable(MutableMapping):
+    """交易對 → 資料列 的欄式價格表"""
+    
+    def __init__(self):
+        self.columns = {field: array('d') for field in FIELDS}
+        # 常用欄位另存為屬性，單筆更新時省去 dict 查詢
+        self.prices = self.columns['price']
+        self.changes = self.columns['change_24h']
+        self.highs = self.columns['high_24h']
+        self.lows = self.columns['low_24h']
+        self.volumes = self.columns['volume']
+        self.index = {}      # 交易對 → 列號
+        self.free_rows = []  # 移除交易對後可重複使用的列號
+        self.lock = threading.Lock()
+    
+    def row_for(self, symbol):
+        """取得交易對的列號，新交易對配置一列（呼叫時需持有鎖）"""
+        row = self.index.get(symbol)
+        if row is None:
+            if self.free_rows:
+                row = self.free_rows.pop()
+            else:
+                row = len(self.columns['price'])
+                for column in self.columns.values():
+                    column.append(0.0)
+            self.index[symbol] = row
+        return row
+    
+    # ==================== dict 介面 ====================
+    
+    def __getitem__(self, symbol):
+        return PriceRow(self.columns, self.index[symbol])
+    
+    def __setitem__(self, symbol, data):
+        with self.lock:
+            row = self.index.get(symbol)
+            if row is None:
+                row = self.row_for(symbol)
+            self.prices[row] = data['price']
+            self.changes[row] = data['change_24h']
+            self.highs[row] = data['high_24h']
+            self.lows[row] = data['low_24h']
+            self.volumes[row] = data['volume']
+    
+    def __delitem__(self, symbol):
+        with self.lock:
+            row = self.index.pop(symbol)
+            self.free_rows.append(row)
+    
+    def pop(self, symbol, *default):
+        """移除交易對並回傳資料列的複本（列號之後可能被其他交易對重複使用）"""
+        with self.lock:
+            row = self.index.pop(symbol, None)
+            if row is None:
+                if default:
+                    return default[0]
+                raise KeyError(symbol)
+            self.free_rows.append(row)
+            return {field: self.columns[field][row] for field in FIELDS}
+    
+    def __contains__(self, symbol):
+        return symbol in self.index
+    
+    def __iter__(self):
+        return iter(list(self.index))
+    
+    def __len__(self):
+        return len(self.index)
+    
+    # ==================== 批次更新 ====================
+    
+    def update_rows(self, rows):
+        """一次寫入多個交易對：rows 為 交易對 → 資料列"""
+        with self.lock:
+            positions = [self.row_for(symbol) for symbol in rows]
+            values = list(rows.values())
+            for field in FIELDS:
+                self.scatter(field, positions, [data[field] for data in values])
+    
+    def update_values(self, rows):
+        """寫入 (交易對, 欄位值 tuple) 序列，tuple 順序與 FIELDS 相同，回傳更新的交易對清單"""
+        symbols = []
+        with self.lock:
+            prices, changes, highs, lows, volumes = (
+                self.prices, self.changes, self.highs, self.lows, self.volumes
+            )
+            for symbol, (price, change, high, low, volume) in rows:
+                row = self.index.get(symbol)
+                if row is None:
+                    row = self.row_for(symbol)
+                prices[row] = price
+                changes[row] = change
+                highs[row] = high
+                lows[row] = low
+                volumes[row] = volume
+                symbols.append(symbol)
+        return symbols
+    
+    def update_tickers(self, tickers):
+        """直接寫入 /api/v3/ticker/24hr 批次回應，回傳更新的交易對清單"""
+        symbols = [data['symbol'] for data in tickers]
+        with self.lock:
+            positions = [self.row_for(symbol) for symbol in symbols]
+            if NUMPY_AVAILABLE and len(positions) > 32:
+                for field, key in TICKER_FIELDS.items():
+                    self.scatter(field, positions, [data[key] for data in tickers])
+                return symbols
+            prices, changes, highs, lows, volumes = (
+                self.prices, self.changes, self.highs, self.lows, self.volumes
+            )
+            for row, data in zip(positions, tickers):
+                prices[row] = float(data['lastPrice'])
+                changes[row] = float(data['priceChangePercent'])
+                highs[row] = float(data['highPrice'])
+                lows[row] = float(data['lowPrice'])
+                volumes[row] = float(data['volume'])
+        return symbols
+    
+    def scatter(self, field, positions, values):
+        """將 values 寫入欄位的指定列（呼叫時需持有鎖）"""
+        column = self.columns[field]
+        if NUMPY_AVAILABLE and len(positions) > 32:
+            # 暫時以 NumPy 檢視陣列緩衝區，寫完立即釋放，之後陣列仍可擴充
+            view = np.frombuffer(column, dtype=np.float64)
+            view[positions] = np.asarray(values, dtype=np.float64)
+            del view
+        else:
+            for row, value in zip(positions, values):
+                column[row] = value
+    
+    def get_column(self, field):
+        """回傳 (交易對清單, 對應欄位值清單)"""
+        with self.lock:
+            column = self.columns[field]
+            symbols = list(self.index)
+            return symbols, [column[self.index[symbol]] for symbol in symbols]
+    
+    def nbytes(self):
+        """欄陣列與索引使用的記憶體（位元組）"""
+        import sys
+        total = sum(column.buffer_info()[1] * column.itemsize for column in self.columns.values())
+        return total + sys.getsizeof(self.index)
+
+
+def benchmark(count=5000, rounds=20):
+    """比較 dict-of-dicts 與欄式價格表的記憶體用量與更新速度"""
+    import random
+    import time
+    import tracemalloc
+    
+    symbols = [f"COIN{i}USDT" for i in range(count)]
+    tickers = [
+        {
+            'symbol': symbol, 'lastPrice': str(random.uniform(0.01, 50000)),
+            'priceChangePercent': str(random.uniform(-10, 10)), 'highPrice': '60000',
+            'lowPrice': '0.001', 'volume': str(random.uniform(0, 1e6)),
+        }
+        for symbol in symbols
+    ]
+    
+    def fill_dicts():
+        data = {}
+        for ticker in tickers:
+            data[ticker['symbol']] = {
+                'price': float(ticker['lastPrice']),
+                'change_24h': float(ticker['priceChangePercent']),
+                'high_24h': float(ticker['highPrice']),
+                'low_24h': float(ticker['lowPrice']),
+                'volume': float(ticker['volume']),
+            }
+        return data
+    
+    def fill_table(table=None):
+        table = table if table is not None else PriceTable()
+        table.update_tickers(tickers)
+        return table
+    
+    for name, fill in (('dict-of-dicts', fill_dicts), ('PriceTable', fill_table)):
+        tracemalloc.start()
+        data = fill()
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        
+        start = time.perf_counter()
+        for _ in range(rounds):
+            if name == 'PriceTable':
+                fill_table(data)
+            else:
+                data = fill_dicts()
+        batch_rate = count * rounds / (time.perf_counter() - start)
+        
+        row = {'price': 1.0, 'change_24h': 2.0, 'high_24h': 3.0, 'low_24h': 0.5, 'volume': 10.0}
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for symbol in symbols:
+                data[symbol] = dict(row) if name == 'dict-of-dicts' else row
+        single_rate = count * rounds / (time.perf_counter() - start)
+        
+        print(
+            f"{name:<14} 記憶體 {memory / 1024:>8,.0f} KB | 批次更新 {batch_rate:>12,.0f} 列/秒"
+            f" | 單筆更新 {single_rate:>12,.0f} 列/秒"
+        )
+    print(f"NumPy: {'已安裝' if NUMPY_AVAILABLE else '未安裝'}")
+
+
+if __name__ == "__main__":
+    import sys
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
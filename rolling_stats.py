@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+📐 本地滾動視窗統計
+🕯️ 以 1m K 線維護 24h（以及自訂 1h、4h 等）視窗的最高、最低、成交量與漲跌幅
+📉 最高 / 最低使用單調佇列、成交量使用累計和，每根 K 線的更新攤銷為 O(1)
+🌱 啟動時以 REST K 線播種一次，之後完全由串流維持，不需要輪詢 /ticker/24hr
+"""
+
+import math
+import threading
+from collections import deque
+
+# 預設視窗：名稱 → 毫秒
+DEFAULT_WINDOWS = {'24h': 24 * 60 * 60 * 1000}
+
+WINDOW_UNITS = {'m': 60 * 1000, 'h': 60 * 60 * 1000, 'd': 24 * 60 * 60 * 1000}
+
+BAR_MS = 60 * 1000
+
+# 播種完成前最多暫存的串流 K 線數量
+MAX_PENDING = 60
+
+
+def parse_window(name):
+    """將 '1h'、'4h'、'30m' 轉為毫秒"""
+    return int(name[:-1]) * WINDOW_UNITS[name[-1]]
+
+
+def parse_windows(names):
+    """24h 視窗加上配置中的自訂視窗，回傳 名稱 → 毫秒"""
+    windows = dict(DEFAULT_WINDOWS)
+    for name in names or []:
+        try:
+            windows[name] = parse_window(name)
+        except (ValueError, KeyError, IndexError):
+            print(f"⚠️ 無法解析滾動視窗 {name}，格式例如 1h、4h、30m")
+    return windows
+
+
+class RollingWindow:
+    """固定長度的滾動視窗：單調佇列維護最高 / 最低，累計和維護成交量"""
+    
+    def __init__(self, length_ms):
+        self.length = length_ms
+        self.bars = deque()   # (開盤時間, 開盤價, 成交量)
+        self.highs = deque()  # 最高價遞減的 (開盤時間, 最高價)
+        self.lows = deque()   # 最低價遞增的 (開盤時間, 最低價)
+        self.volume = 0.0
+        self.pushes = 0
+    
+    def push(self, open_time, open_price, high, low, volume):
+        """加入一根已完成的 K 線"""
+        self.bars.append((open_time, open_price, volume))
+        self.volume += volume
+        highs = self.highs
+        while highs and highs[-1][1] <= high:
+            highs.pop()
+        highs.append((open_time, high))
+        lows = self.lows
+        while lows and lows[-1][1] >= low:
+            lows.pop()
+        lows.append((open_time, low))
+        # 累計和反覆加減會累積浮點誤差，每換過一整個視窗就重新加總一次（攤銷仍為 O(1)）
+        self.pushes += 1
+        if self.pushes >= len(self.bars):
+            self.pushes = 0
+            self.volume = math.fsum(bar[2] for bar in self.bars)
+    
+    def expire(self, current_open):
+        """移出已離開視窗的 K 線：視窗包含目前這根 K 線在內的 length 毫秒"""
+        cutoff = current_open - self.length
+        bars = self.bars
+        while bars and bars[0][0] <= cutoff:
+            self.volume -= bars.popleft()[2]
+        while self.highs and self.highs[0][0] <= cutoff:
+            self.highs.popleft()
+        while self.lows and self.lows[0][0] <= cutoff:
+            self.lows.popleft()
+    
+    def stats(self, current=None):
+        """回傳 (開盤價, 最高, 最低, 成交量)，current 為形成中的 K 線 (開, 高, 低, 量)"""
+        if not self.bars:
+            if current is None:
+                return None
+            return current
+        open_price = self.bars[0][1]
+        high = self.highs[0][1]
+        low = self.lows[0][1]
+        volume = self.volume
+        if current is not None:
+            high = max(high, current[1])
+            low = min(low, current[2])
+            volume += current[3]
+        return open_price, high, low, volume
+
+
+class RollingStats:
+    """各交易對的多個滾動視窗，由 TradeAggregator 的 1m K 線驅動"""
+    
+    def __init__(self, windows=None, on_seed_needed=None, max_gap_ms=10 * 60 * 1000):
+        self.windows = dict(windows or DEFAULT_WINDOWS)
+        self.max_window = max(self.windows.values())
+        self.on_seed_needed = on_seed_needed  # on_seed_needed(交易對)：需要以 REST 播種時呼叫
+        self.max_gap_ms = max_gap_ms
+        self.state = {}        # 交易對 → {視窗名稱: RollingWindow}
+        self.last_open = {}    # 交易對 → 最後一根 K 線的開盤時間
+        self.last_close = {}   # 交易對 → 最後一根 K 線的收盤價
+        self.pending = {}      # 尚未播種的交易對 → 串流送來的 K 線，播種時接在 REST K 線之後
+        self.lock = threading.Lock()
+    
+    def seed(self, symbol, bars):
+        """以 REST K 線 [(開盤時間, 開, 高, 低, 收, 量)] 重建交易對的視窗，並補上播種期間串流送來的 K 線"""
+        windows = {name: RollingWindow(length) for name, length in self.windows.items()}
+        with self.lock:
+            self.state[symbol] = windows
+            self.last_open.pop(symbol, None)
+            for bar in bars:
+                self.add_bar(symbol, *bar)
+            # 已被 REST 涵蓋的 K 線（包括訂閱後第一根不完整的 K 線）會因開盤時間不夠新而略過
+            for bar in self.pending.pop(symbol, ()):
+                self.add_bar(symbol, *bar[:6])
+    
+    def add_bar(self, symbol, open_time, open_price, high, low, close, volume):
+        """加入一根 K 線到所有視窗（呼叫時需持有鎖）"""
+        if open_time <= self.last_open.get(symbol, -1):
+            return
+        for window in self.state[symbol].values():
+            window.push(open_time, open_price, high, low, volume)
+            window.expire(open_time)
+        self.last_open[symbol] = open_time
+        self.last_close[symbol] = close
+    
+    def on_bar(self, symbol, resolution, bar):
+        """TradeAggregator 訂閱者：加入完成的 1m K 線，尚未播種時暫存並要求播種"""
+        with self.lock:
+            last_open = self.last_open.get(symbol)
+            if symbol in self.state and last_open is not None and bar.open_time - last_open > self.max_gap_ms:
+                # 串流中斷太久，視窗缺了 K 線，重新播種
+                del self.state[symbol]
+            if symbol in self.state:
+                self.add_bar(symbol, bar.open_time, bar.open, bar.high, bar.low, bar.close, bar.volume)
+                return
+            pending = self.pending.setdefault(symbol, deque(maxlen=MAX_PENDING))
+            pending.append(bar)
+        # 第一根完成的 K 線收盤後再播種，REST 回應才會包含訂閱當下那一分鐘的完整資料
+        if self.on_seed_needed:
+            self.on_seed_needed(symbol)
+    
+    def is_seeded(self, symbol):
+        return symbol in self.state
+    
+    def is_fresh(self, symbol, now_ms, current=None, max_age_ms=2 * BAR_MS):
+        """已播種且最近仍有 K 線更新（串流中斷或沒有成交時改回 REST）"""
+        with self.lock:
+            if symbol not in self.state:
+                return False
+            latest = self.last_open.get(symbol, -1)
+        if current is not None:
+            latest = max(latest, current.open_time)
+        return latest >= now_ms - max_age_ms
+    
+    def get(self, symbol, window='24h', current=None):
+        """
+        回傳視窗統計 {'price', 'open', 'high', 'low', 'volume', 'change'}，尚未播種時回傳 None
+        current 為形成中的 K 線（bar_aggregator.Bar），會一併計入
+        """
+        with self.lock:
+            windows = self.state.get(symbol)
+            if windows is None:
+                return None
+            rolling = windows[window]
+            partial = None
+            price = self.last_close.get(symbol)
+            if current is not None and current.open_time > self.last_open.get(symbol, -1):
+                rolling.expire(current.open_time)
+                partial = (current.open, current.high, current.low, current.volume)
+                price = current.close
+            stats = rolling.stats(partial)
+        if stats is None or price is None:
+            return None
+        open_price, high, low, volume = stats
+        return {
+            'price': price,
+            'open': open_price,
+            'high': high,
+            'low': low,
+            'volume': volume,
+            'change': (price - open_price) / open_price * 100 if open_price else 0.0,
+        }
+    
+    def get_row(self, symbol, current=None):
+        """以 24h 視窗產生價格表的資料列"""
+        stats = self.get(symbol, '24h' if '24h' in self.windows else next(iter(self.windows)), current)
+        if stats is None:
+            return None
+        return {
+            'price': stats['price'],
+            'change_24h': stats['change'],
+            'high_24h': stats['high'],
+            'low_24h': stats['low'],
+            'volume': stats['volume'],
+        }
+
+
+def benchmark(days=7, symbols=20):
+    """比較每根 K 線重新掃描 24h 視窗與單調佇列的更新速度，並確認結果一致"""
+    import random
+    import time
+    
+    count = days * 1440
+    start_ms = 1_700_000_000_000 - 1_700_000_000_000 % BAR_MS
+    series = []
+    price = 100.0
+    for i in range(count):
+        open_price = price
+        price *= 1 + random.gauss(0, 0.001)
+        high = max(open_price, price) * (1 + random.random() * 0.001)
+        low = min(open_price, price) * (1 - random.random() * 0.001)
+        series.append((start_ms + i * BAR_MS, open_price, high, low, price, random.uniform(0, 100)))
+    
+    window = DEFAULT_WINDOWS['24h'] // BAR_MS
+    start = time.perf_counter()
+    for _ in range(symbols):
+        recent = deque(maxlen=window)
+        for bar in series:
+            recent.append(bar)
+            expected = (recent[0][1], max(b[2] for b in recent), min(b[3] for b in recent), sum(b[5] for b in recent))
+    scan_rate = count * symbols / (time.perf_counter() - start)
+    
+    stats = RollingStats(parse_windows(['1h', '4h']))
+    start = time.perf_counter()
+    for i in range(symbols):
+        symbol = f"COIN{i}USDT"
+        stats.seed(symbol, [])
+        for bar in series:
+            stats.add_bar(symbol, *bar)
+    rolling_rate = count * symbols / (time.perf_counter() - start)
+    
+    result = stats.get("COIN0USDT")
+    assert (result['open'], result['high'], result['low']) == expected[:3]
+    assert abs(result['volume'] - expected[3]) < 1e-6 * expected[3]
+    print(f"重新掃描 24h 視窗      {scan_rate:>12,.0f} 根/秒")
+    print(f"單調佇列（24h/4h/1h）  {rolling_rate:>12,.0f} 根/秒")
+
+
+if __name__ == "__main__":
+    import sys
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 7)
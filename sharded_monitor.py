@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+🧩 多程序分片行情監控
+🔀 以雜湊將交易對分配到多個工作程序，每個程序有自己的 miniTicker 串流、解析與警報判斷
+📦 工作程序只把觸發的警報與精簡的價格變更送回協調者，不受單一 GIL 限制
+🌍 可監看現貨與合約的所有 USDT 交易對；單一分片涵蓋整個市場時改用 !miniTicker@arr 全市場串流
+"""
+
+import multiprocessing
+import queue
+import sys
+import threading
+import time
+import zlib
+
+import requests
+
+# 價格變更以 tuple 傳送：(價格, 24h 漲跌幅, 24h 高, 24h 低, 成交量, 事件時間)
+ROW_FIELDS = ('price', 'change_24h', 'high_24h', 'low_24h', 'volume', 'event_time')
+STREAMS_PER_SOCKET = 200
+ALL_MARKET_STREAM = '!miniTicker@arr'
+FUTURES_EXCHANGE_INFO = 'https://fapi.binance.com/fapi/v1/exchangeInfo'
+
+
+def shard_of(market, symbol, shards):
+    """以穩定的雜湊決定交易對所屬分片（不受 PYTHONHASHSEED 影響）"""
+    return zlib.crc32(f"{market}:{symbol}".encode('ascii')) % shards
+
+
+def delta_to_rows(delta):
+    """將工作程序送回的 tuple 轉成與 crypto_data 相同欄位的資料列"""
+    return {symbol: dict(zip(ROW_FIELDS, values)) for symbol, values in delta.items()}
+
+
+def discover_symbols(market, quote, endpoint_pool):
+    """列出指定市場中所有交易中、以 quote 計價的交易對"""
+    if market == 'spot':
+        info = endpoint_pool.get_json('/api/v3/exchangeInfo', {'permissions': 'SPOT'})
+        return sorted(
+            s['symbol'] for s in info['symbols']
+            if s['status'] == 'TRADING' and s['quoteAsset'] == quote
+        )
+    response = requests.get(FUTURES_EXCHANGE_INFO, timeout=10)
+    response.raise_for_status()
+    return sorted(
+        s['symbol'] for s in response.json()['symbols']
+        if s['status'] == 'TRADING' and s['quoteAsset'] == quote and s.get('contractType') == 'PERPETUAL'
+    )
+
+
+# ==================== 工作程序 ====================
+
+class ShardState:
+    """工作程序內的價格、待送出變更與警報狀態"""
+    
+    def __init__(self, index, output, thresholds, cooldown):
+        self.index = index
+        self.output = output
+        self.thresholds = thresholds  # 市場 → {交易對: 閾值}，現貨的警報不會在合約重複觸發
+        self.cooldown = cooldown
+        self.pending = {}       # 市場 → {交易對: tuple}
+        self.triggered = set()  # 已觸發、等待價格回到範圍內才重置的 (市場, 交易對, 方向)
+        self.last_alert_time = {}
+        self.processed = 0
+        self.lag_ms = 0.0
+        self.lock = threading.Lock()
+    
+    def on_message(self, market, msg):
+        """miniTicker 回呼：更新待送出變更並判斷警報"""
+        data = msg.get('data', msg)
+        if data.get('e') != '24hrMiniTicker':
+            if data.get('e') == 'error':
+                print(f"⚠️ 分片 {self.index} 串流錯誤: {data.get('m')}")
+            return
+        symbol = data['s']
+        price = float(data['c'])
+        open_price = float(data['o'])
+        change = (price - open_price) / open_price * 100 if open_price else 0.0
+        row = (price, change, float(data['h']), float(data['l']), float(data['v']), data['E'])
+        with self.lock:
+            self.pending.setdefault(market, {})[symbol] = row
+            self.processed += 1
+            self.lag_ms = max(0.0, time.time() * 1000 - data['E'])
+        if symbol in self.thresholds.get(market, ()):
+            self.check_alerts(market, symbol, price)
+    
+    def on_array(self, market, msg, symbols):
+        """!miniTicker@arr 回呼：只處理分配給這個分片的交易對"""
+        data = msg.get('data', msg) if isinstance(msg, dict) else msg
+        if not isinstance(data, list):
+            self.on_message(market, data)
+            return
+        for ticker in data:
+            if ticker.get('s') in symbols:
+                self.on_message(market, ticker)
+    
+    def check_alerts(self, market, symbol, price):
+        """與主程式相同的閾值、觸發後重置與冷卻規則"""
+        thresholds = self.thresholds[market][symbol]
+        now = time.time()
+        for side, threshold in (('high', thresholds.get('high')), ('low', thresholds.get('low'))):
+            key = (market, symbol, side)
+            crossed = threshold and (price >= threshold if side == 'high' else price <= threshold)
+            if not crossed:
+                self.triggered.discard(key)
+                continue
+            if key in self.triggered:
+                continue
+            if now - self.last_alert_time.get((market, symbol), 0) < self.cooldown:
+                continue
+            self.triggered.add(key)
+            self.last_alert_time[(market, symbol)] = now
+            self.output.put(('alert', market, symbol, side, price, threshold))
+    
+    def flush(self):
+        """送出累積的價格變更與處理統計"""
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            status = {'processed': self.processed, 'lag_ms': self.lag_ms}
+        for market, delta in pending.items():
+            self.output.put(('delta', market, delta))
+        self.output.put(('status', self.index, status))
+
+
+def shard_worker(index, assignments, thresholds, cooldown, flush_interval, output, control, whole_markets=()):
+    """工作程序進入點：assignments 為 市場 → 交易對清單，whole_markets 的交易對清單涵蓋整個市場"""
+    from binance import ThreadedWebsocketManager
+    
+    state = ShardState(index, output, thresholds, cooldown)
+    twm = ThreadedWebsocketManager()
+    twm.start()
+    for market, symbols in assignments.items():
+        start_socket = twm.start_multiplex_socket if market == 'spot' else twm.start_futures_multiplex_socket
+        if market in whole_markets:
+            # 一條全市場串流取代數百條單一交易對串流
+            wanted = set(symbols)
+            start_socket(
+                callback=lambda msg, market=market, wanted=wanted: state.on_array(market, msg, wanted),
+                streams=[ALL_MARKET_STREAM],
+            )
+            continue
+        for i in range(0, len(symbols), STREAMS_PER_SOCKET):
+            streams = [f"{s.lower()}@miniTicker" for s in symbols[i:i + STREAMS_PER_SOCKET]]
+            start_socket(callback=lambda msg, market=market: state.on_message(market, msg), streams=streams)
+    
+    try:
+        while True:
+            try:
+                command = control.get(timeout=flush_interval)
+            except queue.Empty:
+                state.flush()
+                continue
+            if command[0] == 'stop':
+                break
+            if command[0] == 'thresholds':
+                state.thresholds, state.cooldown = command[1], command[2]
+                state.triggered = {key for key in state.triggered if key[1] in state.thresholds.get(key[0], ())}
+    except KeyboardInterrupt:
+        pass
+    finally:
+        twm.stop()
+
+
+# ==================== 協調者 ====================
+
+class ShardedFeed:
+    """啟動分片工作程序，彙整它們送回的價格變更與警報"""
+    
+    def __init__(self, workers, on_delta, on_alert, flush_interval=0.5):
+        # on_delta(市場, {交易對: 資料列})、on_alert(市場, 交易對, 方向, 價格, 閾值)
+        self.workers = max(1, workers)
+        self.on_delta = on_delta
+        self.on_alert = on_alert
+        self.flush_interval = flush_interval
+        self.context = multiprocessing.get_context('spawn')
+        self.output = self.context.Queue()
+        self.processes = {}      # 分片編號 → 程序
+        self.controls = []
+        self.assigned = {}       # 市場 → 交易對集合
+        self.shard_status = {}
+        self.running = False
+        self.thread = None
+    
+    def start(self, symbols_by_market, thresholds, cooldown, full_markets=()):
+        """依雜湊分配交易對並啟動工作程序；full_markets 為交易對清單是整個市場的市場"""
+        assignments = [{} for _ in range(self.workers)]
+        for market, symbols in symbols_by_market.items():
+            self.assigned[market] = set(symbols)
+            for symbol in symbols:
+                shard = shard_of(market, symbol, self.workers)
+                assignments[shard].setdefault(market, []).append(symbol)
+        # 整個市場都落在同一個分片時，該分片改訂閱全市場串流
+        whole_markets = [
+            {market for market in full_markets if len(assignment.get(market, ())) == len(self.assigned.get(market, ()))}
+            for assignment in assignments
+        ]
+        
+        self.running = True
+        self.thread = threading.Thread(target=self.drain_worker, daemon=True)
+        self.thread.start()
+        for index, assignment in enumerate(assignments):
+            if not assignment:
+                continue
+            control = self.context.Queue()
+            process = self.context.Process(
+                target=shard_worker,
+                args=(index, assignment, thresholds, cooldown, self.flush_interval, self.output, control,
+                      whole_markets[index]),
+                daemon=True,
+            )
+            self.start_process(process)
+            self.processes[index] = process
+            self.controls.append(control)
+        total = sum(len(symbols) for symbols in self.assigned.values())
+        print(f"🧩 已啟動 {len(self.processes)} 個分片程序，監看 {total} 個交易對")
+    
+    def start_process(self, process):
+        """
+        以這個模組作為子程序的 __main__ 啟動
+        spawn 預設會在子程序重新匯入父程序的 __main__（選單欄應用與 rumps 等相依套件），
+        啟動期間暫時替換，子程序只需匯入這個輕量模組
+        """
+        main = sys.modules['__main__']
+        sys.modules['__main__'] = sys.modules[__name__]
+        try:
+            process.start()
+        finally:
+            sys.modules['__main__'] = main
+    
+    def covers(self, market, symbols):
+        """交易對是否都由分片程序負責"""
+        return set(symbols) <= self.assigned.get(market, set())
+    
+    def update_thresholds(self, thresholds, cooldown):
+        """把新的警報閾值（市場 → {交易對: 閾值}）送給所有工作程序"""
+        for control in self.controls:
+            control.put(('thresholds', thresholds, cooldown))
+    
+    def drain_worker(self):
+        """在協調者的背景執行緒中分派工作程序送回的訊息"""
+        while self.running:
+            try:
+                message = self.output.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                break
+            try:
+                if message[0] == 'delta':
+                    self.on_delta(message[1], delta_to_rows(message[2]))
+                elif message[0] == 'alert':
+                    self.on_alert(*message[1:])
+                elif message[0] == 'status':
+                    self.shard_status[message[1]] = dict(message[2], updated_at=time.time())
+            except Exception as e:
+                print(f"⚠️ 處理分片訊息時發生錯誤: {e}")
+    
+    def get_status(self):
+        """回傳各分片的存活狀態、處理筆數與延遲"""
+        status = {}
+        for index, process in self.processes.items():
+            shard = self.shard_status.get(index, {})
+            status[index] = {
+                'alive': process.is_alive(),
+                'processed': shard.get('processed', 0),
+                'lag_ms': shard.get('lag_ms', 0.0),
+            }
+        return status
+    
+    def stop(self):
+        """停止所有工作程序"""
+        self.running = False
+        for control in self.controls:
+            control.put(('stop',))
+        for process in self.processes.values():
+            process.join(timeout=2)
+            if process.is_alive():
+                process.terminate()
@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+🧠 共享記憶體價格表
+📦 將最新價格以固定的二進位格式寫入 multiprocessing.shared_memory
+🔒 以 seqlock 保護：讀取端不需要鎖或系統呼叫，也能取得一致的快照
+📖 同一台機器上的其他 Python 程式可直接讀取，不需複製資料
+
+讀取範例：
+    from shared_prices import SharedPriceReader
+    reader = SharedPriceReader()
+    print(reader.get('BTCUSDT'))
+
+記憶體格式（little-endian）：
+    0   標頭 64 bytes：magic 'CPMT'、格式版本、容量、交易對數量、目錄版本、寫入端 PID、序號 (u64)、寫入時間 (f64)
+    64  交易對目錄：容量 × 16 bytes ASCII（不足補 0）
+    ... 欄位：price、change_24h、high_24h、low_24h、volume、timestamp，每欄為容量 × f64
+"""
+
+import os
+import struct
+import threading
+import time
+from multiprocessing import shared_memory
+
+DEFAULT_NAME = 'crypto_monitor_prices'
+MAGIC = b'CPMT'
+LAYOUT_VERSION = 1
+HEADER = struct.Struct('<4sIIIII')   # magic、版本、容量、數量、目錄版本、寫入端 PID
+HEADER_SIZE = 64
+SEQ_INDEX = 3                        # 以 u64 檢視標頭時序號所在位置（offset 24）
+WRITE_TIME_OFFSET = 32
+SYMBOL_SIZE = 16
+FIELDS = ('price', 'change_24h', 'high_24h', 'low_24h', 'volume', 'timestamp')
+
+
+def table_size(capacity):
+    """指定容量需要的共享記憶體大小"""
+    return HEADER_SIZE + capacity * SYMBOL_SIZE + len(FIELDS) * capacity * 8
+
+
+def attach_shared_memory(name):
+    """附加既有的共享記憶體，避免讀取端結束時 resource_tracker 把區段刪掉"""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python 3.13 以前沒有 track 參數
+        shm = shared_memory.SharedMemory(name=name)
+        try:
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        except Exception:
+            pass
+        return shm
+
+
+def process_alive(pid):
+    """PID 對應的程式是否仍在執行"""
+    if pid <= 0:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # 其他使用者的程式
+    return True
+
+
+def remove_stale_table(name):
+    """刪除寫入端已結束的區段；寫入端仍在執行或不是價格表格式時拋出例外"""
+    old = attach_shared_memory(name)
+    try:
+        magic, _, _, _, _, pid = HEADER.unpack_from(old.buf, 0)
+    finally:
+        old.close()
+    if magic != MAGIC:
+        raise RuntimeError(f"共享記憶體 {name} 已存在且不是價格表，請改用其他 shared_memory.name")
+    if pid != os.getpid() and process_alive(pid):
+        raise RuntimeError(f"共享價格表 {name} 正由 PID {pid} 寫入，請先結束該程式或改用其他 shared_memory.name")
+    old.unlink()
+
+
+class SharedPriceLayout:
+    """在共享記憶體上建立標頭、目錄與各欄位的 memoryview"""
+    
+    def __init__(self, shm):
+        self.shm = shm
+        buf = shm.buf
+        magic, version, capacity, _, _, _ = HEADER.unpack_from(buf, 0)
+        if magic != MAGIC or version != LAYOUT_VERSION:
+            raise ValueError(f"共享記憶體 {shm.name} 不是價格表格式")
+        self.capacity = capacity
+        self.words = buf[:HEADER_SIZE].cast('Q')
+        self.directory = buf[HEADER_SIZE:HEADER_SIZE + capacity * SYMBOL_SIZE]
+        offset = HEADER_SIZE + capacity * SYMBOL_SIZE
+        self.columns = {}
+        for field in FIELDS:
+            self.columns[field] = buf[offset:offset + capacity * 8].cast('d')
+            offset += capacity * 8
+    
+    def header(self):
+        """回傳 (數量, 目錄版本)"""
+        _, _, _, count, dir_version, _ = HEADER.unpack_from(self.shm.buf, 0)
+        return count, dir_version
+    
+    def release(self):
+        """釋放所有 memoryview，之後才能關閉共享記憶體"""
+        for view in self.columns.values():
+            view.release()
+        self.directory.release()
+        self.words.release()
+
+
+class SharedPriceTable:
+    """寫入端：由監控器持有，負責建立共享記憶體並發布價格"""
+    
+    def __init__(self, name=DEFAULT_NAME, capacity=512):
+        try:
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=table_size(capacity))
+        except FileExistsError:
+            # 只重建上次沒有正常結束留下的區段，不搶走其他執行中程式的價格表
+            remove_stale_table(name)
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=table_size(capacity))
+        HEADER.pack_into(self.shm.buf, 0, MAGIC, LAYOUT_VERSION, capacity, 0, 0, os.getpid())
+        self.layout = SharedPriceLayout(self.shm)
+        self.rows = {}
+        self.name = name
+        self.lock = threading.Lock()  # seqlock 只允許一個寫入者
+        self.closed = False
+    
+    def row_for(self, symbol):
+        """取得交易對的列號，新交易對寫入目錄（呼叫時需在寫入區段內）"""
+        row = self.rows.get(symbol)
+        if row is not None:
+            return row
+        row = len(self.rows)
+        if row >= self.layout.capacity:
+            return None
+        encoded = symbol.encode('ascii')[:SYMBOL_SIZE].ljust(SYMBOL_SIZE, b'\0')
+        self.layout.directory[row * SYMBOL_SIZE:(row + 1) * SYMBOL_SIZE] = encoded
+        self.rows[symbol] = row
+        _, dir_version = self.layout.header()
+        struct.pack_into('<II', self.shm.buf, 12, row + 1, dir_version + 1)
+        return row
+    
+    def update_many(self, rows):
+        """在一次 seqlock 寫入區段內更新多個交易對：rows 為 交易對 → 資料列"""
+        layout = self.layout
+        words = layout.words
+        columns = layout.columns
+        now = time.time()
+        with self.lock:
+            if self.closed:
+                return
+            words[SEQ_INDEX] += 1  # 奇數：寫入中
+            try:
+                for symbol, data in rows.items():
+                    row = self.row_for(symbol)
+                    if row is None:
+                        continue
+                    columns['price'][row] = data['price']
+                    columns['change_24h'][row] = data['change_24h']
+                    columns['high_24h'][row] = data['high_24h']
+                    columns['low_24h'][row] = data['low_24h']
+                    columns['volume'][row] = data['volume']
+                    columns['timestamp'][row] = data.get('updated_at', now)
+                struct.pack_into('<d', self.shm.buf, WRITE_TIME_OFFSET, now)
+            finally:
+                words[SEQ_INDEX] += 1  # 偶數：寫入完成
+    
+    def update(self, symbol, data):
+        """更新單一交易對"""
+        self.update_many({symbol: data})
+    
+    def close(self):
+        """關閉並刪除共享記憶體"""
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            self.layout.release()
+        self.shm.close()
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class SharedPriceReader:
+    """讀取端：其他程式用來讀取價格，不需鎖也不複製整張表"""
+    
+    def __init__(self, name=DEFAULT_NAME, max_retries=1000):
+        self.shm = attach_shared_memory(name)
+        self.layout = SharedPriceLayout(self.shm)
+        self.max_retries = max_retries
+        self.rows = {}
+        self.dir_version = -1
+    
+    def refresh_directory(self):
+        """目錄版本變更時重新建立 交易對 → 列號 對照"""
+        count, dir_version = self.layout.header()
+        if dir_version == self.dir_version:
+            return
+        directory = self.layout.directory
+        self.rows = {
+            bytes(directory[i * SYMBOL_SIZE:(i + 1) * SYMBOL_SIZE]).rstrip(b'\0').decode('ascii'): i
+            for i in range(count)
+        }
+        self.dir_version = dir_version
+    
+    def read_consistent(self, reader):
+        """以 seqlock 協定執行 reader()，寫入端在讀取期間有更新就重試"""
+        words = self.layout.words
+        for _ in range(self.max_retries):
+            start = words[SEQ_INDEX]
+            if not start & 1:
+                result = reader()
+                if words[SEQ_INDEX] == start:
+                    return result
+            # 讓出 CPU，寫入端很快就會完成
+            time.sleep(0)
+        raise RuntimeError("共享價格表持續寫入中，無法取得一致的快照")
+    
+    def get(self, symbol):
+        """讀取單一交易對，沒有資料時回傳 None"""
+        self.refresh_directory()
+        row = self.rows.get(symbol)
+        if row is None:
+            return None
+        columns = self.layout.columns
+        return self.read_consistent(lambda: {field: columns[field][row] for field in FIELDS})
+    
+    def snapshot(self):
+        """讀取整張表的一致快照"""
+        self.refresh_directory()
+        columns = self.layout.columns
+        rows = dict(self.rows)
+        return self.read_consistent(lambda: {
+            symbol: {field: columns[field][row] for field in FIELDS}
+            for symbol, row in rows.items()
+        })
+    
+    def column(self, field):
+        """直接回傳欄位的 memoryview（零複製，不保證與其他欄位一致）"""
+        return self.layout.columns[field]
+    
+    def symbols(self):
+        """目前表中的交易對與列號"""
+        self.refresh_directory()
+        return dict(self.rows)
+    
+    def close(self):
+        """中斷與共享記憶體的連結（不會刪除）"""
+        self.layout.release()
+        self.shm.close()
+
+
+if __name__ == "__main__":
+    # 簡易讀取工具：python3 shared_prices.py [名稱]
+    import sys
+    reader = SharedPriceReader(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_NAME)
+    for symbol, data in sorted(reader.snapshot().items()):
+        updated = time.strftime('%H:%M:%S', time.localtime(data['timestamp']))
+        print(f"{symbol:<12} ${data['price']:>14,.6f}  {data['change_24h']:+7.2f}%  🔄 {updated}")
+    reader.close()
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+📸 版本化快照與內部事件匯流排
+🔒 每次更新建立新的唯讀快照並整個替換，讀取端不需要鎖
+📢 訂閱者依交易對篩選，只收到有變更的資料列
+🐢 每個訂閱者有自己的信箱與執行緒，慢的訂閱者只會合併自己的待處理變更，不會拖住其他人
+"""
+
+import threading
+import time
+from collections import namedtuple
+from types import MappingProxyType
+
+# 唯讀快照：版本、交易對 → 資料列（皆為唯讀 mapping）、建立時間
+Snapshot = namedtuple('Snapshot', ['version', 'rows', 'created_at'])
+
+
+class Subscription:
+    """單一訂閱者：待處理的變更會依交易對合併，只保留最新的資料列"""
+    
+    def __init__(self, name, callback, symbols=None, timed=False):
+        # symbols 可以是集合，或回傳目前關注交易對的函式；None 表示全部
+        # timed 為 True 時 callback 另外收到這批變更的發布時間（time.monotonic），用來量測端到端延遲
+        self.name = name
+        self.callback = callback
+        self.symbols = symbols
+        self.timed = timed
+        self.pending = {}
+        self.pending_version = 0
+        self.condition = threading.Condition()
+        self.running = True
+        self.delivered = 0
+        self.merged = 0
+        self.lag_ms = 0.0
+        self.published_at = 0.0
+        self.thread = threading.Thread(target=self.deliver_worker, name=f"bus-{name}", daemon=True)
+        self.thread.start()
+    
+    def wants(self, changes):
+        """篩選出訂閱者關注的變更"""
+        symbols = self.symbols() if callable(self.symbols) else self.symbols
+        if symbols is None:
+            return changes
+        return {symbol: row for symbol, row in changes.items() if symbol in symbols}
+    
+    def offer(self, version, changes, published_at):
+        """放入信箱（發布端呼叫，不會等待訂閱者處理）"""
+        wanted = self.wants(changes)
+        if not wanted:
+            return
+        with self.condition:
+            self.merged += len(self.pending.keys() & wanted.keys())
+            self.pending.update(wanted)
+            self.pending_version = version
+            self.published_at = published_at
+            self.condition.notify()
+    
+    def deliver_worker(self):
+        """在訂閱者自己的執行緒中呼叫 callback(版本, 變更)"""
+        while self.running:
+            with self.condition:
+                self.condition.wait_for(lambda: self.pending or not self.running)
+                if not self.running:
+                    return
+                changes, self.pending = self.pending, {}
+                version = self.pending_version
+                published_at = self.published_at
+            try:
+                if self.timed:
+                    self.callback(version, changes, published_at)
+                else:
+                    self.callback(version, changes)
+            except Exception as e:
+                print(f"⚠️ 訂閱者 {self.name} 發生錯誤: {e}")
+            self.delivered += 1
+            self.lag_ms = (time.monotonic() - published_at) * 1000
+    
+    def stop(self):
+        """停止派送"""
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+
+
+class SnapshotStore:
+    """以整個替換的方式更新的唯讀快照，並將變更發布給訂閱者"""
+    
+    def __init__(self):
+        self.snapshot = Snapshot(0, MappingProxyType({}), time.time())
+        self.write_lock = threading.Lock()
+        self.subscribers = {}
+    
+    def current(self):
+        """取得目前的快照（只讀取一個參考，不需要鎖）"""
+        return self.snapshot
+    
+    def get(self, symbol):
+        """讀取目前快照中的單一交易對"""
+        return self.snapshot.rows.get(symbol)
+    
+    def publish(self, rows):
+        """寫入新的資料列：只有內容真的改變的交易對會產生新版本與事件"""
+        with self.write_lock:
+            current = self.snapshot
+            changes = {}
+            for symbol, row in rows.items():
+                previous = current.rows.get(symbol)
+                row = dict(row)
+                if previous is not None and previous == row:
+                    continue
+                changes[symbol] = MappingProxyType(row)
+            if not changes:
+                return current.version
+            merged = dict(current.rows)
+            merged.update(changes)
+            self.snapshot = Snapshot(current.version + 1, MappingProxyType(merged), time.time())
+            # 在寫入鎖內依版本順序放入信箱（只是合併字典，不會等待訂閱者）
+            published_at = time.monotonic()
+            changes = MappingProxyType(changes)
+            for subscription in self.subscribers.values():
+                subscription.offer(self.snapshot.version, changes, published_at)
+            return self.snapshot.version
+    
+    def subscribe(self, name, callback, symbols=None, timed=False):
+        """註冊訂閱者：callback(版本, {交易對: 資料列})，timed 時多一個發布時間參數"""
+        subscription = Subscription(name, callback, symbols, timed)
+        with self.write_lock:
+            previous = self.subscribers.get(name)
+            self.subscribers[name] = subscription
+        if previous is not None:
+            previous.stop()
+        return subscription
+    
+    def unsubscribe(self, name):
+        """取消訂閱"""
+        with self.write_lock:
+            subscription = self.subscribers.pop(name, None)
+        if subscription is not None:
+            subscription.stop()
+    
+    def get_stats(self):
+        """回傳快照版本與各訂閱者的派送統計"""
+        return {
+            'version': self.snapshot.version,
+            'symbols': len(self.snapshot.rows),
+            'subscribers': {
+                name: {
+                    'delivered': sub.delivered,
+                    'merged': sub.merged,
+                    'pending': len(sub.pending),
+                    'lag_ms': sub.lag_ms,
+                }
+                for name, sub in list(self.subscribers.items())
+            },
+        }
+    
+    def stop(self):
+        """停止所有訂閱者"""
+        with self.write_lock:
+            subscribers = list(self.subscribers.values())
+            self.subscribers = {}
+        for subscription in subscribers:
+            subscription.stop()
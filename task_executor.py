@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+🧵 背景任務執行器
+👷 所有背景工作共用固定數量的工作執行緒，不再每次點擊都建立新執行緒
+🤝 相同鍵的任務共用同一個進行中的 future（single-flight），連續點擊不會重複抓取
+📏 回報佇列深度與任務等待 / 執行時間，結束時取消尚未開始的任務
+⏰ 延遲任務共用一個計時執行緒，到期後才排入工作執行緒，重試等待不會佔用工作執行緒
+"""
+
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+class TaskExecutor:
+    """固定執行緒數的執行器，支援以鍵合併重複的任務"""
+    
+    def __init__(self, workers=4, name='task'):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+        self.workers = workers
+        self.inflight = {}   # 鍵 → 進行中的 future
+        self.lock = threading.Lock()
+        self.queued = 0
+        self.active = 0
+        self.submitted = 0
+        self.coalesced = 0
+        self.failed = 0
+        self.wait_times = deque(maxlen=200)
+        self.run_times = deque(maxlen=200)
+        self.closed = False
+        self.name = name
+        self.timers = []     # (到期時間, 序號, 任務, 參數, 關鍵字參數, 鍵)
+        self.timer_sequence = itertools.count()
+        self.timer_condition = threading.Condition()
+        self.timer_thread = None
+    
+    def submit(self, fn, *args, key=None, **kwargs):
+        """排入任務；key 相同的任務還在進行中時直接回傳同一個 future"""
+        with self.lock:
+            if self.closed:
+                future = Future()
+                future.cancel()
+                return future
+            if key is not None and key in self.inflight:
+                self.coalesced += 1
+                return self.inflight[key]
+            self.queued += 1
+            self.submitted += 1
+            future = self.executor.submit(self.run, fn, args, kwargs, time.monotonic())
+            if key is not None:
+                self.inflight[key] = future
+        future.add_done_callback(lambda done, key=key: self.release(key, done))
+        return future
+    
+    def schedule(self, delay, fn, *args, key=None, **kwargs):
+        """delay 秒後排入任務（到期時仍套用 key 的 single-flight）"""
+        with self.timer_condition:
+            if self.closed:
+                return
+            heapq.heappush(self.timers, (time.monotonic() + delay, next(self.timer_sequence), fn, args, kwargs, key))
+            if self.timer_thread is None:
+                self.timer_thread = threading.Thread(target=self.timer_worker, daemon=True, name=f"{self.name}-timer")
+                self.timer_thread.start()
+            self.timer_condition.notify()
+    
+    def timer_worker(self):
+        """等待最早到期的延遲任務並排入工作執行緒"""
+        with self.timer_condition:
+            while not self.closed:
+                if not self.timers:
+                    self.timer_condition.wait()
+                    continue
+                remaining = self.timers[0][0] - time.monotonic()
+                if remaining > 0:
+                    self.timer_condition.wait(remaining)
+                    continue
+                _, _, fn, args, kwargs, key = heapq.heappop(self.timers)
+                self.submit(fn, *args, key=key, **kwargs)
+    
+    def run(self, fn, args, kwargs, queued_at):
+        """在工作執行緒中執行任務並記錄時間"""
+        started = time.monotonic()
+        with self.lock:
+            self.queued -= 1
+            self.active += 1
+            self.wait_times.append(started - queued_at)
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            with self.lock:
+                self.failed += 1
+            print(f"❌ 背景任務 {getattr(fn, '__name__', fn)} 發生錯誤: {e}")
+            raise
+        finally:
+            with self.lock:
+                self.active -= 1
+                self.run_times.append(time.monotonic() - started)
+    
+    def release(self, key, future):
+        """任務結束後讓相同鍵可以再次排入；被取消的任務移出佇列計數"""
+        with self.lock:
+            if key is not None and self.inflight.get(key) is future:
+                del self.inflight[key]
+            if future.cancelled():
+                self.queued -= 1
+    
+    def get_stats(self):
+        """回傳佇列深度、合併次數與最近任務的平均 / 最長時間（毫秒）"""
+        with self.lock:
+            waits = list(self.wait_times)
+            runs = list(self.run_times)
+            return {
+                'workers': self.workers,
+                'queued': self.queued,
+                'scheduled': len(self.timers),
+                'active': self.active,
+                'submitted': self.submitted,
+                'coalesced': self.coalesced,
+                'failed': self.failed,
+                'avg_wait_ms': sum(waits) / len(waits) * 1000 if waits else 0.0,
+                'max_wait_ms': max(waits) * 1000 if waits else 0.0,
+                'avg_run_ms': sum(runs) / len(runs) * 1000 if runs else 0.0,
+                'max_run_ms': max(runs) * 1000 if runs else 0.0,
+            }
+    
+    def shutdown(self):
+        """取消尚未開始的任務，不等待執行中的任務"""
+        with self.lock:
+            self.closed = True
+        with self.timer_condition:
+            self.timers.clear()
+            self.timer_condition.notify()
+        self.executor.shutdown(wait=False, cancel_futures=True)
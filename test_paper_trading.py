@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+🧪 模擬交易撮合測試：OCO、只減倉、全部平倉與餘額不足
+執行：python3 -m pytest test_paper_trading.py 或 python3 -m unittest test_paper_trading
+"""
+
+import unittest
+
+from paper_trading import PaperTradingClient, PaperTradingError
+
+
+class PaperTradingTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.client = PaperTradingClient(
+            balances={'USDT': 10000.0, 'BTC': 1.0}, futures_balance=10000.0,
+            fee_rate=0.0, futures_fee_rate=0.0, slippage_bps=0.0,
+        )
+        self.client.on_price('BTCUSDT', 100.0)
+    
+    def balance(self, asset):
+        return self.client.balances.get(asset, [0.0, 0.0])
+    
+    def position(self, symbol='BTCUSDT'):
+        return self.client.positions.get(symbol, {'amount': 0.0})['amount']
+    
+    # ==================== OCO ====================
+    
+    def test_oco_take_profit_cancels_stop(self):
+        result = self.client.order_oco_sell('BTCUSDT', 1.0, price=110.0, stopPrice=90.0)
+        limit_id, stop_id = (report['orderId'] for report in result['orderReports'])
+        self.assertEqual(self.balance('BTC'), [0.0, 1.0])
+        
+        self.client.on_price('BTCUSDT', 111.0)
+        self.assertEqual(self.client.orders[limit_id]['status'], 'FILLED')
+        self.assertEqual(self.client.orders[stop_id]['status'], 'CANCELED')
+        self.assertEqual(self.balance('BTC'), [0.0, 0.0])
+        self.assertAlmostEqual(self.balance('USDT')[0], 10000.0 + 110.0)
+    
+    def test_oco_stop_loss_cancels_take_profit(self):
+        result = self.client.order_oco_sell('BTCUSDT', 1.0, price=110.0, stopPrice=90.0)
+        limit_id, stop_id = (report['orderId'] for report in result['orderReports'])
+        
+        self.client.on_price('BTCUSDT', 89.0)
+        self.assertEqual(self.client.orders[stop_id]['status'], 'FILLED')
+        self.assertEqual(self.client.orders[limit_id]['status'], 'CANCELED')
+        self.assertEqual(self.balance('BTC'), [0.0, 0.0])
+        self.assertAlmostEqual(self.balance('USDT')[0], 10000.0 + 89.0)
+    
+    def test_cancel_oco_releases_locked_funds(self):
+        result = self.client.order_oco_sell('BTCUSDT', 1.0, price=110.0, stopPrice=90.0)
+        self.client.cancel_order('BTCUSDT', result['orderReports'][0]['orderId'])
+        self.assertEqual(self.balance('BTC'), [1.0, 0.0])
+        self.assertEqual(self.client.get_open_orders('BTCUSDT'), [])
+    
+    # ==================== 只減倉 / 全部平倉 ====================
+    
+    def test_reduce_only_larger_than_position_does_not_flip(self):
+        self.client.futures_create_order('BTCUSDT', 'BUY', 'MARKET', quantity=1.0)
+        order = self.client.futures_create_order('BTCUSDT', 'SELL', 'MARKET', quantity=3.0, reduceOnly=True)
+        self.assertEqual(order['status'], 'FILLED')
+        self.assertEqual(float(order['executedQty']), 1.0)
+        self.assertEqual(self.position(), 0.0)
+        self.assertNotIn('BTCUSDT', self.client.positions)
+    
+    def test_reduce_only_partial_close_keeps_entry_price(self):
+        self.client.futures_create_order('BTCUSDT', 'BUY', 'MARKET', quantity=2.0)
+        self.client.on_price('BTCUSDT', 120.0)
+        self.client.futures_create_order('BTCUSDT', 'SELL', 'MARKET', quantity=0.5, reduceOnly=True)
+        self.assertAlmostEqual(self.position(), 1.5)
+        self.assertAlmostEqual(self.client.positions['BTCUSDT']['entry_price'], 100.0)
+        self.assertAlmostEqual(self.client.futures_wallet, 10000.0 + 0.5 * 20.0)
+    
+    def test_reduce_only_same_direction_expires(self):
+        self.client.futures_create_order('BTCUSDT', 'BUY', 'MARKET', quantity=1.0)
+        order = self.client.futures_create_order('BTCUSDT', 'BUY', 'MARKET', quantity=1.0, reduceOnly=True)
+        self.assertEqual(order['status'], 'EXPIRED')
+        self.assertEqual(self.position(), 1.0)
+    
+    def test_reduce_only_without_position_expires(self):
+        order = self.client.futures_create_order('BTCUSDT', 'SELL', 'MARKET', quantity=1.0, reduceOnly='true')
+        self.assertEqual(order['status'], 'EXPIRED')
+        self.assertNotIn('BTCUSDT', self.client.positions)
+    
+    def test_close_position_stop_closes_whole_position(self):
+        self.client.futures_create_order('BTCUSDT', 'BUY', 'MARKET', quantity=2.0)
+        stop = self.client.futures_create_order('BTCUSDT', 'SELL', 'STOP_MARKET', stopPrice=90.0, closePosition=True)
+        take = self.client.futures_create_order('BTCUSDT', 'SELL', 'TAKE_PROFIT_MARKET', stopPrice=120.0,
+                                                closePosition=True)
+        
+        self.client.on_price('BTCUSDT', 121.0)
+        self.assertNotIn('BTCUSDT', self.client.positions)
+        self.assertEqual(self.client.orders[take['orderId']]['status'], 'FILLED')
+        self.assertEqual(self.client.orders[take['orderId']]['executed'], 2.0)
+        # 持倉歸零後另一張平倉單一併取消，不會在之後反向開倉
+        self.assertEqual(self.client.orders[stop['orderId']]['status'], 'CANCELED')
+        self.client.on_price('BTCUSDT', 80.0)
+        self.assertNotIn('BTCUSDT', self.client.positions)
+    
+    def test_stop_that_would_trigger_immediately_is_rejected(self):
+        with self.assertRaises(PaperTradingError) as error:
+            self.client.futures_create_order('BTCUSDT', 'SELL', 'STOP_MARKET', stopPrice=110.0, closePosition=True)
+        self.assertEqual(error.exception.code, -2021)
+    
+    # ==================== 餘額不足 ====================
+    
+    def test_spot_market_buy_insufficient_balance(self):
+        with self.assertRaises(PaperTradingError) as error:
+            self.client.order_market_buy('BTCUSDT', quantity=1000.0)
+        self.assertEqual(error.exception.code, -2010)
+        self.assertEqual(self.balance('USDT'), [10000.0, 0.0])
+    
+    def test_spot_limit_sell_insufficient_balance(self):
+        with self.assertRaises(PaperTradingError) as error:
+            self.client.order_limit_sell('BTCUSDT', 2.0, 110.0)
+        self.assertEqual(error.exception.code, -2010)
+        self.assertEqual(self.balance('BTC'), [1.0, 0.0])
+    
+    def test_futures_insufficient_margin(self):
+        self.client.futures_change_leverage('BTCUSDT', 2)
+        with self.assertRaises(PaperTradingError) as error:
+            self.client.futures_create_order('BTCUSDT', 'BUY', 'MARKET', quantity=250.0)
+        self.assertEqual(error.exception.code, -2019)
+        self.assertNotIn('BTCUSDT', self.client.positions)
+        self.client.futures_create_order('BTCUSDT', 'BUY', 'MARKET', quantity=150.0)
+        self.assertAlmostEqual(self.position(), 150.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
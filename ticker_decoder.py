@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+🧬 選擇性 ticker 解碼器
+✂️ 直接在原始位元組上找出需要的交易對與欄位，不建立完整的 JSON 物件樹
+📥 支援分段餵入（串流），只解析已完整收到的物件
+🧮 結果直接寫入欄式價格表
+
+效能比較：python3 ticker_decoder.py [交易對數量]
+"""
+
+import json
+import re
+
+# 24hr ticker：價格表欄位 → JSON 欄位（順序與 price_table.FIELDS 相同）
+TICKER_FIELDS = (
+    ('price', 'lastPrice'),
+    ('change_24h', 'priceChangePercent'),
+    ('high_24h', 'highPrice'),
+    ('low_24h', 'lowPrice'),
+    ('volume', 'volume'),
+)
+
+# 全市場掃描需要的 24hr ticker 欄位
+SCANNER_FIELDS = (
+    ('price', 'lastPrice'),
+    ('open', 'openPrice'),
+    ('high_24h', 'highPrice'),
+    ('low_24h', 'lowPrice'),
+    ('quote_volume', 'quoteVolume'),
+)
+
+# miniTicker 串流事件
+MINI_TICKER_FIELDS = (
+    ('price', 'c'),
+    ('open', 'o'),
+    ('high_24h', 'h'),
+    ('low_24h', 'l'),
+    ('volume', 'v'),
+    ('quote_volume', 'q'),
+)
+
+
+class SelectiveTickerDecoder:
+    """從 ticker 陣列的原始位元組中只取出指定交易對的指定欄位"""
+    
+    def __init__(self, fields=TICKER_FIELDS, symbols=None, symbol_key='symbol'):
+        self.fields = tuple(name for name, _ in fields)
+        self.json_keys = tuple(key for _, key in fields)
+        self.keys = [f'"{key}"'.encode('ascii') for key in self.json_keys]
+        self.symbol_key = symbol_key
+        # 交易對名稱可能含非 ASCII 字元，比對任何字串（含跳脫字元）
+        self.symbol_pattern = re.compile(b'"' + symbol_key.encode('ascii') + rb'"\s*:\s*"((?:[^"\\]|\\.)*)"')
+        self.tail = b''
+        self.set_symbols(symbols)
+    
+    def set_symbols(self, symbols):
+        """設定要解析的交易對，None 表示全部"""
+        self.symbols = None if symbols is None else set(symbols)
+    
+    def iter_rows(self, data, end=None):
+        """逐一產生 (交易對, 欄位值 tuple)，只處理 end 之前的內容"""
+        symbols = self.symbols
+        keys = self.keys
+        find = data.find
+        for match in self.symbol_pattern.finditer(data, 0, len(data) if end is None else end):
+            raw = match.group(1)
+            symbol = json.loads(b'"' + raw + b'"') if b'\\' in raw else raw.decode('utf-8')
+            if symbols is not None and symbol not in symbols:
+                continue
+            # ticker 物件沒有巢狀結構，前後最近的大括號就是物件邊界
+            start = data.rfind(b'{', 0, match.start())
+            stop = find(b'}', match.end())
+            values = []
+            for key in keys:
+                position = find(key, start, stop)
+                if position < 0:
+                    break
+                # 跳過冒號與可能的空白，數值都是字串
+                position = find(b'"', position + len(key), stop) + 1
+                values.append(float(data[position:find(b'"', position)]))
+            else:
+                yield symbol, tuple(values)
+    
+    def decode(self, payload):
+        """
+        解析完整的回應內容，回傳 [(交易對, 欄位值 tuple)]
+        要全部交易對時選擇性解碼沒有優勢，直接使用 json.loads
+        """
+        if self.symbols is not None:
+            return list(self.iter_rows(payload))
+        data = json.loads(payload)
+        if isinstance(data, dict):
+            data = [data]  # 單一交易對的回應是物件而不是陣列
+        keys = self.json_keys
+        return [
+            (item[self.symbol_key], tuple(float(item[key]) for key in keys))
+            for item in data if all(key in item for key in keys)
+        ]
+    
+    def feed(self, chunk):
+        """餵入一段資料，回傳這段資料中已完整的物件；不完整的部分留到下一段"""
+        data = self.tail + chunk if self.tail else chunk
+        cut = data.rfind(b'}') + 1
+        self.tail = data[cut:]
+        return list(self.iter_rows(data, cut)) if cut else []
+
+
+def benchmark(count=2000, watched=11, rounds=20):
+    """比較 json.loads + float() 與選擇性解碼的 CPU 時間與記憶體配置"""
+    import random
+    import time
+    import tracemalloc
+    
+    def ticker(symbol):
+        price = random.uniform(0.01, 50000)
+        return {
+            'symbol': symbol, 'priceChange': f"{price * 0.01:.8f}", 'priceChangePercent': "1.234",
+            'weightedAvgPrice': f"{price:.8f}", 'prevClosePrice': f"{price:.8f}",
+            'lastPrice': f"{price:.8f}", 'lastQty': "0.10000000", 'bidPrice': f"{price:.8f}",
+            'bidQty': "1.00000000", 'askPrice': f"{price:.8f}", 'askQty': "1.00000000",
+            'openPrice': f"{price:.8f}", 'highPrice': f"{price * 1.05:.8f}", 'lowPrice': f"{price * 0.95:.8f}",
+            'volume': "12345.67800000", 'quoteVolume': "98765432.10000000", 'openTime': 1700000000000,
+            'closeTime': 1700086400000, 'firstId': 1, 'lastId': 100000, 'count': 100000,
+        }
+    
+    symbols = [f"COIN{i}USDT" for i in range(count)]
+    payload = json.dumps([ticker(symbol) for symbol in symbols], separators=(',', ':')).encode('utf-8')
+    print(f"📦 回應大小 {len(payload) / 1024:,.0f} KB，{count} 個交易對")
+    
+    for wanted in (set(random.sample(symbols, watched)), None):
+        decoder = SelectiveTickerDecoder(symbols=wanted)
+        
+        def with_json():
+            return [
+                (data['symbol'], tuple(float(data[key]) for _, key in TICKER_FIELDS))
+                for data in json.loads(payload) if wanted is None or data['symbol'] in wanted
+            ]
+        
+        def with_decoder():
+            return decoder.decode(payload)
+        
+        assert sorted(with_json()) == sorted(with_decoder())
+        print(f"🔍 解析 {len(wanted) if wanted else count} 個交易對")
+        for name, decode in (('json.loads', with_json), ('選擇性解碼', with_decoder)):
+            start = time.process_time()
+            for _ in range(rounds):
+                decode()
+            cpu_ms = (time.process_time() - start) / rounds * 1000
+            tracemalloc.start()
+            decode()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(f"   {name:<8} CPU {cpu_ms:>7.2f} ms | 記憶體配置峰值 {peak / 1024:>8,.0f} KB")
+
+if __name__ == "__main__":
+    import sys
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)